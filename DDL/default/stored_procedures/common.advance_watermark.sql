@@ -0,0 +1,21 @@
+-- Record the highest loaded value of p_fields for a table. p_value is a JSON
+-- array with one element per field (ISO strings for dates and timestamps);
+-- the stored watermark only ever moves forward unless p_force is set.
+CREATE OR REPLACE PROCEDURE common.advance_watermark(
+    p_schema_name  text,
+    p_table_name   text,
+    p_fields       text[],
+    p_value        jsonb,
+    p_force        boolean DEFAULT FALSE
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO common."Watermarks" AS w ("SCHEMA_NAME", "TABLE_NAME", "FIELDS", "VALUE")
+    VALUES (p_schema_name, p_table_name, p_fields, p_value)
+    ON CONFLICT ("SCHEMA_NAME", "TABLE_NAME", "FIELDS") DO UPDATE
+    SET "VALUE" = EXCLUDED."VALUE",
+        "DATE_MODIFIED" = now()
+    WHERE p_force OR w."VALUE" < EXCLUDED."VALUE";
+END;
+$$;
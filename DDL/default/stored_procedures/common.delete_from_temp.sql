@@ -0,0 +1,26 @@
+-- Delete the rows of a target table whose keys are staged in a session temp
+-- table, in one set-based DELETE ... USING; returns the number of rows deleted
+CREATE OR REPLACE PROCEDURE common.delete_from_temp(
+    p_temp_table   text,
+    p_schema_name  text,
+    p_table_name   text,
+    p_keys         text[],
+    INOUT p_deleted bigint DEFAULT 0
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_match text;
+BEGIN
+    SELECT string_agg(format('t.%1$I = s.%1$I', u.col), ' AND ' ORDER BY u.ord)
+      INTO v_match
+      FROM unnest(p_keys) WITH ORDINALITY AS u(col, ord);
+
+    EXECUTE format(
+        'DELETE FROM %I.%I AS t USING %I AS s WHERE %s',
+        p_schema_name, p_table_name, p_temp_table, v_match
+    );
+
+    GET DIAGNOSTICS p_deleted = ROW_COUNT;
+END;
+$$;
@@ -0,0 +1,26 @@
+-- Move a staged batch from a session temp table into its target table
+-- in one set-based INSERT ... SELECT; returns the number of rows moved
+CREATE OR REPLACE PROCEDURE common.insert_from_temp(
+    p_temp_table   text,
+    p_schema_name  text,
+    p_table_name   text,
+    p_columns      text[],
+    INOUT p_inserted bigint DEFAULT 0
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_cols text;
+BEGIN
+    SELECT string_agg(format('%I', u.col), ', ' ORDER BY u.ord)
+      INTO v_cols
+      FROM unnest(p_columns) WITH ORDINALITY AS u(col, ord);
+
+    EXECUTE format(
+        'INSERT INTO %I.%I (%s) SELECT %s FROM %I',
+        p_schema_name, p_table_name, v_cols, v_cols, p_temp_table
+    );
+
+    GET DIAGNOSTICS p_inserted = ROW_COUNT;
+END;
+$$;
@@ -0,0 +1,401 @@
+-- Range partitioning managed by the loader.
+-- A table declared PARTITION BY RANGE (<column>) is registered once with
+-- common.register_range_partitions; partitions are then created on demand by
+-- common.ensure_partitions (the loader calls it before staging rows whose
+-- partition doesn't exist yet) and retired with common.detach_partitions.
+--
+-- STEP is a date_trunc unit ('day', 'week', 'month', 'quarter', 'year') for
+-- date/timestamp keys, or a positive integer block size for integer keys.
+-- Partitions are named <table>_p<lower bound>, e.g. Orders_p199607, Order_Details_p10000.
+--
+-- Unique keys of a partitioned table must include its partition column. When a row's
+-- own key doesn't (Orders: OrderID, partitioned by OrderDate) it is registered as
+-- KEY_COLUMNS, and keyed loads first move rows whose partition value changed
+-- (common.move_rekeyed_from_temp) so that the key stays unique.
+--
+-- A table that existed before it was partitioned is migrated by its DDL file:
+-- common.set_aside_unpartitioned before the CREATE TABLE ... PARTITION BY and
+-- common.copy_unpartitioned after registering it.
+
+-- lives with the procedures that read it, so tables registering themselves find it
+CREATE TABLE IF NOT EXISTS common."PartitionSchemes"
+(
+    "SCHEMA_NAME" character varying(255) NOT NULL,
+    "TABLE_NAME" character varying(255) NOT NULL,
+    "COLUMN_NAME" character varying(255) NOT NULL,
+    "STEP" character varying(20) NOT NULL,
+    "PREMAKE" integer NOT NULL DEFAULT 0,
+    "KEY_COLUMNS" character varying(255)[],
+    "DATE_MODIFIED" timestamp with time zone NOT NULL DEFAULT now(),
+    CONSTRAINT "PartitionSchemes_pkey" PRIMARY KEY ("SCHEMA_NAME", "TABLE_NAME")
+);
+
+ALTER TABLE common."PartitionSchemes" ADD COLUMN IF NOT EXISTS "KEY_COLUMNS" character varying(255)[];
+
+-- Bounds and name suffix of the partition holding p_value
+CREATE OR REPLACE FUNCTION common.range_partition_for(
+    p_step   text,
+    p_value  text,
+    OUT lower_bound text,
+    OUT upper_bound text,
+    OUT suffix      text
+)
+LANGUAGE plpgsql IMMUTABLE
+AS $$
+DECLARE
+    v_size  numeric;
+    v_lower timestamp;
+BEGIN
+    IF p_step ~ '^[0-9]+$' THEN
+        v_size := p_step::numeric;
+        lower_bound := (floor(p_value::numeric / v_size) * v_size)::text;
+        upper_bound := (lower_bound::numeric + v_size)::text;
+        suffix := replace(lower_bound, '-', 'n');
+        RETURN;
+    END IF;
+
+    v_lower := date_trunc(p_step, p_value::timestamp);
+    lower_bound := v_lower::text;
+    -- 'quarter' is a date_trunc unit but not an interval one
+    upper_bound := (v_lower + CASE p_step WHEN 'quarter' THEN '3 months' ELSE '1 ' || p_step END::interval)::text;
+    suffix := to_char(v_lower, CASE p_step
+        WHEN 'year' THEN 'YYYY'
+        WHEN 'day' THEN 'YYYYMMDD'
+        WHEN 'week' THEN 'YYYYMMDD'
+        ELSE 'YYYYMM'
+    END);
+END;
+$$;
+
+-- Partitions of a table with their bounds as text (MINVALUE/MAXVALUE as is, DEFAULT as NULLs)
+CREATE OR REPLACE FUNCTION common.range_partitions(
+    p_schema_name text,
+    p_table_name  text
+)
+RETURNS TABLE (partition_name text, lower_bound text, upper_bound text)
+LANGUAGE sql STABLE
+AS $$
+    SELECT c.relname::text,
+           b[1],
+           b[2]
+      FROM pg_inherits i
+      JOIN pg_class c ON c.oid = i.inhrelid
+      JOIN pg_class p ON p.oid = i.inhparent
+      JOIN pg_namespace n ON n.oid = p.relnamespace
+      LEFT JOIN LATERAL regexp_match(
+          pg_get_expr(c.relpartbound, c.oid),
+          'FROM \(''?([^'')]*)''?\) TO \(''?([^'')]*)''?\)'
+      ) AS b ON true
+     WHERE n.nspname = p_schema_name AND p.relname = p_table_name
+     ORDER BY c.relname;
+$$;
+
+-- Create every missing partition between the ones holding p_low and p_high,
+-- plus the scheme's PREMAKE partitions after that; returns how many were created
+CREATE OR REPLACE PROCEDURE common.ensure_partitions(
+    p_schema_name  text,
+    p_table_name   text,
+    p_low          text,
+    p_high         text,
+    INOUT p_created integer DEFAULT 0
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_step    text;
+    v_premake integer;
+    v_part    record;
+    v_name    text;
+    v_left    integer;
+BEGIN
+    p_created := 0;
+
+    SELECT "STEP", "PREMAKE" INTO v_step, v_premake
+      FROM common."PartitionSchemes"
+     WHERE "SCHEMA_NAME" = p_schema_name AND "TABLE_NAME" = p_table_name;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION '%.% has no partition scheme (see common.register_range_partitions)', p_schema_name, p_table_name;
+    END IF;
+
+    -- concurrent loads of one table create its partitions one at a time
+    PERFORM pg_advisory_xact_lock(hashtext(format('%I.%I', p_schema_name, p_table_name)));
+
+    v_part := common.range_partition_for(v_step, p_low);
+    v_left := v_premake;
+    LOOP
+        v_name := p_table_name || '_p' || v_part.suffix;
+        IF to_regclass(format('%I.%I', p_schema_name, v_name)) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I.%I PARTITION OF %I.%I FOR VALUES FROM (%L) TO (%L)',
+                p_schema_name, v_name, p_schema_name, p_table_name, v_part.lower_bound, v_part.upper_bound
+            );
+            p_created := p_created + 1;
+        END IF;
+
+        IF v_step ~ '^[0-9]+$' THEN
+            EXIT WHEN v_part.upper_bound::numeric > p_high::numeric AND v_left <= 0;
+            IF v_part.upper_bound::numeric > p_high::numeric THEN v_left := v_left - 1; END IF;
+        ELSE
+            EXIT WHEN v_part.upper_bound::timestamp > p_high::timestamp AND v_left <= 0;
+            IF v_part.upper_bound::timestamp > p_high::timestamp THEN v_left := v_left - 1; END IF;
+        END IF;
+        v_part := common.range_partition_for(v_step, v_part.upper_bound);
+    END LOOP;
+END;
+$$;
+
+-- superseded by the signature with p_key_columns below
+DROP PROCEDURE IF EXISTS common.register_range_partitions(text, text, text, text, integer, text, text);
+
+-- Record the partition scheme of a PARTITION BY RANGE table and create the partitions
+-- from p_from to p_to. p_key_columns is the row key when it leaves out p_column_name.
+CREATE OR REPLACE PROCEDURE common.register_range_partitions(
+    p_schema_name  text,
+    p_table_name   text,
+    p_column_name  text,
+    p_step         text,
+    p_premake      integer DEFAULT 0,
+    p_from         text DEFAULT NULL,
+    p_to           text DEFAULT NULL,
+    p_key_columns  text[] DEFAULT NULL
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_created integer;
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1
+          FROM pg_partitioned_table pt
+          JOIN pg_class c ON c.oid = pt.partrelid
+          JOIN pg_namespace n ON n.oid = c.relnamespace
+         WHERE n.nspname = p_schema_name AND c.relname = p_table_name
+    ) THEN
+        RAISE EXCEPTION '%.% is not a partitioned table', p_schema_name, p_table_name
+            USING HINT = 'Migrate it with common.set_aside_unpartitioned and common.copy_unpartitioned.';
+    END IF;
+    IF p_column_name = ANY (p_key_columns) THEN
+        RAISE EXCEPTION 'p_key_columns lists the partition column %; leave p_key_columns NULL', p_column_name;
+    END IF;
+
+    INSERT INTO common."PartitionSchemes" ("SCHEMA_NAME", "TABLE_NAME", "COLUMN_NAME", "STEP", "PREMAKE", "KEY_COLUMNS")
+    VALUES (p_schema_name, p_table_name, p_column_name, p_step, p_premake, p_key_columns)
+    ON CONFLICT ("SCHEMA_NAME", "TABLE_NAME") DO UPDATE
+    SET "COLUMN_NAME" = EXCLUDED."COLUMN_NAME",
+        "STEP" = EXCLUDED."STEP",
+        "PREMAKE" = EXCLUDED."PREMAKE",
+        "KEY_COLUMNS" = EXCLUDED."KEY_COLUMNS",
+        "DATE_MODIFIED" = now();
+
+    IF p_from IS NOT NULL THEN
+        CALL common.ensure_partitions(p_schema_name, p_table_name, p_from, COALESCE(p_to, p_from), v_created);
+    END IF;
+END;
+$$;
+
+-- Detach (not drop) the partitions whose upper bound is at or before p_before;
+-- with p_archive_schema they are moved there, keeping their data queryable,
+-- otherwise renamed to <partition>_detached_<timestamp> so that ensure_partitions
+-- can create the range again should rows for it arrive later
+CREATE OR REPLACE PROCEDURE common.detach_partitions(
+    p_schema_name     text,
+    p_table_name      text,
+    p_before          text,
+    p_archive_schema  text DEFAULT NULL,
+    INOUT p_detached  integer DEFAULT 0
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_step text;
+    v_part record;
+    v_name text;
+BEGIN
+    p_detached := 0;
+
+    SELECT "STEP" INTO v_step
+      FROM common."PartitionSchemes"
+     WHERE "SCHEMA_NAME" = p_schema_name AND "TABLE_NAME" = p_table_name;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION '%.% has no partition scheme (see common.register_range_partitions)', p_schema_name, p_table_name;
+    END IF;
+
+    FOR v_part IN
+        SELECT * FROM common.range_partitions(p_schema_name, p_table_name)
+         WHERE upper_bound IS NOT NULL AND upper_bound NOT IN ('MINVALUE', 'MAXVALUE')
+    LOOP
+        IF (v_step ~ '^[0-9]+$' AND v_part.upper_bound::numeric <= p_before::numeric)
+           OR (v_step !~ '^[0-9]+$' AND v_part.upper_bound::timestamp <= p_before::timestamp) THEN
+            EXECUTE format('ALTER TABLE %I.%I DETACH PARTITION %I.%I',
+                p_schema_name, p_table_name, p_schema_name, v_part.partition_name);
+            IF p_archive_schema IS NOT NULL THEN
+                EXECUTE format('CREATE SCHEMA IF NOT EXISTS %I', p_archive_schema);
+                EXECUTE format('ALTER TABLE %I.%I SET SCHEMA %I',
+                    p_schema_name, v_part.partition_name, p_archive_schema);
+            ELSE
+                v_name := v_part.partition_name || '_detached_' || to_char(clock_timestamp(), 'YYYYMMDDHH24MISS');
+                EXECUTE format('ALTER TABLE %I.%I RENAME TO %I',
+                    p_schema_name, v_part.partition_name, v_name);
+                RAISE NOTICE 'Detached %.% as %.%', p_schema_name, v_part.partition_name, p_schema_name, v_name;
+            END IF;
+            p_detached := p_detached + 1;
+        END IF;
+    END LOOP;
+END;
+$$;
+
+-- Rewrite the rows of schema.table whose KEY_COLUMNS match a row of the staged batch
+-- but whose partition column differs from it (e.g. a corrected OrderDate), through the
+-- parent so that they move to their new partition; the loader's upsert then finds
+-- them in place instead of inserting a second row. Returns how many were moved.
+CREATE OR REPLACE PROCEDURE common.move_rekeyed_from_temp(
+    p_temp_table   text,
+    p_schema_name  text,
+    p_table_name   text,
+    p_columns      text[],
+    INOUT p_moved  bigint DEFAULT 0
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_column text;
+    v_keys   text[];
+    v_set    text;
+    v_match  text;
+BEGIN
+    p_moved := 0;
+
+    SELECT "COLUMN_NAME", "KEY_COLUMNS" INTO v_column, v_keys
+      FROM common."PartitionSchemes"
+     WHERE "SCHEMA_NAME" = p_schema_name AND "TABLE_NAME" = p_table_name;
+    IF v_keys IS NULL THEN
+        RETURN;
+    END IF;
+
+    SELECT string_agg(format('%1$I = s.%1$I', u.col), ', ' ORDER BY u.ord)
+      INTO v_set
+      FROM unnest(p_columns) WITH ORDINALITY AS u(col, ord)
+     WHERE u.col <> ALL (v_keys);
+
+    SELECT string_agg(format('t.%1$I = s.%1$I', u.col), ' AND ' ORDER BY u.ord)
+      INTO v_match
+      FROM unnest(v_keys) WITH ORDINALITY AS u(col, ord);
+
+    EXECUTE format(
+        'UPDATE %I.%I AS t SET %s FROM %I AS s WHERE %s AND t.%I IS DISTINCT FROM s.%I',
+        p_schema_name, p_table_name, v_set, p_temp_table, v_match, v_column, v_column
+    );
+    GET DIAGNOSTICS p_moved = ROW_COUNT;
+END;
+$$;
+
+-- Rename a plain table, its indexes and its serial sequences to <name>_unpartitioned,
+-- freeing the names for the partitioned table its DDL file creates next; no-op if the
+-- table doesn't exist or is partitioned already
+CREATE OR REPLACE PROCEDURE common.set_aside_unpartitioned(
+    p_schema_name  text,
+    p_table_name   text
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_oid oid;
+    v_rel record;
+BEGIN
+    SELECT c.oid INTO v_oid
+      FROM pg_class c
+      JOIN pg_namespace n ON n.oid = c.relnamespace
+     WHERE n.nspname = p_schema_name AND c.relname = p_table_name AND c.relkind = 'r';
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+    IF to_regclass(format('%I.%I', p_schema_name, p_table_name || '_unpartitioned')) IS NOT NULL THEN
+        RAISE EXCEPTION '%.% already exists from an unfinished migration', p_schema_name, p_table_name || '_unpartitioned';
+    END IF;
+
+    FOR v_rel IN
+        SELECT c.relname, c.relkind
+          FROM pg_class c
+         WHERE c.oid IN (SELECT indexrelid FROM pg_index WHERE indrelid = v_oid)
+            OR (c.relkind = 'S' AND c.oid IN (SELECT objid FROM pg_depend
+                                              WHERE refobjid = v_oid AND classid = 'pg_class'::regclass AND deptype = 'a'))
+    LOOP
+        EXECUTE format('ALTER %s %I.%I RENAME TO %I',
+            CASE v_rel.relkind WHEN 'S' THEN 'SEQUENCE' ELSE 'INDEX' END,
+            p_schema_name, v_rel.relname, v_rel.relname || '_unpartitioned');
+    END LOOP;
+
+    EXECUTE format('ALTER TABLE %I.%I RENAME TO %I', p_schema_name, p_table_name, p_table_name || '_unpartitioned');
+    RAISE NOTICE 'Set aside %.% to be copied into its partitioned replacement', p_schema_name, p_table_name;
+END;
+$$;
+
+-- Copy the rows of <table>_unpartitioned (see set_aside_unpartitioned) into the registered
+-- partitioned table, creating the partitions they need, continue its serial columns after
+-- the copied values and drop it; returns how many rows were copied
+CREATE OR REPLACE PROCEDURE common.copy_unpartitioned(
+    p_schema_name  text,
+    p_table_name   text,
+    INOUT p_copied bigint DEFAULT 0
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_old     text := p_table_name || '_unpartitioned';
+    v_column  text;
+    v_low     text;
+    v_high    text;
+    v_cols    text;
+    v_created integer;
+    v_serial  record;
+BEGIN
+    p_copied := 0;
+    IF to_regclass(format('%I.%I', p_schema_name, v_old)) IS NULL THEN
+        RETURN;
+    END IF;
+
+    SELECT "COLUMN_NAME" INTO v_column
+      FROM common."PartitionSchemes"
+     WHERE "SCHEMA_NAME" = p_schema_name AND "TABLE_NAME" = p_table_name;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION '%.% has no partition scheme (see common.register_range_partitions)', p_schema_name, p_table_name;
+    END IF;
+
+    EXECUTE format('SELECT min(%1$I)::text, max(%1$I)::text FROM %2$I.%3$I', v_column, p_schema_name, v_old)
+       INTO v_low, v_high;
+    IF v_low IS NOT NULL THEN
+        CALL common.ensure_partitions(p_schema_name, p_table_name, v_low, v_high, v_created);
+    END IF;
+
+    -- the columns both tables have
+    SELECT string_agg(format('%I', a.attname), ', ' ORDER BY a.attnum)
+      INTO v_cols
+      FROM pg_attribute a
+     WHERE a.attrelid = format('%I.%I', p_schema_name, p_table_name)::regclass
+       AND a.attnum > 0 AND NOT a.attisdropped
+       AND EXISTS (
+           SELECT 1 FROM pg_attribute o
+            WHERE o.attrelid = format('%I.%I', p_schema_name, v_old)::regclass
+              AND o.attname = a.attname AND o.attnum > 0 AND NOT o.attisdropped
+       );
+
+    EXECUTE format('INSERT INTO %I.%I (%s) SELECT %s FROM %I.%I',
+        p_schema_name, p_table_name, v_cols, v_cols, p_schema_name, v_old);
+    GET DIAGNOSTICS p_copied = ROW_COUNT;
+
+    FOR v_serial IN
+        SELECT a.attname, pg_get_serial_sequence(format('%I.%I', p_schema_name, p_table_name), a.attname) AS seq
+          FROM pg_attribute a
+         WHERE a.attrelid = format('%I.%I', p_schema_name, p_table_name)::regclass
+           AND a.attnum > 0 AND NOT a.attisdropped
+    LOOP
+        IF v_serial.seq IS NOT NULL THEN
+            EXECUTE format('SELECT setval(%L, COALESCE((SELECT max(%I) FROM %I.%I), 0) + 1, false)',
+                v_serial.seq, v_serial.attname, p_schema_name, p_table_name);
+        END IF;
+    END LOOP;
+
+    EXECUTE format('DROP TABLE %I.%I', p_schema_name, v_old);
+    RAISE NOTICE 'Copied % row(s) of %.% into partitioned %.%', p_copied, p_schema_name, v_old, p_schema_name, p_table_name;
+END;
+$$;
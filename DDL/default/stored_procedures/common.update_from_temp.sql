@@ -0,0 +1,44 @@
+-- Apply a staged batch from a session temp table to existing rows of its target
+-- table in one set-based UPDATE ... FROM, matched on p_keys. Rows whose values
+-- are unchanged are skipped; returns the number of rows actually updated.
+CREATE OR REPLACE PROCEDURE common.update_from_temp(
+    p_temp_table   text,
+    p_schema_name  text,
+    p_table_name   text,
+    p_columns      text[],
+    p_keys         text[],
+    INOUT p_updated bigint DEFAULT 0
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_set    text;
+    v_target text;
+    v_staged text;
+    v_match  text;
+BEGIN
+    SELECT string_agg(format('t.%1$I = s.%1$I', u.col), ' AND ' ORDER BY u.ord)
+      INTO v_match
+      FROM unnest(p_keys) WITH ORDINALITY AS u(col, ord);
+
+    SELECT string_agg(format('%1$I = s.%1$I', u.col), ', ' ORDER BY u.ord),
+           string_agg(format('t.%I', u.col), ', ' ORDER BY u.ord),
+           string_agg(format('s.%I', u.col), ', ' ORDER BY u.ord)
+      INTO v_set, v_target, v_staged
+      FROM unnest(p_columns) WITH ORDINALITY AS u(col, ord)
+     WHERE u.col <> ALL (p_keys);
+
+    IF v_set IS NULL THEN
+        -- nothing but key columns: there is nothing to update
+        p_updated := 0;
+        RETURN;
+    END IF;
+
+    EXECUTE format(
+        'UPDATE %I.%I AS t SET %s FROM %I AS s WHERE %s AND ROW(%s) IS DISTINCT FROM ROW(%s)',
+        p_schema_name, p_table_name, v_set, p_temp_table, v_match, v_target, v_staged
+    );
+
+    GET DIAGNOSTICS p_updated = ROW_COUNT;
+END;
+$$;
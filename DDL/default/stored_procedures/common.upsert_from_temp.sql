@@ -0,0 +1,86 @@
+-- Merge a staged batch from a session temp table into its target table with
+-- one INSERT ... ON CONFLICT (p_keys) DO UPDATE. Rows whose values are unchanged
+-- are left alone (no new row version, DATE_MODIFIED untouched).
+-- p_keys must match a unique index on the target; the batch must not repeat a key.
+-- A partitioned target (rows spanning several partitions) can't report xmax, so
+-- there the keys already present are counted first.
+CREATE OR REPLACE PROCEDURE common.upsert_from_temp(
+    p_temp_table   text,
+    p_schema_name  text,
+    p_table_name   text,
+    p_columns      text[],
+    p_keys         text[],
+    INOUT p_inserted bigint DEFAULT 0,
+    INOUT p_updated  bigint DEFAULT 0
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_cols     text;
+    v_keys     text;
+    v_set      text;
+    v_target   text;
+    v_excluded text;
+    v_action   text;
+    v_match    text;
+    v_rows     bigint;
+BEGIN
+    SELECT string_agg(format('%I', u.col), ', ' ORDER BY u.ord)
+      INTO v_cols
+      FROM unnest(p_columns) WITH ORDINALITY AS u(col, ord);
+
+    SELECT string_agg(format('%I', u.col), ', ' ORDER BY u.ord)
+      INTO v_keys
+      FROM unnest(p_keys) WITH ORDINALITY AS u(col, ord);
+
+    SELECT string_agg(format('%1$I = EXCLUDED.%1$I', u.col), ', ' ORDER BY u.ord),
+           string_agg(format('t.%I', u.col), ', ' ORDER BY u.ord),
+           string_agg(format('EXCLUDED.%I', u.col), ', ' ORDER BY u.ord)
+      INTO v_set, v_target, v_excluded
+      FROM unnest(p_columns) WITH ORDINALITY AS u(col, ord)
+     WHERE u.col <> ALL (p_keys);
+
+    IF v_set IS NULL THEN
+        -- nothing but key columns: existing rows cannot change
+        v_action := 'DO NOTHING';
+    ELSE
+        v_action := format(
+            'DO UPDATE SET %s WHERE ROW(%s) IS DISTINCT FROM ROW(%s)',
+            v_set, v_target, v_excluded
+        );
+    END IF;
+
+    IF (SELECT c.relkind FROM pg_class c
+         WHERE c.oid = format('%I.%I', p_schema_name, p_table_name)::regclass) = 'p' THEN
+        SELECT string_agg(format('t.%1$I = s.%1$I', u.col), ' AND ' ORDER BY u.ord)
+          INTO v_match
+          FROM unnest(p_keys) WITH ORDINALITY AS u(col, ord);
+
+        EXECUTE format(
+            'SELECT count(*) FROM %I AS s WHERE NOT EXISTS (SELECT 1 FROM %I.%I AS t WHERE %s)',
+            p_temp_table, p_schema_name, p_table_name, v_match
+        )
+        INTO p_inserted;
+
+        EXECUTE format(
+            'INSERT INTO %I.%I AS t (%s) SELECT %s FROM %I ON CONFLICT (%s) %s',
+            p_schema_name, p_table_name, v_cols, v_cols, p_temp_table, v_keys, v_action
+        );
+        GET DIAGNOSTICS v_rows = ROW_COUNT;
+        p_updated := v_rows - p_inserted;
+        RETURN;
+    END IF;
+
+    -- xmax = 0 only on freshly inserted row versions
+    EXECUTE format(
+        'WITH merged AS (
+             INSERT INTO %I.%I AS t (%s) SELECT %s FROM %I
+             ON CONFLICT (%s) %s
+             RETURNING (xmax = 0) AS inserted
+         )
+         SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged',
+        p_schema_name, p_table_name, v_cols, v_cols, p_temp_table, v_keys, v_action
+    )
+    INTO p_inserted, p_updated;
+END;
+$$;
@@ -0,0 +1,13 @@
+CREATE TABLE IF NOT EXISTS common."DdlLedger"
+(
+    "FILE_PATH" character varying(1024) NOT NULL,
+    "CHECKSUM" character(64) NOT NULL,
+    "APPLIED_AT" timestamp with time zone NOT NULL DEFAULT now(),
+    "DURATION_MS" bigint,
+    CONSTRAINT "DdlLedger_pkey" PRIMARY KEY ("FILE_PATH")
+)
+
+TABLESPACE pg_default;
+
+ALTER TABLE IF EXISTS common."DdlLedger"
+    OWNER to postgres;
@@ -7,7 +7,7 @@ CREATE TABLE IF NOT EXISTS common."IngestionLog"
     "TABLE_NAME" character varying(255) NOT NULL,
     "StartTime" timestamp with time zone NOT NULL,
     "EndTime" timestamp with time zone NOT NULL,
-    "TotalMillis" bigint GENERATED ALWAYS AS ( EXTRACT(EPOCH FROM ("EndTime" - "StartTime")) * 1000)::bigint),
+    "TotalMillis" bigint GENERATED ALWAYS AS ((EXTRACT(EPOCH FROM ("EndTime" - "StartTime")) * 1000)::bigint) STORED,
     "ImportCount" bigint NOT NULL,
     "UpdateCount" bigint NOT NULL,
     "Status" BOOLEAN NOT NULL,
@@ -18,5 +18,19 @@ CREATE TABLE IF NOT EXISTS common."IngestionLog"
 
 TABLESPACE pg_default;
 
-ALTER TABLE IF EXISTS public."IngestionLog"
-    OWNER to postgres;
\ No newline at end of file
+ALTER TABLE IF EXISTS common."IngestionLog"
+    OWNER to postgres;
+
+-- stage metrics (postgres.metrics.enabled), NULL for rows logged without them
+ALTER TABLE common."IngestionLog" ADD COLUMN IF NOT EXISTS "ExtractMillis" bigint;
+ALTER TABLE common."IngestionLog" ADD COLUMN IF NOT EXISTS "TransformMillis" bigint;
+ALTER TABLE common."IngestionLog" ADD COLUMN IF NOT EXISTS "LoadMillis" bigint;
+ALTER TABLE common."IngestionLog" ADD COLUMN IF NOT EXISTS "CommitMillis" bigint;
+ALTER TABLE common."IngestionLog" ADD COLUMN IF NOT EXISTS "BytesIn" bigint;
+ALTER TABLE common."IngestionLog" ADD COLUMN IF NOT EXISTS "Batches" integer;
+ALTER TABLE common."IngestionLog" ADD COLUMN IF NOT EXISTS "PeakRssBytes" bigint;
+ALTER TABLE common."IngestionLog" ADD COLUMN IF NOT EXISTS "RowsPerSecond" numeric(14,1)
+    GENERATED ALWAYS AS (
+        ("ImportCount" + "UpdateCount") * 1000.0
+        / NULLIF(EXTRACT(EPOCH FROM ("EndTime" - "StartTime")) * 1000, 0)
+    ) STORED;
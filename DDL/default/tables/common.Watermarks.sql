@@ -0,0 +1,14 @@
+CREATE TABLE IF NOT EXISTS common."Watermarks"
+(
+    "SCHEMA_NAME" character varying(255) NOT NULL,
+    "TABLE_NAME" character varying(255) NOT NULL,
+    "FIELDS" text[] NOT NULL,
+    "VALUE" jsonb NOT NULL,
+    "DATE_MODIFIED" timestamp with time zone NOT NULL DEFAULT now(),
+    CONSTRAINT "Watermarks_pkey" PRIMARY KEY ("SCHEMA_NAME", "TABLE_NAME", "FIELDS")
+)
+
+TABLESPACE pg_default;
+
+ALTER TABLE IF EXISTS common."Watermarks"
+    OWNER to postgres;
@@ -7,7 +7,17 @@ CREATE TABLE IF NOT EXISTS northwind."CustomerDemographics"
     "CustomerTypeID" VARCHAR(10) NOT NULL,
     "CustomerDesc" TEXT
 );
-CREATE TRIGGER trg_touch_date_modified_cust_demo
+
+-- natural key (target of upserts)
+CREATE UNIQUE INDEX IF NOT EXISTS ux_customerdemographics_customertypeid
+ON northwind."CustomerDemographics" ("CustomerTypeID");
+
+-- change detection: hash of the business columns, written by the loader
+ALTER TABLE northwind."CustomerDemographics" ADD COLUMN IF NOT EXISTS "ROW_HASH" bigint;
+CREATE INDEX IF NOT EXISTS ix_customerdemographics_row_hash
+ON northwind."CustomerDemographics" ("CustomerTypeID") INCLUDE ("ROW_HASH");
+
+CREATE OR REPLACE TRIGGER trg_touch_date_modified_cust_demo
 BEFORE UPDATE ON northwind."CustomerDemographics"
 FOR EACH ROW
 EXECUTE FUNCTION common.touch_date_modified();
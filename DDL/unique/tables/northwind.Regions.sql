@@ -9,7 +9,16 @@ CREATE TABLE IF NOT EXISTS northwind."Regions"
     "RegionDescription" VARCHAR(50) NOT NULL
 );
 
-CREATE TRIGGER trg_touch_date_modified_regions
+-- natural key (target of upserts)
+CREATE UNIQUE INDEX IF NOT EXISTS ux_regions_regionid
+ON northwind."Regions" ("RegionID");
+
+-- change detection: hash of the business columns, written by the loader
+ALTER TABLE northwind."Regions" ADD COLUMN IF NOT EXISTS "ROW_HASH" bigint;
+CREATE INDEX IF NOT EXISTS ix_regions_row_hash
+ON northwind."Regions" ("RegionID") INCLUDE ("ROW_HASH");
+
+CREATE OR REPLACE TRIGGER trg_touch_date_modified_regions
 BEFORE UPDATE ON northwind."Regions"
 FOR EACH ROW
 EXECUTE FUNCTION common.touch_date_modified();
\ No newline at end of file
@@ -11,7 +11,16 @@ CREATE TABLE IF NOT EXISTS northwind."Categories"
     "Picture" BYTEA
 );
 
-CREATE TRIGGER trg_touch_date_modified_categories
+-- natural key (target of upserts)
+CREATE UNIQUE INDEX IF NOT EXISTS ux_categories_categoryid
+ON northwind."Categories" ("CategoryID");
+
+-- change detection: hash of the business columns, written by the loader
+ALTER TABLE northwind."Categories" ADD COLUMN IF NOT EXISTS "ROW_HASH" bigint;
+CREATE INDEX IF NOT EXISTS ix_categories_row_hash
+ON northwind."Categories" ("CategoryID") INCLUDE ("ROW_HASH");
+
+CREATE OR REPLACE TRIGGER trg_touch_date_modified_categories
 BEFORE UPDATE ON northwind."Categories"
 FOR EACH ROW
 EXECUTE FUNCTION common.touch_date_modified();
\ No newline at end of file
@@ -18,7 +18,16 @@ CREATE TABLE IF NOT EXISTS northwind."Customers"
     "Fax" VARCHAR(24)
 );
 
-CREATE TRIGGER trg_touch_date_modified_customers
+-- natural key (target of upserts)
+CREATE UNIQUE INDEX IF NOT EXISTS ux_customers_customerid
+ON northwind."Customers" ("CustomerID");
+
+-- change detection: hash of the business columns, written by the loader
+ALTER TABLE northwind."Customers" ADD COLUMN IF NOT EXISTS "ROW_HASH" bigint;
+CREATE INDEX IF NOT EXISTS ix_customers_row_hash
+ON northwind."Customers" ("CustomerID") INCLUDE ("ROW_HASH");
+
+CREATE OR REPLACE TRIGGER trg_touch_date_modified_customers
 BEFORE UPDATE ON northwind."Customers"
 FOR EACH ROW
 EXECUTE FUNCTION common.touch_date_modified();
\ No newline at end of file
@@ -24,7 +24,16 @@ CREATE TABLE IF NOT EXISTS northwind."Employees"
     "PhotoPath" VARCHAR(255)
 );
 
-CREATE TRIGGER trg_touch_date_modified_employees
+-- natural key (target of upserts)
+CREATE UNIQUE INDEX IF NOT EXISTS ux_employees_employeeid
+ON northwind."Employees" ("EmployeeID");
+
+-- change detection: hash of the business columns, written by the loader
+ALTER TABLE northwind."Employees" ADD COLUMN IF NOT EXISTS "ROW_HASH" bigint;
+CREATE INDEX IF NOT EXISTS ix_employees_row_hash
+ON northwind."Employees" ("EmployeeID") INCLUDE ("ROW_HASH");
+
+CREATE OR REPLACE TRIGGER trg_touch_date_modified_employees
 BEFORE UPDATE ON northwind."Employees"
 FOR EACH ROW
 EXECUTE FUNCTION common.touch_date_modified();
\ No newline at end of file
@@ -1,18 +1,32 @@
 -- create table northwind.order_details
+-- partitioned by blocks of 10000 OrderIDs, so the details of recent orders sit in one partition
+
+-- an unpartitioned Order_Details from before is renamed here, and copied in at the end of this file
+CALL common.set_aside_unpartitioned('northwind', 'Order_Details');
 
 CREATE TABLE IF NOT EXISTS northwind."Order_Details"
 (
     "DATE_IN" timestamp with time zone NOT NULL DEFAULT now(),
     "DATE_MODIFIED" timestamp with time zone NOT NULL DEFAULT now(),
-    "DW_ORDER_DETAILS_ID" SERIAL PRIMARY KEY,
+    "DW_ORDER_DETAILS_ID" SERIAL,
     "OrderID" INT NOT NULL,
     "ProductID" INT NOT NULL,
     "UnitPrice" NUMERIC(10,4) NOT NULL,
     "Quantity" INT NOT NULL,
-    "Discount" REAL NOT NULL
-);
+    "Discount" REAL NOT NULL,
+    -- unique keys of a partitioned table must include the partition key
+    PRIMARY KEY ("DW_ORDER_DETAILS_ID", "OrderID")
+) PARTITION BY RANGE ("OrderID");
+
+-- natural key (target of upserts)
+CREATE UNIQUE INDEX IF NOT EXISTS ux_order_details_orderid_productid
+ON northwind."Order_Details" ("OrderID", "ProductID");
 
-CREATE TRIGGER trg_touch_date_modified_order_details
+CALL common.register_range_partitions('northwind', 'Order_Details', 'OrderID', '10000', 1);
+
+CREATE OR REPLACE TRIGGER trg_touch_date_modified_order_details
 BEFORE UPDATE ON northwind."Order_Details"
 FOR EACH ROW
-EXECUTE FUNCTION common.touch_date_modified();
\ No newline at end of file
+EXECUTE FUNCTION common.touch_date_modified();
+
+CALL common.copy_unpartitioned('northwind', 'Order_Details', NULL);
\ No newline at end of file
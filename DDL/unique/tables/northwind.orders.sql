@@ -1,10 +1,15 @@
 -- create table northwind.orders
+-- partitioned by month of OrderDate, so loads and queries on recent orders touch
+-- one partition; the loader creates partitions as orders arrive (see common.partitioning)
+
+-- an unpartitioned Orders from before is renamed here, and copied in at the end of this file
+CALL common.set_aside_unpartitioned('northwind', 'Orders');
 
 CREATE TABLE IF NOT EXISTS northwind."Orders"
 (
     "DATE_IN" timestamp with time zone NOT NULL DEFAULT now(),
     "DATE_MODIFIED" timestamp with time zone NOT NULL DEFAULT now(),
-    "DW_ORDERS_ID" SERIAL PRIMARY KEY,
+    "DW_ORDERS_ID" SERIAL,
     "OrderID" INT NOT NULL,
     "CustomerID" VARCHAR(5) NOT NULL,
     "EmployeeID" INT NOT NULL,
@@ -18,10 +23,22 @@ CREATE TABLE IF NOT EXISTS northwind."Orders"
     "ShipCity" VARCHAR(15) NOT NULL,
     "ShipRegion" VARCHAR(15),
     "ShipPostalCode" VARCHAR(10),
-    "ShipCountry" VARCHAR(15) NOT NULL
-);
+    "ShipCountry" VARCHAR(15) NOT NULL,
+    -- unique keys of a partitioned table must include the partition key
+    PRIMARY KEY ("DW_ORDERS_ID", "OrderDate")
+) PARTITION BY RANGE ("OrderDate");
+
+-- natural key (target of upserts)
+CREATE UNIQUE INDEX IF NOT EXISTS ux_orders_orderid_orderdate
+ON northwind."Orders" ("OrderID", "OrderDate");
 
-CREATE TRIGGER trg_touch_date_modified_orders
+-- monthly partitions, three months made ahead of the latest order; an order's own key
+-- is OrderID, so a corrected OrderDate moves the order rather than duplicating it
+CALL common.register_range_partitions('northwind', 'Orders', 'OrderDate', 'month', 3, p_key_columns => ARRAY['OrderID']);
+
+CREATE OR REPLACE TRIGGER trg_touch_date_modified_orders
 BEFORE UPDATE ON northwind."Orders"
 FOR EACH ROW
-EXECUTE FUNCTION common.touch_date_modified();
\ No newline at end of file
+EXECUTE FUNCTION common.touch_date_modified();
+
+CALL common.copy_unpartitioned('northwind', 'Orders', NULL);
\ No newline at end of file
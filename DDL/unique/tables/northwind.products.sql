@@ -17,7 +17,16 @@ CREATE TABLE IF NOT EXISTS northwind."Products"
     "Discontinued" BOOLEAN NOT NULL DEFAULT FALSE
 );
 
-CREATE TRIGGER trg_touch_date_modified_products
+-- natural key (target of upserts)
+CREATE UNIQUE INDEX IF NOT EXISTS ux_products_productid
+ON northwind."Products" ("ProductID");
+
+-- change detection: hash of the business columns, written by the loader
+ALTER TABLE northwind."Products" ADD COLUMN IF NOT EXISTS "ROW_HASH" bigint;
+CREATE INDEX IF NOT EXISTS ix_products_row_hash
+ON northwind."Products" ("ProductID") INCLUDE ("ROW_HASH");
+
+CREATE OR REPLACE TRIGGER trg_touch_date_modified_products
 BEFORE UPDATE ON northwind."Products"
 FOR EACH ROW
 EXECUTE FUNCTION common.touch_date_modified();
\ No newline at end of file
@@ -9,7 +9,16 @@ CREATE TABLE IF NOT EXISTS northwind."Shippers"
     "Phone" VARCHAR(24)
 );
 
-CREATE TRIGGER trg_touch_date_modified_shippers
+-- natural key (target of upserts)
+CREATE UNIQUE INDEX IF NOT EXISTS ux_shippers_shipperid
+ON northwind."Shippers" ("ShipperID");
+
+-- change detection: hash of the business columns, written by the loader
+ALTER TABLE northwind."Shippers" ADD COLUMN IF NOT EXISTS "ROW_HASH" bigint;
+CREATE INDEX IF NOT EXISTS ix_shippers_row_hash
+ON northwind."Shippers" ("ShipperID") INCLUDE ("ROW_HASH");
+
+CREATE OR REPLACE TRIGGER trg_touch_date_modified_shippers
 BEFORE UPDATE ON northwind."Shippers"
 FOR EACH ROW
 EXECUTE FUNCTION common.touch_date_modified();
\ No newline at end of file
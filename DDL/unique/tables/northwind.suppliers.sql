@@ -17,7 +17,16 @@ CREATE TABLE IF NOT EXISTS northwind."Suppliers"
     "Fax" VARCHAR(24)
 );
 
-CREATE TRIGGER trg_touch_date_modified_suppliers
+-- natural key (target of upserts)
+CREATE UNIQUE INDEX IF NOT EXISTS ux_suppliers_supplierid
+ON northwind."Suppliers" ("SupplierID");
+
+-- change detection: hash of the business columns, written by the loader
+ALTER TABLE northwind."Suppliers" ADD COLUMN IF NOT EXISTS "ROW_HASH" bigint;
+CREATE INDEX IF NOT EXISTS ix_suppliers_row_hash
+ON northwind."Suppliers" ("SupplierID") INCLUDE ("ROW_HASH");
+
+CREATE OR REPLACE TRIGGER trg_touch_date_modified_suppliers
 BEFORE UPDATE ON northwind."Suppliers"
 FOR EACH ROW
 EXECUTE FUNCTION common.touch_date_modified();
\ No newline at end of file
@@ -8,7 +8,16 @@ CREATE TABLE IF NOT EXISTS northwind."Territories"
     "TerritoryDescription" VARCHAR(50) NOT NULL
 );
 
-CREATE TRIGGER trg_touch_date_modified_territories
+-- natural key (target of upserts)
+CREATE UNIQUE INDEX IF NOT EXISTS ux_territories_territoryid
+ON northwind."Territories" ("TerritoryID");
+
+-- change detection: hash of the business columns, written by the loader
+ALTER TABLE northwind."Territories" ADD COLUMN IF NOT EXISTS "ROW_HASH" bigint;
+CREATE INDEX IF NOT EXISTS ix_territories_row_hash
+ON northwind."Territories" ("TerritoryID") INCLUDE ("ROW_HASH");
+
+CREATE OR REPLACE TRIGGER trg_touch_date_modified_territories
 BEFORE UPDATE ON northwind."Territories"
 FOR EACH ROW
 EXECUTE FUNCTION common.touch_date_modified();
\ No newline at end of file
@@ -0,0 +1,163 @@
+"""
+Compare text (CSV) and binary COPY encoding on synthetic Orders / Order_Details batches.
+
+Reports rows/s and MB/s of the client-side encoders; with --load the encoded
+batches are also COPY'd into temp tables on the configured database so the
+server-side parse cost is included.
+
+    python benchmarks/bench_copy_formats.py --rows 500000 [--load]
+"""
+# prevent pycache creation
+import sys
+sys.dont_write_bytecode = True
+
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import time
+from collections import namedtuple
+from contextlib import nullcontext
+
+import numpy as np
+import pandas as pd
+from psycopg2 import sql
+
+from utilities import pg_binary_copy
+from utilities.postgres_wrapper import Postgres
+
+ColumnType = namedtuple("ColumnType", "column_name data_type numeric_precision numeric_scale")
+
+TABLES = {
+    "Order_Details": [
+        ColumnType("OrderID", "integer", None, None),
+        ColumnType("ProductID", "integer", None, None),
+        ColumnType("UnitPrice", "numeric", 10, 4),
+        ColumnType("Quantity", "integer", None, None),
+        ColumnType("Discount", "real", None, None),
+    ],
+    "Orders": [
+        ColumnType("OrderID", "integer", None, None),
+        ColumnType("CustomerID", "character varying", None, None),
+        ColumnType("EmployeeID", "integer", None, None),
+        ColumnType("OrderDate", "date", None, None),
+        ColumnType("RequiredDate", "date", None, None),
+        ColumnType("ShippedDate", "date", None, None),
+        ColumnType("ShipVia", "integer", None, None),
+        ColumnType("Freight", "numeric", 10, 2),
+        ColumnType("ShipName", "character varying", None, None),
+        ColumnType("ShipCity", "character varying", None, None),
+    ],
+}
+
+PG_TYPE_SQL = {"integer": "integer", "character varying": "varchar(40)", "date": "date", "real": "real"}
+
+
+def make_frame(table: str, n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    if table == "Order_Details":
+        return pd.DataFrame({
+            "OrderID": np.arange(10_248, 10_248 + n),
+            "ProductID": rng.integers(1, 78, n),
+            "UnitPrice": np.round(rng.uniform(2, 264, n), 4),
+            "Quantity": rng.integers(1, 120, n),
+            "Discount": rng.choice([0, 0.05, 0.1, 0.15, 0.2, 0.25], n).astype(np.float32),
+        })
+    order_date = pd.Timestamp("1996-07-04") + pd.to_timedelta(rng.integers(0, 670, n), unit="D")
+    shipped = (order_date + pd.to_timedelta(rng.integers(1, 30, n), unit="D")).to_series().reset_index(drop=True)
+    shipped[rng.random(n) < 0.03] = pd.NaT
+    return pd.DataFrame({
+        "OrderID": np.arange(10_248, 10_248 + n),
+        "CustomerID": rng.choice(["ALFKI", "ANATR", "ANTON", "BERGS", "VINET"], n),
+        "EmployeeID": rng.integers(1, 10, n),
+        "OrderDate": order_date,
+        "RequiredDate": order_date + pd.Timedelta(days=28),
+        "ShippedDate": shipped,
+        "ShipVia": rng.integers(1, 4, n),
+        "Freight": np.round(rng.uniform(0, 1000, n), 2),
+        "ShipName": rng.choice(["Vins et alcools Chevalier", "Toms Spezialitaten", "Hanari Carnes"], n),
+        "ShipCity": rng.choice(["Reims", "Munster", "Rio de Janeiro"], n),
+    })
+
+
+def bench(conn, table: str, data: pd.DataFrame, batch_size: int) -> list[dict]:
+    col_types = TABLES[table]
+    encoders = {
+        "text": Postgres._to_copy_buffer,
+        "binary": lambda b: pg_binary_copy.encode_frame(b, col_types),
+    }
+    results = []
+    for fmt, encode in encoders.items():
+        n_bytes = 0
+        encode_s = 0.0
+        load_s = 0.0
+
+        temp_table = f"bench_{table.lower()}_{fmt}"
+        copy_sql = None
+        if conn is not None:
+            cols = sql.SQL(", ").join(
+                sql.SQL("{} {}").format(
+                    sql.Identifier(c.column_name),
+                    sql.SQL(f"numeric({c.numeric_precision},{c.numeric_scale})" if c.data_type == "numeric"
+                            else PG_TYPE_SQL[c.data_type])
+                )
+                for c in col_types
+            )
+            with conn.cursor() as cur:
+                cur.execute(sql.SQL("CREATE TEMP TABLE {} ({})").format(sql.Identifier(temp_table), cols))
+            copy_sql = sql.SQL("COPY {} FROM STDIN WITH (FORMAT {})").format(
+                sql.Identifier(temp_table), sql.SQL("binary" if fmt == "binary" else "csv, NULL '\\N'")
+            )
+
+        for start in range(0, len(data), batch_size):
+            batch = data.iloc[start:start + batch_size]
+            t0 = time.perf_counter()
+            buf = encode(batch)
+            encode_s += time.perf_counter() - t0
+            n_bytes += len(buf.getvalue()) if hasattr(buf, "getvalue") else 0
+
+            if copy_sql is not None:
+                buf.seek(0)
+                t0 = time.perf_counter()
+                with conn.cursor() as cur:
+                    cur.copy_expert(copy_sql, buf)
+                load_s += time.perf_counter() - t0
+
+        row = {
+            "table": table,
+            "format": fmt,
+            "rows": len(data),
+            "bytes": n_bytes,
+            "encode_s": round(encode_s, 4),
+            "encode_rows_per_s": round(len(data) / encode_s),
+            "encode_mb_per_s": round(n_bytes / encode_s / 1e6, 1),
+        }
+        if conn is not None:
+            row.update({
+                "copy_s": round(load_s, 4),
+                "copy_rows_per_s": round(len(data) / load_s),
+                "total_rows_per_s": round(len(data) / (encode_s + load_s)),
+            })
+        results.append(row)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--load", action="store_true", help="also COPY into temp tables on the configured database")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    # temp tables are session-local, so hold one pooled connection for the whole run
+    with (Postgres().connection() if args.load else nullcontext()) as conn:
+        for table in TABLES:
+            results += bench(conn, table, make_frame(table, args.rows), args.batch_size)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(pd.DataFrame(results).to_string(index=False))
@@ -0,0 +1,380 @@
+"""
+End-to-end ETL benchmarks against a local OData stand-in and a throwaway PostgreSQL.
+
+The stand-in (benchmarks/odata_standin.py) runs in a child process with
+synthetic Northwind data at --scale x the real row counts; the warehouse is a
+temporary cluster built with build_database.py (benchmarks/pg_sandbox.py), or
+an existing database with --config. Scenarios:
+
+    full_reload   every table with truncate_reload into empty tables
+    incremental   northwind_etl.JOBS after 1% new rows (watermarks, key_diff, sync)
+    upsert        Orders upserted after 5% of rows changed and 1% added
+    wide_narrow   Orders (14 properties) and Order_Details (5) loaded separately
+
+Each reports rows/s, MB/s (bytes served by the stand-in), peak RSS of this
+process and per-stage time (extract = inside source page iteration, load =
+the rest, both summed over worker threads) as JSON. With --baseline, rows/s
+is compared with an earlier result file and the exit status is 1 when a
+scenario got slower than --tolerance allows.
+
+    python benchmarks/bench_etl.py --scale 10 --output bench.json
+    python benchmarks/bench_etl.py --scale 10 --baseline bench.json
+"""
+# prevent pycache creation
+import sys
+sys.dont_write_bytecode = True
+
+import os
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import argparse
+import json
+import platform
+import subprocess
+import threading
+import time
+from contextlib import nullcontext, redirect_stdout
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import psycopg2
+import requests
+
+from pg_sandbox import throwaway_postgres
+from utilities.etl_runner import ETLJob, ETLRunner
+from utilities.odata_base_wrapper import OData
+from utilities.postgres_wrapper import Postgres
+
+SCHEMA = "northwind"
+TABLES = ["Categories", "CustomerDemographics", "Customers", "Employees", "Orders", "Order_Details",
+          "Products", "Regions", "Shippers", "Suppliers", "Territories"]
+SCENARIOS = ("full_reload", "incremental", "upsert", "wide_narrow")
+
+
+# ---------- instrumentation ----------
+
+class StandInSource(OData):
+    """OData source for the stand-in that counts extracted rows and time spent producing pages."""
+    URL = None
+    DATETIME_LITERALS = "v4"
+
+    def __init__(self):
+        super().__init__(url=self.URL)
+        self.rows = 0
+        self.extract_s = 0.0
+
+    def _iter_pages(self, *args, **kwargs):
+        pages = super()._iter_pages(*args, **kwargs)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                page = next(pages)
+            except StopIteration:
+                return
+            finally:
+                self.extract_s += time.perf_counter() - t0
+            self.rows += len(page)
+            yield page
+
+
+class TimedRunner(ETLRunner):
+    """ETLRunner recording wall time, extract time and extracted rows per job."""
+
+    def __init__(self, source_class, dest_class):
+        super().__init__(source_class, dest_class)
+        self.jobs: dict[str, dict] = {}
+        self._jobs_lock = threading.Lock()
+
+    def _run_job(self, job: ETLJob, *args):
+        src = self.source
+        rows, extract_s = src.rows, src.extract_s
+        t0 = time.perf_counter()
+        try:
+            super()._run_job(job, *args)
+        finally:
+            timing = {
+                "wall_s": time.perf_counter() - t0,
+                "extract_s": src.extract_s - extract_s,
+                "rows": src.rows - rows,
+            }
+            with self._jobs_lock:
+                self.jobs[job.table] = timing
+
+
+class PeakRSS:
+    """Peak resident set size of this process while the block runs (sampled; ru_maxrss elsewhere than Linux)."""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _rss() -> int:
+        try:
+            with open("/proc/self/statm", "rb") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            import resource
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return rss if sys.platform == "darwin" else rss * 1024
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._rss())
+
+    def __enter__(self):
+        self.peak = self._rss()
+        self._thread = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._rss())
+
+    @property
+    def peak_mb(self) -> float:
+        return round(self.peak / 2**20, 1)
+
+
+# ---------- harness ----------
+
+class Bench:
+    def __init__(self, url: str, args):
+        self.url = url
+        self.args = args
+        self.source_class = type("NorthwindStandIn", (StandInSource,), {"URL": url})
+        self.dest = Postgres()
+
+    def admin(self, action: str, **params):
+        resp = requests.post(f"{self.url}/_admin/{action}", params=params)
+        resp.raise_for_status()
+        return resp.json()
+
+    def served(self) -> dict:
+        return requests.get(f"{self.url}/_stats").json()
+
+    def reset(self):
+        """Generated data on the stand-in, empty tables and no watermarks in the warehouse."""
+        self.admin("reset")
+        for table in TABLES:
+            self.dest.truncate_table(SCHEMA, table, "benchmark")
+        with self.dest.connection() as conn, conn.cursor() as cur:
+            cur.execute(f'VACUUM ANALYZE {", ".join(f"{SCHEMA}.{psycopg2.extensions.quote_ident(t, cur)}" for t in TABLES)}')
+
+    def runner(self) -> TimedRunner:
+        return TimedRunner(self.source_class, Postgres)
+
+    def jobs(self, mode: str, tables=TABLES) -> list[ETLJob]:
+        return [ETLJob(schema=SCHEMA, table=t, mode=mode, batch_size=self.args.batch_size) for t in tables]
+
+    def measure(self, name: str, setup, run) -> dict:
+        """Run setup (untimed), then run() -> {table: timing} under measurement."""
+        t0 = time.perf_counter()
+        setup()
+        setup_s = time.perf_counter() - t0
+
+        requests.post(f"{self.url}/_stats/reset").raise_for_status()
+        with PeakRSS() as rss:
+            t0 = time.perf_counter()
+            tables, extra = run()
+            wall_s = time.perf_counter() - t0
+        served = self.served()
+
+        for table, timing in tables.items():
+            timing["bytes"] = served.get(table, {}).get("bytes", 0)
+            timing["requests"] = served.get(table, {}).get("requests", 0)
+            timing["load_s"] = timing["wall_s"] - timing["extract_s"]
+            timing["rows_per_s"] = round(timing["rows"] / timing["wall_s"]) if timing["wall_s"] else None
+            timing["mb_per_s"] = round(timing["bytes"] / timing["wall_s"] / 1e6, 2) if timing["wall_s"] else None
+            for k in ("wall_s", "extract_s", "load_s"):
+                timing[k] = round(timing[k], 4)
+
+        rows = sum(t["rows"] for t in tables.values())
+        n_bytes = sum(s["bytes"] for s in served.values())
+        return {
+            "scenario": name,
+            "rows": rows,
+            "bytes": n_bytes,
+            "wall_s": round(wall_s, 4),
+            "rows_per_s": round(rows / wall_s) if wall_s else None,
+            "mb_per_s": round(n_bytes / wall_s / 1e6, 2) if wall_s else None,
+            "peak_rss_mb": rss.peak_mb,
+            "stages": {
+                "setup_s": round(setup_s, 4),
+                "extract_s": round(sum(t["extract_s"] for t in tables.values()), 4),
+                "load_s": round(sum(t["load_s"] for t in tables.values()), 4),
+            },
+            "tables": tables,
+            **extra,
+        }
+
+    def run_jobs(self, jobs: list[ETLJob]):
+        runner = self.runner()
+        status = runner.run_jobs(jobs, max_workers=self.args.workers)
+        return runner.jobs, {"status": status}
+
+    # ---------- scenarios ----------
+
+    def full_reload(self) -> dict:
+        return self.measure("full_reload", self.reset, lambda: self.run_jobs(self.jobs("truncate_reload")))
+
+    def incremental(self) -> dict:
+        from northwind_etl import JOBS
+
+        def setup():
+            # seed with plain reloads (key_diff into an empty table is slow and not what's measured);
+            # watermarks are then rebuilt from the loaded rows
+            self.reset()
+            self.run_jobs(self.jobs("truncate_reload"))
+            for entity in ("Orders", "Customers", "Products", "CustomerDemographics"):
+                self.admin("append", entity=entity, fraction=self.args.increment)
+
+        return self.measure("incremental", setup, lambda: self.run_jobs(JOBS))
+
+    def upsert(self) -> dict:
+        def setup():
+            self.reset()
+            self.run_jobs(self.jobs("truncate_reload", ["Orders"]))
+            self.admin("mutate", entity="Orders", fraction=self.args.changed)
+            self.admin("append", entity="Orders", fraction=self.args.increment)
+
+        def run():
+            src = self.source_class()
+            t0 = time.perf_counter()
+            inserted, updated = self.dest.upsert_data(
+                SCHEMA, "Orders", src.iter_query("SELECT * FROM Orders"),
+                source="benchmark", batch_size=self.args.batch_size
+            )
+            timing = {"wall_s": time.perf_counter() - t0, "extract_s": src.extract_s, "rows": src.rows}
+            return {"Orders": timing}, {"inserted": inserted, "updated": updated}
+
+        return self.measure("upsert", setup, run)
+
+    def wide_narrow(self) -> dict:
+        tables = {}
+        status = {}
+
+        def run():
+            for table in ("Orders", "Order_Details"):
+                timings, extra = self.run_jobs(self.jobs("truncate_reload", [table]))
+                tables.update(timings)
+                status.update(extra["status"])
+            return tables, {"status": status}
+
+        result = self.measure("wide_narrow", self.reset, run)
+        for timing in result["tables"].values():
+            timing["bytes_per_row"] = round(timing["bytes"] / timing["rows"], 1) if timing["rows"] else None
+        return result
+
+
+def start_standin(scale: int, page_size: int) -> tuple[subprocess.Popen, str]:
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "odata_standin.py"),
+         "--scale", str(scale), "--port", "0", "--page-size", str(page_size)],
+        stdout=subprocess.PIPE, text=True
+    )
+    line = proc.stdout.readline()
+    if not line.startswith("serving "):
+        proc.kill()
+        raise RuntimeError("OData stand-in failed to start")
+    return proc, line.split()[1]
+
+
+def run_meta(args) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    with Postgres().connection() as conn:
+        server_version = conn.server_version
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "packages": {"pandas": pd.__version__, "numpy": np.__version__,
+                     "psycopg2": psycopg2.__version__.split()[0], "requests": requests.__version__},
+        "postgres": server_version,
+        "scale": args.scale,
+        "page_size": args.page_size,
+        "batch_size": args.batch_size,
+        "workers": args.workers,
+    }
+
+
+def compare(results: list[dict], baseline_path: str, tolerance: float) -> bool:
+    """Print rows/s against a baseline result file; False if any scenario regressed beyond tolerance."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {r["scenario"]: r for r in json.load(f)["results"]}
+
+    ok = True
+    for r in results:
+        old = baseline.get(r["scenario"])
+        if not old or not old.get("rows_per_s") or not r.get("rows_per_s"):
+            continue
+        change = r["rows_per_s"] / old["rows_per_s"] - 1
+        regressed = change < -tolerance
+        ok &= not regressed
+        print(f"{r['scenario']:<12} {old['rows_per_s']:>10} -> {r['rows_per_s']:>10} rows/s  {change:+.1%}"
+              f"{'  REGRESSION' if regressed else ''}", file=sys.stderr)
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=10, help="multiple of the Northwind row counts (1-1000)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--page-size", type=int, default=1000, help="stand-in server page size")
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--workers", type=int, default=4, help="ETLRunner max_workers")
+    parser.add_argument("--increment", type=float, default=0.01, help="fraction of new rows for incremental/upsert")
+    parser.add_argument("--changed", type=float, default=0.05, help="fraction of changed rows for upsert")
+    parser.add_argument("--config", help="use the database in this config.yaml instead of a throwaway cluster")
+    parser.add_argument("--pg-bin", help="directory with initdb and pg_ctl")
+    parser.add_argument("--run-as", help="OS user for the throwaway cluster (required when running as root)")
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    parser.add_argument("--baseline", help="earlier --output file to compare rows/s against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed rows/s drop before failing")
+    parser.add_argument("--verbose", action="store_true", help="show ETL output (on stderr)")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios {sorted(unknown)}")
+    if not 1 <= args.scale <= 1000:
+        parser.error("--scale must be between 1 and 1000")
+
+    if args.config:
+        os.environ["DW_CONFIG"] = args.config
+    standin, url = start_standin(args.scale, args.page_size)
+    try:
+        cluster = nullcontext() if args.config else throwaway_postgres(args.pg_bin, args.run_as)
+        with open(os.devnull, "w") as devnull, redirect_stdout(sys.stderr if args.verbose else devnull), cluster:
+            bench = Bench(url, args)
+            meta = run_meta(args)
+            results = []
+            for name in scenarios:
+                results.append(getattr(bench, name)())
+                print(f"{name}: {results[-1]['rows_per_s']} rows/s", file=sys.stderr)
+            bench.dest.flush_ingestion_log()
+    finally:
+        standin.terminate()
+        standin.wait()
+
+    report = json.dumps({"meta": meta, "results": results}, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+    if args.baseline and not compare(results, args.baseline, args.tolerance):
+        sys.exit(1)
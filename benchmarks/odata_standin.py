@@ -0,0 +1,605 @@
+"""
+Local OData v4 stand-in for the Northwind service, serving synthetic data.
+
+Every entity set the ETL loads is generated at `--scale` times the row counts
+of the public Northwind service (x1 .. x1000), with the same property names
+and EDM types. Supported: $filter (the subset utilities.odata_filter emits),
+$select, $orderby, $top, $skip, $count, /$count, server paging with
+@odata.nextLink ($skiptoken; Prefer: odata.maxpagesize), $metadata, gzip and
+ETag / If-None-Match.
+
+Benchmark hooks (not OData):
+    GET  /_stats                      bytes and requests served, per entity set
+    POST /_stats/reset
+    POST /_admin/append?entity=Orders&fraction=0.01   add new rows (Orders also adds their details)
+    POST /_admin/mutate?entity=Orders&fraction=0.05   change a value in existing rows
+    POST /_admin/reset                back to the generated data
+
+    python benchmarks/odata_standin.py --scale 10 [--port 8765] [--page-size 1000]
+"""
+# prevent pycache creation
+import sys
+sys.dont_write_bytecode = True
+
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlencode, urlparse
+
+import numpy as np
+import pandas as pd
+
+# row counts of the public service (CustomerDemographics is empty there)
+BASE_ROWS = {
+    "Categories": 8,
+    "CustomerDemographics": 10,
+    "Customers": 91,
+    "Employees": 9,
+    "Orders": 830,
+    "Products": 77,
+    "Regions": 4,
+    "Shippers": 3,
+    "Suppliers": 29,
+    "Territories": 53,
+}
+
+# entity set -> (key, {property: EDM type}); Order_Details is generated from Orders
+ENTITY_SETS = {
+    "Categories": (["CategoryID"], {
+        "CategoryID": "Edm.Int32", "CategoryName": "Edm.String", "Description": "Edm.String", "Picture": "Edm.Binary",
+    }),
+    "CustomerDemographics": (["CustomerTypeID"], {
+        "CustomerTypeID": "Edm.String", "CustomerDesc": "Edm.String",
+    }),
+    "Customers": (["CustomerID"], {
+        "CustomerID": "Edm.String", "CompanyName": "Edm.String", "ContactName": "Edm.String",
+        "ContactTitle": "Edm.String", "Address": "Edm.String", "City": "Edm.String", "Region": "Edm.String",
+        "PostalCode": "Edm.String", "Country": "Edm.String", "Phone": "Edm.String", "Fax": "Edm.String",
+    }),
+    "Employees": (["EmployeeID"], {
+        "EmployeeID": "Edm.Int32", "LastName": "Edm.String", "FirstName": "Edm.String", "Title": "Edm.String",
+        "TitleOfCourtesy": "Edm.String", "BirthDate": "Edm.DateTimeOffset", "HireDate": "Edm.DateTimeOffset",
+        "Address": "Edm.String", "City": "Edm.String", "Region": "Edm.String", "PostalCode": "Edm.String",
+        "Country": "Edm.String", "HomePhone": "Edm.String", "Extension": "Edm.String", "Photo": "Edm.Binary",
+        "Notes": "Edm.String", "ReportsTo": "Edm.Int32", "PhotoPath": "Edm.String",
+    }),
+    "Orders": (["OrderID"], {
+        "OrderID": "Edm.Int32", "CustomerID": "Edm.String", "EmployeeID": "Edm.Int32",
+        "OrderDate": "Edm.DateTimeOffset", "RequiredDate": "Edm.DateTimeOffset", "ShippedDate": "Edm.DateTimeOffset",
+        "ShipVia": "Edm.Int32", "Freight": "Edm.Decimal:19:4", "ShipName": "Edm.String", "ShipAddress": "Edm.String",
+        "ShipCity": "Edm.String", "ShipRegion": "Edm.String", "ShipPostalCode": "Edm.String",
+        "ShipCountry": "Edm.String",
+    }),
+    "Order_Details": (["OrderID", "ProductID"], {
+        "OrderID": "Edm.Int32", "ProductID": "Edm.Int32", "UnitPrice": "Edm.Decimal:19:4",
+        "Quantity": "Edm.Int16", "Discount": "Edm.Single",
+    }),
+    "Products": (["ProductID"], {
+        "ProductID": "Edm.Int32", "ProductName": "Edm.String", "SupplierID": "Edm.Int32", "CategoryID": "Edm.Int32",
+        "QuantityPerUnit": "Edm.String", "UnitPrice": "Edm.Decimal:19:4", "UnitsInStock": "Edm.Int16",
+        "UnitsOnOrder": "Edm.Int16", "ReorderLevel": "Edm.Int16", "Discontinued": "Edm.Boolean",
+    }),
+    "Regions": (["RegionID"], {
+        "RegionID": "Edm.Int32", "RegionDescription": "Edm.String",
+    }),
+    "Shippers": (["ShipperID"], {
+        "ShipperID": "Edm.Int32", "CompanyName": "Edm.String", "Phone": "Edm.String",
+    }),
+    "Suppliers": (["SupplierID"], {
+        "SupplierID": "Edm.Int32", "CompanyName": "Edm.String", "ContactName": "Edm.String",
+        "ContactTitle": "Edm.String", "Address": "Edm.String", "City": "Edm.String", "Region": "Edm.String",
+        "PostalCode": "Edm.String", "Country": "Edm.String", "Phone": "Edm.String", "Fax": "Edm.String",
+    }),
+    "Territories": (["TerritoryID"], {
+        "TerritoryID": "Edm.String", "TerritoryDescription": "Edm.String",
+    }),
+}
+
+# the property /_admin/mutate changes
+MUTABLE = {
+    "Categories": "Description", "CustomerDemographics": "CustomerDesc", "Customers": "Phone",
+    "Employees": "Extension", "Orders": "Freight", "Order_Details": "Quantity", "Products": "UnitsInStock",
+    "Regions": "RegionDescription", "Shippers": "Phone", "Suppliers": "Phone", "Territories": "TerritoryDescription",
+}
+
+CITIES = ["Berlin", "London", "Madrid", "Reims", "Seattle", "Tacoma", "Lyon", "Graz", "Sao Paulo", "Bern"]
+COUNTRIES = ["Germany", "UK", "Spain", "France", "USA", "Austria", "Brazil", "Switzerland"]
+REGIONS = [None, "WA", "BC", "SP", "RJ", "Isle of Wight"]
+NAMES = ["Maria Anders", "Ana Trujillo", "Antonio Moreno", "Thomas Hardy", "Christina Berglund", "Hanna Moos"]
+TITLES = ["Sales Representative", "Owner", "Marketing Manager", "Accounting Manager", "Order Administrator"]
+COMPANIES = ["Alfreds Futterkiste", "Around the Horn", "Berglunds snabbkop", "Blondel pere et fils",
+             "Vins et alcools Chevalier", "Toms Spezialitaten", "Hanari Carnes", "Victuailles en stock"]
+STREETS = ["Obere Str. 57", "Avda. de la Constitucion 2222", "Mataderos 2312", "120 Hanover Sq.", "Berguvsvagen 8"]
+WORDS = ["Chai", "Chang", "Aniseed Syrup", "Chef Anton's Cajun Seasoning", "Grandma's Boysenberry Spread",
+         "Uncle Bob's Organic Dried Pears", "Northwoods Cranberry Sauce", "Mishi Kobe Niku", "Ikura"]
+EPOCH = pd.Timestamp("1996-07-04", tz="UTC")
+
+# stand-in for the ~10 KB bitmaps of the real service
+PICTURE = base64.b64encode(np.random.default_rng(0).integers(0, 256, 1024, dtype=np.uint8).tobytes()).decode()
+
+
+# ---------- data ----------
+
+def _letters_id(i: np.ndarray, width: int = 5) -> np.ndarray:
+    """ALFKI-style fixed-width upper-case IDs from integers."""
+    digits = np.stack([(i // 26 ** p) % 26 for p in range(width - 1, -1, -1)], axis=1)
+    return (digits + 65).astype(np.uint8).view(f"S{width}").ravel().astype(str).astype(object)
+
+
+def _pick(rng, pool: list, n: int) -> np.ndarray:
+    return np.array(pool, dtype=object)[rng.integers(0, len(pool), n)]
+
+
+def generate(entity: str, start: int, n: int, scale: int, seed: int = 0) -> pd.DataFrame:
+    """Rows start .. start+n-1 of an entity set (deterministic for a given seed)."""
+    rng = np.random.default_rng([seed, start, zlib.crc32(entity.encode("utf-8"))])
+    i = np.arange(start, start + n)
+    customers = BASE_ROWS["Customers"] * scale
+    products = BASE_ROWS["Products"] * scale
+
+    if entity == "Categories":
+        return pd.DataFrame({
+            "CategoryID": i + 1, "CategoryName": [f"Category {k + 1}" for k in i],
+            "Description": _pick(rng, WORDS, n), "Picture": PICTURE,
+        })
+    if entity == "CustomerDemographics":
+        return pd.DataFrame({"CustomerTypeID": [f"T{k:07d}" for k in i], "CustomerDesc": _pick(rng, TITLES, n)})
+    if entity in ("Customers", "Suppliers"):
+        frame = {
+            "CompanyName": _pick(rng, COMPANIES, n), "ContactName": _pick(rng, NAMES, n),
+            "ContactTitle": _pick(rng, TITLES, n), "Address": _pick(rng, STREETS, n), "City": _pick(rng, CITIES, n),
+            "Region": _pick(rng, REGIONS, n), "PostalCode": [f"{k % 99999:05d}" for k in i],
+            "Country": _pick(rng, COUNTRIES, n), "Phone": [f"030-{k % 10_000_000:07d}" for k in i],
+            "Fax": np.where(rng.random(n) < 0.5, None, "030-0076545"),
+        }
+        key = {"CustomerID": _letters_id(i)} if entity == "Customers" else {"SupplierID": i + 1}
+        return pd.DataFrame({**key, **frame})
+    if entity == "Employees":
+        return pd.DataFrame({
+            "EmployeeID": i + 1, "LastName": _pick(rng, ["Davolio", "Fuller", "Leverling", "Peacock"], n),
+            "FirstName": _pick(rng, ["Nancy", "Andrew", "Janet", "Margaret"], n), "Title": _pick(rng, TITLES, n),
+            "TitleOfCourtesy": _pick(rng, ["Ms.", "Dr.", "Mr.", "Mrs."], n),
+            "BirthDate": EPOCH - pd.to_timedelta(rng.integers(9000, 25000, n), unit="D"),
+            "HireDate": EPOCH - pd.to_timedelta(rng.integers(0, 2000, n), unit="D"),
+            "Address": _pick(rng, STREETS, n), "City": _pick(rng, CITIES, n), "Region": _pick(rng, REGIONS, n),
+            "PostalCode": [f"{k % 99999:05d}" for k in i], "Country": _pick(rng, COUNTRIES, n),
+            "HomePhone": [f"(206) 555-{k % 10000:04d}" for k in i], "Extension": [f"{k % 10000}" for k in i],
+            "Photo": PICTURE, "Notes": _pick(rng, WORDS, n),
+            "ReportsTo": pd.array(np.where(i == 0, None, (i // 5) + 1), dtype="Int32"),
+            "PhotoPath": "http://accweb/emmployees/davolio.bmp",
+        })
+    if entity == "Orders":
+        order_date = EPOCH + pd.to_timedelta(i // max(1, scale), unit="D")
+        shipped = pd.Series(order_date + pd.to_timedelta(rng.integers(1, 30, n), unit="D"))
+        shipped[rng.random(n) < 0.03] = pd.NaT
+        return pd.DataFrame({
+            "OrderID": 10248 + i, "CustomerID": _letters_id(rng.integers(0, customers, n)),
+            "EmployeeID": rng.integers(1, BASE_ROWS["Employees"] * scale + 1, n),
+            "OrderDate": order_date, "RequiredDate": order_date + pd.Timedelta(days=28), "ShippedDate": shipped,
+            "ShipVia": rng.integers(1, 4, n), "Freight": np.round(rng.uniform(0, 1000, n), 2),
+            "ShipName": _pick(rng, COMPANIES, n), "ShipAddress": _pick(rng, STREETS, n),
+            "ShipCity": _pick(rng, CITIES, n), "ShipRegion": _pick(rng, REGIONS, n),
+            "ShipPostalCode": [f"{k % 99999:05d}" for k in i], "ShipCountry": _pick(rng, COUNTRIES, n),
+        })
+    if entity == "Order_Details":
+        # start/n are order positions: 1-4 lines per order, distinct products within an order
+        lines = 1 + (i % 4)
+        order = np.repeat(i, lines)
+        line = np.arange(len(order)) - np.repeat(np.cumsum(lines) - lines, lines)
+        m = len(order)
+        return pd.DataFrame({
+            "OrderID": 10248 + order, "ProductID": (order * 7 + line * 13) % products + 1,
+            "UnitPrice": np.round(rng.uniform(2, 264, m), 2), "Quantity": rng.integers(1, 120, m).astype(np.int16),
+            "Discount": rng.choice([0, 0.05, 0.1, 0.15, 0.2, 0.25], m).astype(np.float32),
+        })
+    if entity == "Products":
+        return pd.DataFrame({
+            "ProductID": i + 1, "ProductName": _pick(rng, WORDS, n),
+            "SupplierID": rng.integers(1, BASE_ROWS["Suppliers"] * scale + 1, n),
+            "CategoryID": rng.integers(1, BASE_ROWS["Categories"] * scale + 1, n),
+            "QuantityPerUnit": _pick(rng, ["10 boxes x 20 bags", "24 - 12 oz bottles", "12 - 550 ml bottles"], n),
+            "UnitPrice": np.round(rng.uniform(2, 264, n), 2), "UnitsInStock": rng.integers(0, 125, n),
+            "UnitsOnOrder": rng.integers(0, 100, n), "ReorderLevel": rng.integers(0, 30, n),
+            "Discontinued": rng.random(n) < 0.1,
+        })
+    if entity == "Regions":
+        return pd.DataFrame({"RegionID": i + 1, "RegionDescription": _pick(rng, ["Eastern", "Western", "Northern", "Southern"], n)})
+    if entity == "Shippers":
+        return pd.DataFrame({"ShipperID": i + 1, "CompanyName": _pick(rng, COMPANIES, n),
+                             "Phone": [f"(503) 555-{k % 10000:04d}" for k in i]})
+    if entity == "Territories":
+        return pd.DataFrame({"TerritoryID": [f"{k + 1:05d}" for k in i],
+                             "TerritoryDescription": _pick(rng, CITIES, n)})
+    raise KeyError(entity)
+
+
+class Dataset:
+    """The served entity sets; `version` changes whenever the data does (ETags, result cache)."""
+
+    def __init__(self, scale: int, seed: int = 0):
+        self.scale = scale
+        self.seed = seed
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.frames = {e: generate(e, 0, n * self.scale, self.scale, self.seed) for e, n in BASE_ROWS.items()}
+            self.frames["Order_Details"] = generate("Order_Details", 0, len(self.frames["Orders"]), self.scale, self.seed)
+            self.version = getattr(self, "version", 0) + 1
+
+    def append(self, entity: str, fraction: float) -> int:
+        with self.lock:
+            frame = self.frames[entity]
+            n = max(1, int(len(frame) * fraction))
+            self.frames[entity] = pd.concat(
+                [frame, generate(entity, len(frame), n, self.scale, self.seed + self.version)], ignore_index=True)
+            if entity == "Orders":
+                details = generate("Order_Details", len(frame), n, self.scale, self.seed + self.version)
+                self.frames["Order_Details"] = pd.concat([self.frames["Order_Details"], details], ignore_index=True)
+            self.version += 1
+            return n
+
+    def mutate(self, entity: str, fraction: float) -> int:
+        with self.lock:
+            frame = self.frames[entity].copy()
+            rng = np.random.default_rng([self.seed, self.version])
+            rows = np.flatnonzero(rng.random(len(frame)) < fraction)
+            col = MUTABLE[entity]
+            s = frame[col]
+            if pd.api.types.is_numeric_dtype(s):
+                frame.loc[rows, col] = s.iloc[rows] + 1
+            else:
+                # reversed keeps the value within the column's width
+                frame.loc[rows, col] = s.iloc[rows].map(lambda v: v[::-1] if isinstance(v, str) else v)
+            self.frames[entity] = frame
+            self.version += 1
+            return len(rows)
+
+
+# ---------- $filter ----------
+
+_FILTER_TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<string>'(?:[^']|'')*')
+      | (?P<datetime>datetime'[^']*'|\d{4}-\d{2}-\d{2}(?:T[\d:.]+(?:Z|[+-]\d{2}:\d{2})?)?)
+      | (?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?[mMdDfFlL]?)
+      | (?P<word>[A-Za-z_][\w.]*)
+      | (?P<punct>[(),])
+    )""", re.VERBOSE)
+
+_COMPARE = {"eq": "__eq__", "ne": "__ne__", "lt": "__lt__", "le": "__le__", "gt": "__gt__", "ge": "__ge__"}
+_FUNCTIONS = ("contains", "startswith", "endswith")
+
+
+class FilterError(ValueError):
+    pass
+
+
+class _FilterEval:
+    """Evaluate an OData $filter against a DataFrame into a boolean mask (recursive descent)."""
+
+    def __init__(self, text: str, frame: pd.DataFrame):
+        self.frame = frame
+        self.tokens = []
+        pos = 0
+        text = text.strip()
+        while pos < len(text):
+            m = _FILTER_TOKEN_RE.match(text, pos)
+            if not m or m.end() == pos:
+                raise FilterError(f"cannot parse $filter at {text[pos:pos + 20]!r}")
+            self.tokens.append((m.lastgroup, m.group(m.lastgroup)))
+            pos = m.end()
+        self.i = 0
+
+    def peek(self):
+        return self.tokens[self.i] if self.i < len(self.tokens) else (None, None)
+
+    def take(self, value=None):
+        tok = self.peek()
+        if tok[0] is None or (value is not None and tok[1].lower() != value):
+            raise FilterError(f"expected {value or 'a term'} in $filter, got {tok[1]!r}")
+        self.i += 1
+        return tok
+
+    def mask(self) -> pd.Series:
+        result = self.expr()
+        if self.i != len(self.tokens):
+            raise FilterError(f"unexpected {self.peek()[1]!r} in $filter")
+        return result.fillna(False).astype(bool)
+
+    def expr(self):
+        left = self.conjunction()
+        while self.peek()[1] and self.peek()[1].lower() == "or":
+            self.i += 1
+            left = left | self.conjunction()
+        return left
+
+    def conjunction(self):
+        left = self.negation()
+        while self.peek()[1] and self.peek()[1].lower() == "and":
+            self.i += 1
+            left = left & self.negation()
+        return left
+
+    def negation(self):
+        if self.peek()[1] and self.peek()[1].lower() == "not":
+            self.i += 1
+            return ~self.negation().fillna(False).astype(bool)
+        return self.primary()
+
+    def primary(self):
+        kind, value = self.peek()
+        if value == "(":
+            self.i += 1
+            result = self.expr()
+            self.take(")")
+            return result
+        if kind == "word" and value.lower() in _FUNCTIONS:
+            self.i += 1
+            self.take("(")
+            column = self.column(self.take()[1])
+            self.take(",")
+            arg = self.literal(self.take())
+            self.take(")")
+            text = column.astype("string").str
+            if value.lower() == "contains":
+                return text.contains(arg, regex=False).fillna(False)
+            return getattr(text, value.lower())(arg).fillna(False)
+
+        left = self.operand()
+        op = self.take()[1].lower()
+        if op not in _COMPARE:
+            raise FilterError(f"unknown operator {op!r} in $filter")
+        right = self.operand()
+        if right is None or left is None:
+            s = left if right is None else right
+            return s.isna() if op == "eq" else s.notna()
+        if isinstance(left, pd.Series) and pd.api.types.is_datetime64_any_dtype(left):
+            right = pd.Timestamp(right, tz="UTC") if pd.Timestamp(right).tzinfo is None else pd.Timestamp(right)
+        return getattr(left, _COMPARE[op])(right)
+
+    def column(self, name: str) -> pd.Series:
+        if name not in self.frame.columns:
+            raise FilterError(f"unknown property {name!r} in $filter")
+        return self.frame[name]
+
+    def operand(self):
+        tok = self.take()
+        if tok[0] == "word" and tok[1].lower() not in ("null", "true", "false"):
+            return self.column(tok[1])
+        return self.literal(tok)
+
+    @staticmethod
+    def literal(tok):
+        kind, value = tok
+        if kind == "string":
+            return value[1:-1].replace("''", "'")
+        if kind == "datetime":
+            return value[9:-1] if value.startswith("datetime'") else value
+        if kind == "number":
+            value = value.rstrip("mMdDfFlL")
+            return float(value) if any(c in value for c in ".eE") else int(value)
+        lowered = value.lower()
+        if lowered == "null":
+            return None
+        if lowered in ("true", "false"):
+            return lowered == "true"
+        raise FilterError(f"expected a literal in $filter, got {value!r}")
+
+
+# ---------- server ----------
+
+def metadata_document() -> bytes:
+    types = []
+    for entity, (key, props) in ENTITY_SETS.items():
+        refs = "".join(f'<PropertyRef Name="{k}"/>' for k in key)
+        lines = []
+        for name, edm in props.items():
+            edm, *scale = edm.split(":")
+            extra = f' Precision="{scale[0]}" Scale="{scale[1]}"' if scale else ""
+            nullable = ' Nullable="false"' if name in key else ""
+            lines.append(f'<Property Name="{name}" Type="{edm}"{extra}{nullable}/>')
+        types.append(f'<EntityType Name="{entity}"><Key>{refs}</Key>{"".join(lines)}</EntityType>')
+    sets = "".join(f'<EntitySet Name="{e}" EntityType="NorthwindModel.{e}"/>' for e in ENTITY_SETS)
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<edmx:Edmx Version="4.0" xmlns:edmx="http://docs.oasis-open.org/odata/ns/edmx"><edmx:DataServices>'
+        f'<Schema Namespace="NorthwindModel" xmlns="http://docs.oasis-open.org/odata/ns/edm">{"".join(types)}'
+        f'<EntityContainer Name="NorthwindEntities">{sets}</EntityContainer></Schema>'
+        '</edmx:DataServices></edmx:Edmx>'
+    ).encode("utf-8")
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, dataset: Dataset, page_size: int = 1000, compress: bool = True):
+        super().__init__(address, StandInHandler)
+        self.dataset = dataset
+        self.page_size = page_size
+        self.compress = compress
+        self.metadata = metadata_document()
+        self.stats_lock = threading.Lock()
+        self.stats = {}
+        # (entity, filter, orderby, version) -> row positions, so paging doesn't re-filter every page
+        self.results: OrderedDict = OrderedDict()
+
+    def count(self, entity: str, n_bytes: int):
+        with self.stats_lock:
+            s = self.stats.setdefault(entity, {"requests": 0, "bytes": 0})
+            s["requests"] += 1
+            s["bytes"] += n_bytes
+
+    def positions(self, entity: str, frame: pd.DataFrame, version: int, filter_: str | None, orderby: str | None):
+        key = (entity, filter_, orderby, version)
+        with self.stats_lock:
+            hit = self.results.get(key)
+        if hit is not None:
+            return hit
+
+        rows = frame
+        if filter_:
+            rows = frame[_FilterEval(filter_, frame).mask()]
+        sort = [c.split() for c in orderby.split(",")] if orderby else [[k] for k in ENTITY_SETS[entity][0]]
+        rows = rows.sort_values([c[0] for c in sort], ascending=[len(c) == 1 or c[1] != "desc" for c in sort],
+                                kind="stable")
+        positions = frame.index.get_indexer(rows.index)
+
+        with self.stats_lock:
+            self.results[key] = positions
+            while len(self.results) > 64:
+                self.results.popitem(last=False)
+        return positions
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: StandInServer
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json", entity: str = "_",
+              headers: dict | None = None):
+        if self.server.compress and len(body) > 1024 and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=1)
+            headers = {**(headers or {}), "Content-Encoding": "gzip"}
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("OData-Version", "4.0")
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count(entity, len(body))
+
+    def _error(self, status: int, message: str):
+        self._send(status, json.dumps({"error": {"code": str(status), "message": message}}).encode("utf-8"))
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        q = {k: v[0] for k, v in parse_qs(url.query).items()}
+        dataset = self.server.dataset
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+
+        if url.path == "/_stats/reset":
+            with self.server.stats_lock:
+                self.server.stats = {}
+            return self._send(200, b"{}")
+        if url.path == "/_admin/reset":
+            dataset.reset()
+            return self._send(200, b"{}")
+        if url.path in ("/_admin/append", "/_admin/mutate"):
+            entity = q.get("entity")
+            if entity not in dataset.frames:
+                return self._error(404, f"unknown entity set {entity!r}")
+            action = dataset.append if url.path.endswith("append") else dataset.mutate
+            n = action(entity, float(q.get("fraction", 0.01)))
+            return self._send(200, json.dumps({"rows": n}).encode("utf-8"))
+        self._error(404, "not found")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        q = {k: v[0] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+        parts = [p for p in url.path.split("/") if p]
+
+        if parts == ["_stats"]:
+            with self.server.stats_lock:
+                body = json.dumps(self.server.stats).encode("utf-8")
+            return self._send(200, body)
+        if parts == ["$metadata"]:
+            return self._send(200, self.server.metadata, "application/xml", entity="$metadata")
+        if not parts or parts[0] not in ENTITY_SETS:
+            return self._error(404, f"resource {url.path!r} not found")
+
+        entity = parts[0]
+        dataset = self.server.dataset
+        with dataset.lock:
+            frame = dataset.frames[entity]
+            version = dataset.version
+        try:
+            positions = self.server.positions(entity, frame, version, q.get("$filter"), q.get("$orderby"))
+        except (FilterError, KeyError, TypeError) as e:
+            return self._error(400, str(e))
+
+        skip = int(q.get("$skip", 0))
+        top = int(q["$top"]) if "$top" in q else None
+        window = positions[skip:] if top is None else positions[skip:skip + top]
+
+        if parts[1:] == ["$count"]:
+            return self._send(200, str(len(window)).encode("utf-8"), "text/plain", entity=entity)
+
+        etag = '"' + hashlib.sha1(f"{version}:{self.path}".encode("utf-8")).hexdigest()[:20] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            self.server.count(entity, 0)
+            return
+
+        page_size = self.server.page_size
+        prefer = re.search(r"odata\.maxpagesize=(\d+)", self.headers.get("Prefer", ""))
+        if prefer:
+            page_size = int(prefer.group(1))
+        token = int(q.get("$skiptoken", 0))
+        page_rows = window[token:token + page_size]
+
+        columns = list(ENTITY_SETS[entity][1])
+        if q.get("$select"):
+            columns = [c.strip() for c in q["$select"].split(",")]
+            unknown = set(columns) - set(frame.columns)
+            if unknown:
+                return self._error(400, f"unknown properties {sorted(unknown)} in $select")
+        page = frame.iloc[page_rows][columns]
+
+        values = page.to_json(orient="records", date_format="iso", date_unit="s")
+        head = {"@odata.context": f"http://{self.headers.get('Host', '')}/$metadata#{entity}"}
+        if q.get("$count") == "true":
+            head["@odata.count"] = len(window)
+        tail = ""
+        if token + page_size < len(window):
+            next_q = {k: v for k, v in q.items() if k != "$skiptoken"}
+            next_q["$skiptoken"] = token + page_size
+            tail = ',"@odata.nextLink":' + json.dumps(f"{entity}?{urlencode(next_q, quote_via=quote)}")
+        body = (json.dumps(head)[:-1] + ',"value":' + values + tail + "}").encode("utf-8")
+        self._send(200, body, entity=entity, headers={"ETag": etag})
+
+
+def serve(scale: int, port: int = 0, page_size: int = 1000, compress: bool = True, seed: int = 0) -> StandInServer:
+    """Generate the data and start serving on a background thread; returns the server (see server_address)."""
+    server = StandInServer(("127.0.0.1", port), Dataset(scale, seed), page_size=page_size, compress=compress)
+    threading.Thread(target=server.serve_forever, name="odata-standin", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=1, help="multiple of the Northwind row counts (1-1000)")
+    parser.add_argument("--port", type=int, default=8765, help="0 picks a free port")
+    parser.add_argument("--page-size", type=int, default=1000, help="server page size (Prefer can lower it)")
+    parser.add_argument("--no-gzip", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if not 1 <= args.scale <= 1000:
+        parser.error("--scale must be between 1 and 1000")
+
+    server = StandInServer(("127.0.0.1", args.port), Dataset(args.scale, args.seed),
+                           page_size=args.page_size, compress=not args.no_gzip)
+    # the benchmark harness waits for this line
+    print(f"serving http://127.0.0.1:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,145 @@
+"""
+Throwaway local PostgreSQL cluster with the data warehouse built into it.
+
+initdb creates a cluster in a temporary directory, pg_ctl starts it on a free
+port (durability off: fsync, synchronous_commit and full_page_writes), the
+NorthwindDW database is created and build_database.py runs the DDL against
+it. A config.yaml for the cluster is written next to it and exported as
+$DW_CONFIG, so Postgres() in this process (and child processes) connects
+there. Everything is stopped and deleted on exit unless keep=True.
+
+    with throwaway_postgres() as cluster:
+        ...  # Postgres() now points at cluster["port"]
+
+    python benchmarks/pg_sandbox.py [--pg-bin DIR] [--run-as USER]   # start one and wait
+"""
+# prevent pycache creation
+import sys
+sys.dont_write_bytecode = True
+
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import yaml
+
+DATABASE = "NorthwindDW"
+
+# a benchmark database doesn't need to survive a crash
+SERVER_SETTINGS = {
+    "fsync": "off",
+    "synchronous_commit": "off",
+    "full_page_writes": "off",
+    "shared_buffers": "256MB",
+    "max_wal_size": "4GB",
+    "max_connections": "50",
+}
+
+
+def find_pg_bin(pg_bin: str | None = None) -> str:
+    """Directory holding initdb/pg_ctl: pg_bin, $PG_BIN, initdb on PATH, or pg_config --bindir."""
+    for candidate in (pg_bin, os.environ.get("PG_BIN")):
+        if candidate:
+            return candidate
+    initdb = shutil.which("initdb")
+    if initdb:
+        return os.path.dirname(initdb)
+    pg_config = shutil.which("pg_config")
+    if pg_config:
+        return subprocess.run([pg_config, "--bindir"], check=True, capture_output=True, text=True).stdout.strip()
+    raise FileNotFoundError("PostgreSQL binaries not found; pass --pg-bin or set PG_BIN.")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def throwaway_postgres(pg_bin: str | None = None, run_as: str | None = None, port: int | None = None,
+                       keep: bool = False, build: bool = True):
+    """
+    Start a temporary cluster and yield {"port", "data_dir", "config"}.
+    initdb refuses to run as root: there, pass run_as=<unprivileged user>.
+    """
+    bin_dir = find_pg_bin(pg_bin)
+    if run_as is None and hasattr(os, "geteuid") and os.geteuid() == 0:
+        raise PermissionError("initdb can't run as root; pass run_as=<user> (--run-as) or use an existing server.")
+    prefix = ["runuser", "-u", run_as, "--"] if run_as else []
+
+    root = tempfile.mkdtemp(prefix="dw-bench-")
+    data_dir = os.path.join(root, "data")
+    port = port or _free_port()
+    if run_as:
+        shutil.chown(root, user=run_as)
+
+    def run(*cmd):
+        subprocess.run(prefix + list(cmd), check=True, capture_output=True, text=True)
+
+    started = False
+    try:
+        run(os.path.join(bin_dir, "initdb"), "-D", data_dir, "-U", "postgres", "-A", "trust",
+            "-E", "UTF8", "--locale=C")
+        options = f"-p {port} -k {root} -c listen_addresses=127.0.0.1 " + " ".join(
+            f"-c {k}={v}" for k, v in SERVER_SETTINGS.items())
+        run(os.path.join(bin_dir, "pg_ctl"), "-D", data_dir, "-o", options, "-l", os.path.join(root, "server.log"),
+            "-w", "start")
+        started = True
+
+        config = os.path.join(root, "config.yaml")
+        with open(config, "w", encoding="utf-8") as f:
+            yaml.safe_dump({"postgres": {
+                "host": "127.0.0.1", "port": port, "database": DATABASE, "user": "postgres", "password": "",
+                "pool": {"min_size": 1, "max_size": 20},
+                # a benchmark process exits right after its runs
+                "logging": {"flush_interval": 0},
+            }}, f)
+        os.environ["DW_CONFIG"] = config
+
+        if build:
+            # the DDL's CREATE DATABASE names a Windows locale; create it here and build the rest
+            conn = psycopg2.connect(host="127.0.0.1", port=port, dbname="postgres", user="postgres")
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f'CREATE DATABASE "{DATABASE}" TEMPLATE template0 ENCODING \'UTF8\'')
+            conn.close()
+
+            from build_database import build_database
+            build_database(create_database=False)
+
+        yield {"port": port, "data_dir": data_dir, "config": config}
+    finally:
+        if started and not keep:
+            try:
+                run(os.path.join(bin_dir, "pg_ctl"), "-D", data_dir, "-m", "immediate", "-w", "stop")
+            except subprocess.CalledProcessError as e:
+                print(f"Warning: could not stop the benchmark cluster: {e.stderr}")
+        if not keep:
+            shutil.rmtree(root, ignore_errors=True)
+        elif started:
+            print(f"Benchmark cluster kept running in {root} on port {port}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pg-bin", help="directory with initdb and pg_ctl")
+    parser.add_argument("--run-as", help="OS user to run the cluster as (required when running as root)")
+    parser.add_argument("--port", type=int)
+    args = parser.parse_args()
+
+    with throwaway_postgres(args.pg_bin, args.run_as, args.port) as cluster:
+        print(f"PostgreSQL on 127.0.0.1:{cluster['port']}, DW_CONFIG={cluster['config']} (Ctrl+C to stop)", flush=True)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
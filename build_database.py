@@ -1,82 +1,194 @@
 """
 Build database by executing DDL scripts for all tables.
-First, unique database, schemas, tables, stored procedures, and views are created.
-
-Then, default database, schemas, tables, stored procedures, and views are created.
+First, the unique database is created (skipped if it already exists).
+
+Then schemas, stored procedures, tables, and views are created, each from the
+unique directory and then the default directory. Procedures come before tables
+because unique tables attach triggers that call common functions.
+
+Every applied file is recorded with its checksum in common."DdlLedger", in the
+same transaction as its DDL; files whose checksum is unchanged are skipped, so
+a redeploy only runs what changed (--force re-applies everything). Files of
+one stage are independent and run in parallel over pooled connections, except
+views, which may select from each other and run one at a time in name order.
+DDL files must therefore stay idempotent (IF NOT EXISTS / OR REPLACE).
 """
 # prevent pycache creation
 import sys
 sys.dont_write_bytecode = True
 
 from utilities.postgres_wrapper import Postgres
+import argparse
+import hashlib
 import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import atexit
 
-def build_database():
-    ddl_base_path = os.path.join(os.path.dirname(__file__), "DDL")
-    
+# (directory, files may run in parallel)
+STAGES = (
+    ("schemas", True),
+    ("stored_procedures", True),
+    ("tables", True),
+    ("views", False),
+)
+
+DEFAULT_WORKERS = 8
+
+# created before anything is read from or written to the ledger
+LEDGER_BOOTSTRAP = (
+    os.path.join("default", "schemas", "common.sql"),
+    os.path.join("default", "tables", "common.DdlLedger.sql"),
+)
+
+_CREATE_DATABASE = re.compile(r'CREATE\s+DATABASE\s+("(?:[^"]|"")+"|\w+)', re.IGNORECASE)
+
+LEDGER_UPSERT = """
+    INSERT INTO common."DdlLedger" ("FILE_PATH", "CHECKSUM", "APPLIED_AT", "DURATION_MS")
+    VALUES (%s, %s, now(), %s)
+    ON CONFLICT ("FILE_PATH") DO UPDATE
+    SET "CHECKSUM" = EXCLUDED."CHECKSUM", "APPLIED_AT" = EXCLUDED."APPLIED_AT", "DURATION_MS" = EXCLUDED."DURATION_MS";
+"""
+
+
+def build_database(create_database: bool = True, force: bool = False, workers: int | None = None):
+    """
+    create_database=False skips DDL/unique/database (for a database that was
+    created separately, e.g. with a locale other than the one in the DDL).
+    force=True re-applies files the ledger says are unchanged.
+    workers caps the files run at once (default: up to 8, within the pool size).
+    """
+    ddl_base_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "DDL")
+
     # start with unique directory
     unique_path = os.path.join(ddl_base_path, "unique")
 
-    db_database = Postgres(database_builder=True)
-
     # create the database first
-    database_path = os.path.join(unique_path, "database")
-    run_ddl(database_path, db_database)
-    db_database.close()
+    if create_database:
+        db_database = Postgres(database_builder=True)
+        database_path = os.path.join(unique_path, "database")
+        run_database_ddl(database_path, db_database)
+        db_database.close()
 
     # now connect to the new database
     db = Postgres()
     atexit.register(db.close)
+    workers = max(1, min(workers or DEFAULT_WORKERS, db.pool.max_size))
 
-    # schemas
-    schemas_path = os.path.join(unique_path, "schemas")
-    run_ddl(schemas_path, db)
-        
-    # tables
-    tables_path = os.path.join(unique_path, "tables")
-    run_ddl(tables_path, db)
+    ledger = load_ledger(db, ddl_base_path)
 
-    # stored procedures
-    sprocs_path = os.path.join(unique_path, "stored_procedures")
-    run_ddl(sprocs_path, db)
+    applied = skipped = 0
+    for kind, parallel in STAGES:
+        files = ddl_files(ddl_base_path, os.path.join("unique", kind)) + \
+                ddl_files(ddl_base_path, os.path.join("default", kind))
+        pending = [f for f in files if force or ledger.get(f[0]) != f[2]]
+        skipped += len(files) - len(pending)
+        run_stage(db, pending, workers if parallel else 1)
+        applied += len(pending)
 
-    # views
-    views_path = os.path.join(unique_path, "views")
-    run_ddl(views_path, db)
+    # DDL may have changed any table's shape
+    db.invalidate_metadata()
+    print(f"DDL: {applied} file(s) applied, {skipped} unchanged.")
 
-    # default directory
-    default_path = os.path.join(ddl_base_path, "default")
-
-    # schemas
-    schemas_path = os.path.join(default_path, "schemas")
-    run_ddl(schemas_path, db)
-
-    # tables
-    tables_path = os.path.join(default_path, "tables")
-    run_ddl(tables_path, db)
-
-    # stored procedures
-    sprocs_path = os.path.join(default_path, "stored_procedures")
-    run_ddl(sprocs_path, db)
+    db.close()
 
-    # views
-    views_path = os.path.join(default_path, "views")
-    run_ddl(views_path, db)
+def ddl_files(ddl_base_path: str, directory: str) -> list[tuple[str, str, str]]:
+    """(ledger key, DDL text, checksum) of the .sql files in DDL/<directory>, in name order."""
+    path = os.path.join(ddl_base_path, directory)
+    if not os.path.isdir(path):
+        return []
 
-    db.close()
+    files = []
+    for file in sorted(os.listdir(path)):
+        if file.endswith(".sql"):
+            with open(os.path.join(path, file), "r", encoding="utf-8") as f:
+                ddl_sql = f.read()
+            # line endings depend on the checkout, not the DDL
+            checksum = hashlib.sha256(ddl_sql.replace("\r\n", "\n").encode("utf-8")).hexdigest()
+            files.append(("/".join((directory.replace(os.sep, "/"), file)), ddl_sql, checksum))
+    return files
+
+def load_ledger(db: Postgres, ddl_base_path: str) -> dict[str, str]:
+    """{file: checksum} of the applied DDL, creating the ledger table on a fresh database."""
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute("""SELECT to_regclass('common."DdlLedger"') IS NOT NULL;""")
+        exists = cur.fetchone()[0]
+    if not exists:
+        for file in LEDGER_BOOTSTRAP:
+            db.run_ddl(os.path.join(ddl_base_path, file))
+
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute('SELECT "FILE_PATH", "CHECKSUM" FROM common."DdlLedger";')
+        return dict(cur.fetchall())
+
+def apply_ddl(db: Postgres, key: str, ddl_sql: str, checksum: str):
+    """Run one DDL file and record it in the ledger, in one transaction."""
+    print(f"Running DDL: {key}")
+    start = time.perf_counter()
+    with db.connection(autocommit=False) as conn, conn.cursor() as cur:
+        cur.execute(ddl_sql)
+        cur.execute(LEDGER_UPSERT, (key, checksum, round((time.perf_counter() - start) * 1000)))
+        conn.commit()
+
+def run_stage(db: Postgres, files: list[tuple[str, str, str]], workers: int):
+    """Apply files (from ddl_files) on up to `workers` connections; raise once all have finished if any failed."""
+    if not files:
+        return
+    if workers == 1 or len(files) == 1:
+        for file in files:
+            apply_ddl(db, *file)
+        return
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(files)), thread_name_prefix="ddl") as pool:
+        futures = {pool.submit(apply_ddl, db, *file): file[0] for file in files}
+
+    failed = [(key, fut.exception()) for fut, key in futures.items() if fut.exception() is not None]
+    for key, exc in failed:
+        print(f"DDL failed: {key}: {exc}")
+    if failed:
+        raise RuntimeError(f"{len(failed)} DDL file(s) failed: {', '.join(k for k, _ in failed)}") from failed[0][1]
+
+def run_database_ddl(path: str, db: Postgres):
+    """Run the CREATE DATABASE files in path whose database doesn't exist yet."""
+    for file in sorted(os.listdir(path)):
+        if not file.endswith(".sql"):
+            continue
+        ddl_file = os.path.join(path, file)
+        with open(ddl_file, "r", encoding="utf-8") as f:
+            match = _CREATE_DATABASE.search(f.read())
+        if match:
+            name = match.group(1)
+            name = name[1:-1].replace('""', '"') if name.startswith('"') else name.lower()
+            with db.connection() as conn, conn.cursor() as cur:
+                cur.execute("SELECT 1 FROM pg_database WHERE datname = %s;", (name,))
+                if cur.fetchone():
+                    print(f"Database {name} already exists; skipping {file}.")
+                    continue
+        print(f"Running DDL: {file}")
+        db.run_ddl(ddl_file)
 
 def run_ddl(path: str, db: Postgres = None):
+    """Run every .sql file in path, without the ledger."""
     if db is None:
         db = Postgres()
         atexit.register(db.close)
 
-    for file in os.listdir(path):
+    for file in sorted(os.listdir(path)):
         if file.endswith(".sql"):
             print(f"Running DDL: {file}")
             ddl_file = os.path.join(path, file)
             db.run_ddl(ddl_file)
 
 if __name__ == "__main__":
-    build_database()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the DDL scripts against the database in config.yaml ($DW_CONFIG).")
+    parser.add_argument("--skip-create-database", action="store_true",
+                        help="the database already exists; only create its objects")
+    parser.add_argument("--force", action="store_true",
+                        help="re-apply every DDL file, even those unchanged since they were last applied")
+    parser.add_argument("--workers", type=int, default=None,
+                        help=f"DDL files run at once within a stage (default {DEFAULT_WORKERS}, capped by the pool size)")
+    args = parser.parse_args()
+
+    build_database(create_database=not args.skip_create_database, force=args.force, workers=args.workers)
@@ -6,91 +6,29 @@ sys.dont_write_bytecode = True
 
 from utilities.postgres_wrapper import Postgres
 from northwind_wrapper import Northwind
-from utilities.etl_runner import ETLRunner
+from utilities.etl_runner import ETLRunner, ETLJob
+
+# tables are independent unless depends_on says otherwise
+JOBS = [
+    ETLJob(schema="northwind", table="Categories", max_field="CategoryID", batch_size=5000),
+    # no monotonic column: compare keys with the source and fetch only the missing rows
+    ETLJob(schema="northwind", table="CustomerDemographics", mode="key_diff", key_fields=["CustomerTypeID"], batch_size=5000),
+    ETLJob(schema="northwind", table="Customers", mode="truncate_reload", batch_size=5000),
+    ETLJob(schema="northwind", table="Employees", max_field="EmployeeID", batch_size=5000),
+    ETLJob(schema="northwind", table="Orders", max_field="OrderID", batch_size=5000),
+    # details only after their order headers are in
+    ETLJob(schema="northwind", table="Order_Details", mode="key_diff", key_fields=["OrderID", "ProductID"],
+           batch_size=5000, depends_on=["Orders"]),
+    ETLJob(schema="northwind", table="Products", max_field="ProductID", batch_size=5000),
+    ETLJob(schema="northwind", table="Regions", max_field="RegionID", batch_size=5000),
+    ETLJob(schema="northwind", table="Shippers", max_field="ShipperID", batch_size=5000),
+    ETLJob(schema="northwind", table="Suppliers", max_field="SupplierID", batch_size=5000),
+    ETLJob(schema="northwind", table="Territories", mode="truncate_reload", batch_size=5000),
+]
 
 if __name__ == "__main__":
     runner = ETLRunner(Northwind, Postgres)
-    
-    runner.insert_latest(
-        schema="northwind",
-        table_name="Categories",
-        source_query="SELECT * FROM Categories",
-        max_field="CategoryID",
-        batch_size=5000
-    )
 
-    runner.insert_latest(
-        schema="northwind",
-        table_name="CustomerDemographics",
-        source_query="SELECT * FROM CustomerDemographics",
-        batch_size=5000
-    )
+    results = runner.run_jobs(JOBS, max_workers=4)
 
-    runner.truncate_reload(
-        schema="northwind",
-        table_name="Customers",
-        source_query="SELECT * FROM Customers",
-        batch_size=5000
-    )
-
-    runner.insert_latest(
-        schema="northwind",
-        table_name="Employees",
-        source_query="SELECT * FROM Employees",
-        max_field="EmployeeID",
-        batch_size=5000
-    )
-
-    runner.insert_latest(
-        schema="northwind",
-        table_name="Order_Details",
-        source_query="SELECT * FROM Order_Details",
-        batch_size=5000
-    )
-
-    runner.insert_latest(
-        schema="northwind",
-        table_name="Orders",
-        source_query="SELECT * FROM Orders",
-        max_field="OrderID",
-        batch_size=5000
-    )
-
-    runner.insert_latest(
-        schema="northwind",
-        table_name="Products",
-        source_query="SELECT * FROM Products",
-        max_field="ProductID",
-        batch_size=5000
-    )
-
-    runner.insert_latest(
-        schema="northwind",
-        table_name="Regions",
-        source_query="SELECT * FROM Regions",
-        max_field="RegionID",
-        batch_size=5000
-    )
-
-    runner.insert_latest(
-        schema="northwind",
-        table_name="Shippers",
-        source_query="SELECT * FROM Shippers",
-        max_field="ShipperID",
-        batch_size=5000
-    )
-
-    runner.insert_latest(
-        schema="northwind",
-        table_name="Suppliers",
-        source_query="SELECT * FROM Suppliers",
-        max_field="SupplierID",
-        batch_size=5000
-    )
-
-    runner.truncate_reload(
-        schema="northwind",
-        table_name="Territories",
-        source_query="SELECT * FROM Territories",
-        batch_size=5000
-    )
\ No newline at end of file
+    print(results)
@@ -1,5 +1,6 @@
 import requests
 import pandas as pd
+import os
 import re
 
 from utilities.odata_base_wrapper import OData
@@ -7,6 +8,11 @@ from utilities.odata_base_wrapper import OData
 BASE_URL = "https://services.odata.org/V4/Northwind/Northwind.svc"
 
 class Northwind(OData):
+    DATETIME_LITERALS = "v4"
+    METADATA_CACHE_DIR = os.path.join(".cache", "odata")
+    # reference sets (Regions, Shippers, Categories, ...) rarely change: revalidate instead of refetching
+    HTTP_CACHE_DIR = os.path.join(".cache", "odata", "http")
+
     def __init__(self):
         super().__init__(url=BASE_URL)
         
\ No newline at end of file
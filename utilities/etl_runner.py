@@ -1,60 +1,465 @@
 import pandas as pd
+import numpy as np
 import atexit
+import queue
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+
+from utilities.metrics import NULL_METRICS, StageMetrics, write_textfile
+from utilities.odata_filter import extend_query
+from utilities.pg_metadata import ROW_HASH_COLUMN, coerce_frame
+from utilities.profiling import JobProfiler, profiler_from_settings
+
+_DONE = object()
+
+
+def _sql_literal(value) -> str:
+    """Render a value for the SQL-like source query (numbers bare, everything else quoted)."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class _ProducerError:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+def prefetch(iterable, max_pending: int = 4):
+    """
+    Iterate `iterable` on a background thread and yield its items here.
+    At most `max_pending` items wait in between; the producer blocks when the
+    consumer falls behind, so memory stays bounded. Producer errors are re-raised
+    in the consumer, and closing the generator early stops the producer.
+    """
+    pending = queue.Queue(maxsize=max(1, max_pending))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(_ProducerError(e))
+
+    producer = threading.Thread(target=produce, name="etl-prefetch", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = pending.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _ProducerError):
+                raise item.exc
+            yield item
+    finally:
+        stop.set()
+
+
+@dataclass
+class ETLJob:
+    """
+    One table refresh for ETLRunner.run_jobs.
+
+    mode is the ETLRunner method to call ("insert_latest", "truncate_reload" or "key_diff");
+    query defaults to SELECT * FROM <table>; max_field is one column or a list of
+    columns (composite watermark); key_fields is the key compared by key_diff (default:
+    the destination's natural key); depends_on lists tables that must finish
+    successfully before this one starts.
+    """
+    schema: str
+    table: str
+    mode: str = "insert_latest"
+    query: str | None = None
+    max_field: str | list[str] | None = None
+    key_fields: list[str] | None = None
+    batch_size: int = 10000
+    pipeline: bool = False
+    depends_on: list[str] = field(default_factory=list)
+
 
 class ETLRunner:
-    def __init__(self, source_class, dest_class):
-        self.source = source_class()
+    MODES = ("insert_latest", "truncate_reload", "key_diff")
+
+    def __init__(self, source_class, dest_class, profile: str | None = None):
+        """
+        profile: "cpu", "memory" or "cpu,memory" to profile each run_jobs job
+        (default: $DW_PROFILE or postgres.profiling.mode, see utilities.profiling).
+        """
+        self.source_class = source_class
         self.source_name = source_class.__name__
+        self.profile = profile
         self.dest = dest_class()
-        atexit.register(self.source.close)
+        self._local = threading.local()
         atexit.register(self.dest.close)
 
+    @property
+    def source(self):
+        # sessions aren't shared between threads: each worker gets its own source
+        src = getattr(self._local, "source", None)
+        if src is None:
+            src = self._local.source = self.source_class()
+            atexit.register(src.close)
+        return src
+
+    def run_jobs(self, jobs: list, max_workers: int = 4) -> dict[str, str]:
+        """
+        Run a declarative list of ETLJob (or equivalent dicts) on a pool of max_workers threads.
+        A job starts once everything in its depends_on has succeeded; if a dependency fails
+        (a load error counts, even though the destination only logs it), its dependents are
+        skipped. A dependency cycle is rejected before any job starts. Each worker uses its own source session, and every
+        destination operation borrows its own pooled connection, so keep
+        postgres.pool.max_size >= max_workers.
+
+        With postgres.metrics enabled, each job's stage timings are collected and, if
+        postgres.metrics.textfile is set, written there in the Prometheus text format
+        once the run is over. With profiling on, every job is profiled into a run directory;
+        CPU profiling runs the jobs one at a time.
+
+        Returns {table: "ok" | "failed" | "skipped"}.
+        """
+        jobs = [j if isinstance(j, ETLJob) else ETLJob(**j) for j in jobs]
+        by_table = {j.table: j for j in jobs}
+        if len(by_table) != len(jobs):
+            raise ValueError("ETL job tables must be unique")
+        for j in jobs:
+            if j.mode not in self.MODES:
+                raise ValueError(f"Unknown ETL mode {j.mode!r} for {j.table}")
+            unknown = set(j.depends_on) - set(by_table)
+            if unknown:
+                raise ValueError(f"{j.table} depends on unknown job(s) {unknown}")
+        self._check_acyclic(jobs)
+
+        status: dict[str, str] = {}
+        metrics: dict[str, StageMetrics] = {}
+        profiler = profiler_from_settings(self.profile)
+        if profiler is not None and profiler.cpu and max_workers > 1:
+            # one cProfile can be active per process (Python 3.12+)
+            print("CPU profiling is on: running ETL jobs one at a time.")
+            max_workers = 1
+        waiting = dict(by_table)
+        running = {}
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="etl") as pool:
+                while waiting or running:
+                    # skip anything downstream of a failure, start anything whose deps are done
+                    for name, job in list(waiting.items()):
+                        if any(status.get(d) in ("failed", "skipped") for d in job.depends_on):
+                            print(f"Skipping {job.schema}.{name}: a dependency did not complete.")
+                            status[name] = "skipped"
+                            del waiting[name]
+                        elif all(status.get(d) == "ok" for d in job.depends_on):
+                            running[pool.submit(self._run_job, job, metrics, profiler)] = name
+                            del waiting[name]
+
+                    if not running:
+                        break
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        name = running.pop(fut)
+                        try:
+                            fut.result()
+                            status[name] = "ok"
+                        except Exception as e:
+                            print(f"ETL job {by_table[name].schema}.{name} failed: {e}")
+                            status[name] = "failed"
+        finally:
+            # also after an interrupt: log what ran and export what was measured
+            try:
+                self.dest.flush_ingestion_log()
+            except Exception as e:
+                # don't mask the run's own outcome; the events stay buffered for the next flush
+                print(f"Warning: could not flush ingestion log: {e}")
+            if self.dest.metrics_enabled and self.dest.metrics_textfile:
+                self.write_metrics(self.dest.metrics_textfile, jobs, status, metrics)
+            if profiler is not None:
+                profiler.report()
+                print(f"Profiles written to {profiler.run_dir}")
+        return status
+
+    @staticmethod
+    def _check_acyclic(jobs: list[ETLJob]):
+        """Raise ValueError, before anything runs, if depends_on has a cycle (Kahn's topological sort)."""
+        pending = {j.table: set(j.depends_on) for j in jobs}
+        ready = [name for name, deps in pending.items() if not deps]
+        while ready:
+            done = ready.pop()
+            del pending[done]
+            for name, deps in pending.items():
+                if done in deps:
+                    deps.discard(done)
+                    if not deps:
+                        ready.append(name)
+        if pending:
+            raise ValueError(f"Dependency cycle among ETL jobs {sorted(pending)}")
+
+    def write_metrics(self, path: str, jobs: list, status: dict[str, str], metrics: dict[str, StageMetrics]):
+        """Export one run's job metrics as a Prometheus textfile (a failed export only warns)."""
+        try:
+            write_textfile(path, [
+                dict(schema=j.schema, table=j.table, source=self.source_name,
+                     status=status.get(j.table, "skipped"), metrics=metrics.get(j.table))
+                for j in jobs
+            ])
+        except OSError as e:
+            print(f"Warning: could not write ETL metrics to {path}: {e}")
+
+    def _job_metrics(self) -> StageMetrics:
+        """The StageMetrics of the job running on this thread (NULL_METRICS outside run_jobs)."""
+        return getattr(self._local, "metrics", None) or NULL_METRICS
+
+    def _run_job(self, job: ETLJob, metrics: dict[str, StageMetrics] | None = None,
+                 profiler: JobProfiler | None = None):
+        job_metrics = self._local.metrics = self.dest.new_metrics()
+        if metrics is not None:
+            metrics[job.table] = job_metrics
+        try:
+            with profiler.job(job.schema, job.table) if profiler else nullcontext():
+                self._dispatch(job)
+        finally:
+            self._local.metrics = None
+            job_metrics.finish()
+
+    def _dispatch(self, job: ETLJob):
+        query = job.query or f"SELECT * FROM {job.table}"
+        if job.mode == "truncate_reload":
+            self.truncate_reload(
+                schema=job.schema,
+                table_name=job.table,
+                source_query=query,
+                batch_size=job.batch_size,
+                pipeline=job.pipeline
+            )
+        elif job.mode == "key_diff":
+            self.key_diff(
+                schema=job.schema,
+                table_name=job.table,
+                source_query=query,
+                key_fields=job.key_fields,
+                batch_size=job.batch_size,
+                pipeline=job.pipeline
+            )
+        else:
+            self.insert_latest(
+                schema=job.schema,
+                table_name=job.table,
+                source_query=query,
+                max_field=job.max_field,
+                batch_size=job.batch_size,
+                pipeline=job.pipeline
+            )
+
     def truncate_reload(self, 
         schema: str, 
         table_name: str, 
         source_query: str, 
-        batch_size: int = 10000):
+        batch_size: int = 10000,
+        pipeline: bool = False,
+        max_pending_pages: int = 4):
+        """
+        Replace the destination's contents with the source query's rows.
+
+        Tables with a ROW_HASH column are synced instead of truncated: only new and
+        changed rows are written and rows gone from the source are deleted, so a
+        reload of an unchanged table writes nothing.
+        """
+
+        if ROW_HASH_COLUMN in self.dest.table_metadata(schema, table_name).column_names:
+            metrics = self._job_metrics()
+            print(f"Extracting data from source with query: {source_query}")
+            if pipeline:
+                pages = prefetch(self.source.iter_query(source_query), max_pending_pages)
+            else:
+                with metrics.stage("extract"):
+                    pages = [self.source.query(source_query)]
+
+            inserted, updated, deleted = self.dest.sync_data(
+                schema,
+                table_name,
+                pages,
+                source=self.source_name,
+                batch_size=batch_size,
+                metrics=metrics,
+                raise_errors=True
+            )
+
+            print(f"Synced {schema}.{table_name} from {self.source_name}: "
+                  f"{inserted} inserted, {updated} updated, {deleted} deleted.\n")
+            return
 
         # truncate destination table
-        self.dest.truncate_table(schema, table_name, self.source_name)
+        self.dest.truncate_table(schema, table_name, self.source_name, raise_errors=True)
 
         # run insert
         self.insert_latest(
             schema=schema,
             table_name=table_name,
             source_query=source_query,
-            batch_size=batch_size
+            batch_size=batch_size,
+            pipeline=pipeline,
+            max_pending_pages=max_pending_pages
         )
 
     def insert_latest(self,
         schema: str,
         table_name: str,
         source_query: str,
-        max_field: str | None = None,
-        batch_size: int = 10000):
-        
+        max_field: str | list[str] | None = None,
+        batch_size: int = 10000,
+        pipeline: bool = False,
+        max_pending_pages: int = 4):
+        """
+        Load source rows past the destination's watermark on max_field.
+
+        max_field may be a list of columns, compared as a tuple (e.g. ["OrderDate", "OrderID"]).
+        The watermark is read from common."Watermarks", which every loaded batch advances;
+        if none is recorded yet it is rebuilt once from the destination table. Rows are
+        extracted ordered by max_field, so a failed load resumes after the last batch
+        that made it in without skipping rows. source_query may have its own WHERE (the
+        watermark condition is ANDed to it) and LIMIT, but no other ORDER BY.
+
+        With pipeline=True, source pages are extracted on a background thread while
+        earlier pages are being loaded; at most max_pending_pages pages are buffered.
+        """
+
         # extract data from souce, optionally filtering for latest records
+        fields = None
         if max_field:
-            max_value = self.dest.get_max_value(schema, table_name, max_field)
+            fields = [max_field] if isinstance(max_field, str) else list(max_field)
+            mark = self.dest.get_watermark(schema, table_name, fields)
+            if mark is None:
+                mark = self.dest.rebuild_watermark(schema, table_name, fields)
 
-            if max_value is not None:
-                if isinstance(max_value, int) or isinstance(max_value, float):
-                    source_query += f" WHERE {max_field} > {max_value}"
-                else:
-                    source_query += f" WHERE {max_field} > '{max_value}'"
+            # batches advance the watermark as they land, so they must arrive in its order
+            after = self._after_watermark(fields, mark) if mark is not None else None
+            source_query = extend_query(source_query, after, fields)
 
         print(f"Extracting data from source with query: {source_query}")
+        metrics = self._job_metrics()
 
-        data = self.source.query(source_query)
+        if pipeline:
+            # an extraction error surfaces inside the load, which re-raises it after logging
+            data = prefetch(self.source.iter_query(source_query), max_pending_pages)
+        else:
+            with metrics.stage("extract"):
+                data = self.source.query(source_query)
 
         # load data into destination
-        self.dest.insert_data(
+        inserted = self.dest.insert_data(
             schema, 
             table_name,
             data,
             source=self.source_name,
-            batch_size=batch_size
+            batch_size=batch_size,
+            watermark_fields=fields,
+            metrics=metrics,
+            raise_errors=True
+        )
+
+        print(f"Inserted {inserted} records into {schema}.{table_name} from {self.source_name}.\n")
+
+    def key_diff(self,
+        schema: str,
+        table_name: str,
+        source_query: str,
+        key_fields: list[str] | None = None,
+        batch_size: int = 10000,
+        keys_per_request: int = 50,
+        pipeline: bool = False,
+        max_pending_pages: int = 4):
+        """
+        Load only the source rows whose key is not in the destination yet, for tables
+        without a usable watermark.
+
+        Just the key columns are extracted first (an OData $select), anti-joined in memory
+        against the destination's keys, and full rows are then fetched for the missing keys
+        only, keys_per_request keys per filtered request. key_fields defaults to the
+        destination's natural-key unique index.
+        """
+        meta = self.dest.table_metadata(schema, table_name)
+        if key_fields:
+            keys = list(key_fields)
+        else:
+            dw_id_name = f"DW_{table_name.upper()}_ID"
+            keys = list(meta.natural_key([c for c in meta.column_names if c != dw_id_name]) or [])
+        if not keys:
+            raise ValueError(f"key_diff needs key_fields for {schema}.{table_name} (no natural-key unique index)")
+        key_types = [meta.column(k) for k in keys]
+
+        key_query = re.sub(r"(?is)^\s*SELECT\s+.+?\s+FROM\s+", f"SELECT {', '.join(keys)} FROM ", source_query, count=1)
+        print(f"Extracting keys from source with query: {key_query}")
+
+        source = self.source
+        metrics = self._job_metrics()
+        with metrics.stage("extract"):
+            source_keys = source.query(key_query)
+        source_keys = coerce_frame(source_keys.reindex(columns=keys), key_types)
+        dw_keys = coerce_frame(
+            self.dest.query_builder(schema=schema, table=table_name, columns=keys).reindex(columns=keys),
+            key_types
+        )
+
+        # hash anti-join on the key tuples
+        is_new = ~pd.MultiIndex.from_frame(source_keys).isin(pd.MultiIndex.from_frame(dw_keys))
+        missing = source_keys[is_new].drop_duplicates()
+        print(f"{len(missing)} of {len(source_keys)} source keys are missing from {schema}.{table_name}.")
+        if missing.empty:
+            return
+
+        def pages():
+            for start in range(0, len(missing), keys_per_request):
+                chunk = missing.iloc[start:start + keys_per_request]
+                yield source.query(extend_query(source_query, self._key_filter(keys, chunk)))
+
+        inserted = self.dest.insert_data(
+            schema,
+            table_name,
+            prefetch(pages(), max_pending_pages) if pipeline else pages(),
+            source=self.source_name,
+            batch_size=batch_size,
+            metrics=metrics,
+            raise_errors=True
         )
 
-        print(f"Inserted {len(data)} records into {schema}.{table_name} from {self.source_name}.\n")
+        print(f"Inserted {inserted} records into {schema}.{table_name} from {self.source_name}.\n")
+
+    @staticmethod
+    def _key_filter(fields: list[str], keys: pd.DataFrame) -> str:
+        """WHERE condition matching exactly the key tuples in keys (IN list for a single field)."""
+        if len(fields) == 1:
+            return f"{fields[0]} IN ({', '.join(_sql_literal(v) for v in keys[fields[0]])})"
+        return " OR ".join(
+            "(" + " AND ".join(f"{f} = {_sql_literal(v)}" for f, v in zip(fields, row)) + ")"
+            for row in keys[fields].itertuples(index=False)
+        )
 
+    @staticmethod
+    def _after_watermark(fields: list[str], values: list) -> str:
+        """
+        WHERE condition for rows strictly after values on fields, compared as a tuple:
+        a > x OR (a = x AND b > y) ...
+        """
+        terms = []
+        for i, field in enumerate(fields):
+            equal = [f"{f} = {_sql_literal(v)}" for f, v in zip(fields[:i], values[:i])]
+            term = " AND ".join(equal + [f"{field} > {_sql_literal(values[i])}"])
+            terms.append(f"({term})" if equal else term)
+        return " OR ".join(terms)
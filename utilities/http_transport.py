@@ -0,0 +1,216 @@
+"""
+HTTP transport for OData sources.
+
+make_session() returns a requests.Session whose connection pool is sized to
+the extraction concurrency, that retries idempotent requests on 429/5xx with
+jittered exponential backoff (honouring Retry-After), asks for gzip, and, with
+a cache directory, keeps GET responses that carry an ETag or Last-Modified on
+disk. Cached responses are revalidated with If-None-Match / If-Modified-Since,
+so an unchanged entity set costs a 304 and is replayed from disk.
+
+Only unfiltered GETs are cached ($metadata, whole reference entity sets and
+their pages): watermark and key filters make URLs that rarely repeat. The
+directory is kept under a size cap by evicting the least recently used entries.
+"""
+import hashlib
+import json
+import os
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+DEFAULT_RETRIES = 5
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_BACKOFF_JITTER = 0.5
+DEFAULT_CACHE_MAX_BYTES = 256 * 2**20
+
+# response headers worth replaying; the body is stored decoded, so no Content-Encoding/Length
+_CACHED_HEADERS = ("Content-Type", "ETag", "Last-Modified", "OData-Version")
+
+
+class _CacheWriter:
+    """
+    File-like wrapper around a urllib3 response that copies the decoded body to a
+    temporary file as it is read, and moves it into the cache once fully read.
+    A response that is abandoned part way (closed early) leaves no cache entry.
+    """
+
+    def __init__(self, raw, path: str, meta: dict, on_complete=None):
+        self._raw = raw
+        self._path = path
+        self._on_complete = on_complete
+        self._tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self._file = open(self._tmp, "wb")
+        self._file.write(json.dumps(meta).encode("utf-8") + b"\n")
+
+    def read(self, amt=None):
+        chunk = self._raw.read(amt, decode_content=True)
+        if self._file is not None:
+            if chunk:
+                self._file.write(chunk)
+            else:
+                self._file.close()
+                self._file = None
+                os.replace(self._tmp, self._path)
+                if self._on_complete is not None:
+                    self._on_complete()
+        return chunk
+
+    def _discard(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            try:
+                os.remove(self._tmp)
+            except OSError:
+                pass
+
+    def close(self):
+        self._discard()
+        self._raw.close()
+
+    def release_conn(self):
+        self._discard()
+        self._raw.release_conn()
+
+
+class CachingHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter with a conditional-GET disk cache keyed by URL (incl. query string) and
+    content headers, for unfiltered GETs, holding at most max_bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_CACHE_MAX_BYTES, **kwargs):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._evict_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        super().__init__(**kwargs)
+
+    @staticmethod
+    def _cacheable(request) -> bool:
+        return request.method == "GET" and "$filter" not in parse_qs(urlsplit(request.url).query)
+
+    def _evict(self):
+        """Remove the least recently used entries until the cache fits in max_bytes."""
+        with self._evict_lock:
+            entries = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(".cache"):
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+
+    def _cache_path(self, request) -> str:
+        key = "\n".join((request.url, request.headers.get("Accept", ""), request.headers.get("Prefer", "")))
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".cache")
+
+    def send(self, request, stream=False, **kwargs):
+        if not self._cacheable(request):
+            return super().send(request, stream=stream, **kwargs)
+
+        path = self._cache_path(request)
+        cached = None
+        try:
+            # keep the handle: a concurrent refresh replaces the file, it doesn't change this one
+            cached = open(path, "rb")
+            meta = json.loads(cached.readline())
+        except (OSError, ValueError):
+            if cached is not None:
+                cached.close()
+            cached = None
+        if cached is not None:
+            if meta.get("etag"):
+                request.headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                request.headers["If-Modified-Since"] = meta["last_modified"]
+
+        resp = super().send(request, stream=stream, **kwargs)
+
+        if cached is not None and resp.status_code == 304:
+            # a 304 has no body: hand the connection straight back to the pool
+            resp.raw.drain_conn()
+            resp.raw.release_conn()
+            resp.status_code = 200
+            resp.reason = "OK (cached)"
+            resp.headers = CaseInsensitiveDict(meta["headers"])
+            resp.raw = cached
+            resp.from_cache = True
+            try:
+                # recently used, so evicted last
+                os.utime(path)
+            except OSError:
+                pass
+        else:
+            if cached is not None:
+                cached.close()
+            etag = resp.headers.get("ETag")
+            last_modified = resp.headers.get("Last-Modified")
+            if resp.status_code == 200 and (etag or last_modified):
+                meta = {
+                    "url": request.url,
+                    "etag": etag,
+                    "last_modified": last_modified,
+                    "headers": {h: resp.headers[h] for h in _CACHED_HEADERS if h in resp.headers},
+                }
+                try:
+                    resp.raw = _CacheWriter(resp.raw, path, meta, on_complete=self._evict)
+                except OSError as e:
+                    print(f"Warning: could not write HTTP cache entry {path}: {e}")
+            resp.from_cache = False
+        return resp
+
+
+def make_session(
+    pool_size: int = 10,
+    retries: int = DEFAULT_RETRIES,
+    backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+    backoff_jitter: float = DEFAULT_BACKOFF_JITTER,
+    cache_dir: str | None = None,
+    cache_max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+) -> requests.Session:
+    """
+    A Session for pool_size concurrent requests to one host.
+    GET/HEAD requests are retried up to `retries` times on connection errors and
+    429/5xx, waiting backoff_factor * 2**n (+ up to backoff_jitter) seconds, or as
+    long as the server's Retry-After asks. With cache_dir, responses are cached
+    and revalidated there, up to cache_max_bytes (see CachingHTTPAdapter).
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        backoff_jitter=backoff_jitter,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=True,
+        # hand the last 429/5xx back so raise_for_status reports it
+        raise_on_status=False,
+    )
+    adapter_kwargs = dict(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    if cache_dir:
+        adapter = CachingHTTPAdapter(cache_dir, max_bytes=cache_max_bytes, **adapter_kwargs)
+    else:
+        adapter = HTTPAdapter(**adapter_kwargs)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    return session
@@ -0,0 +1,167 @@
+"""
+Buffered writer for common."IngestionLog".
+
+Ingestion events are collected in memory and written with one multi-row
+INSERT when `flush_every` events are pending, every `flush_interval`
+seconds, on an explicit flush(), and at interpreter exit. One buffer is
+shared by every Postgres instance on the same connection pool.
+
+Writes happen on a background thread (or the caller of flush()), never in
+add(): a load logging its outcome neither waits on the log table nor fails
+because of it. While the log can't be written, at most `max_pending` events
+are kept; the oldest are dropped beyond that, with a warning.
+
+With metrics on, each row also carries the load's stage timings and counters
+(METRIC_COLUMNS, see utilities.metrics).
+"""
+import atexit
+import threading
+from datetime import datetime, timezone
+
+from psycopg2.extras import execute_values
+
+from utilities.metrics import NULL_METRICS
+
+INSERT_SQL = """
+    INSERT INTO common."IngestionLog" (
+        "SOURCE_NAME", "SCHEMA_NAME", "TABLE_NAME",
+        "StartTime", "EndTime",
+        "ImportCount", "UpdateCount", "Status", "ErrorMessage", "Type"{metric_columns}
+    )
+    VALUES %s
+"""
+
+# in StageMetrics.log_values() order
+METRIC_COLUMNS = (
+    "ExtractMillis", "TransformMillis", "LoadMillis", "CommitMillis",
+    "BytesIn", "Batches", "PeakRssBytes"
+)
+
+DEFAULT_FLUSH_EVERY = 100
+DEFAULT_FLUSH_INTERVAL = 5.0
+DEFAULT_MAX_PENDING = 10_000
+
+_buffers: dict[int, "IngestionLogBuffer"] = {}
+_buffers_lock = threading.Lock()
+
+
+class IngestionLogBuffer:
+    def __init__(self, pool, flush_every: int = DEFAULT_FLUSH_EVERY, flush_interval: float | None = DEFAULT_FLUSH_INTERVAL,
+                 metrics: bool = False, max_pending: int = DEFAULT_MAX_PENDING):
+        self.pool = pool
+        self.flush_every = max(1, flush_every)
+        self.max_pending = max(self.flush_every, max_pending)
+        # without metrics the statement doesn't name the metric columns, so older tables still work
+        self.metrics = metrics
+        self.insert_sql = INSERT_SQL.format(
+            metric_columns="".join(f', "{c}"' for c in METRIC_COLUMNS) if metrics else ""
+        )
+        self._events: list[tuple] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+        # flushes every flush_interval seconds (if set) and whenever add() fills the buffer
+        flusher = threading.Thread(target=self._flush_in_background, args=(flush_interval or None,),
+                                   name="ingestion-log-flush", daemon=True)
+        flusher.start()
+
+        # don't lose buffered events on exit (runs before the pools are closed)
+        atexit.register(self.close)
+
+    def add(
+        self,
+        source: str,
+        schema: str,
+        table: str,
+        start_time: datetime | None,
+        end_time: datetime | None,
+        insert_count: int,
+        update_count: int,
+        success: bool,
+        err_msg: str,
+        operation: str,
+        metrics=NULL_METRICS
+    ):
+        now = datetime.now(timezone.utc)
+        event = (
+            source, schema, table,
+            start_time or now, end_time or now,
+            insert_count or 0, update_count or 0, bool(success),
+            str(err_msg) if err_msg else None,
+            str(operation) if operation else "UNKNOWN"
+        )
+        if self.metrics:
+            event += metrics.log_values()
+        with self._lock:
+            self._events.append(event)
+            full = len(self._events) >= self.flush_every
+            self._drop_oldest()
+        if full:
+            self._wake.set()
+
+    def _drop_oldest(self):
+        """Keep at most max_pending events (called with _lock held)."""
+        excess = len(self._events) - self.max_pending
+        if excess > 0:
+            del self._events[:excess]
+            print(f"Warning: ingestion log backlog over {self.max_pending} events, dropped the {excess} oldest.")
+
+    def flush(self):
+        """Write all pending events in one statement."""
+        with self._flush_lock:
+            with self._lock:
+                events, self._events = self._events, []
+            if not events:
+                return
+
+            try:
+                with self.pool.connection() as conn, conn.cursor() as cur:
+                    execute_values(cur, self.insert_sql, events, page_size=len(events))
+            except Exception:
+                # keep them for the next attempt, oldest first
+                with self._lock:
+                    self._events[:0] = events
+                    self._drop_oldest()
+                raise
+
+    def _flush_in_background(self, interval: float | None):
+        while True:
+            self._wake.wait(interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Warning: could not flush ingestion log: {e}")
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Warning: {len(self._events)} ingestion log events could not be written: {e}")
+
+
+def get_log_buffer(pool, flush_every: int | None = None, flush_interval: float | None = None,
+                   metrics: bool = False, max_pending: int | None = None) -> IngestionLogBuffer:
+    """Return the shared buffer for a connection pool, creating it on first use."""
+    buf = _buffers.get(id(pool))
+    if buf is not None:
+        return buf
+
+    with _buffers_lock:
+        buf = _buffers.get(id(pool))
+        if buf is None:
+            buf = IngestionLogBuffer(
+                pool,
+                flush_every=flush_every or DEFAULT_FLUSH_EVERY,
+                flush_interval=DEFAULT_FLUSH_INTERVAL if flush_interval is None else flush_interval,
+                metrics=metrics,
+                max_pending=max_pending or DEFAULT_MAX_PENDING
+            )
+            _buffers[id(pool)] = buf
+    return buf
@@ -0,0 +1,236 @@
+"""
+Stage-level load metrics.
+
+A StageMetrics collects, for one load (or one ETL job), the time spent in
+each stage - extract (waiting for source rows), transform (coercion, row
+hashes, de-duplication, COPY encoding), load (COPY and the move into the
+table) and commit - plus the bytes COPY'd, the number of batches and the
+process's peak RSS. Stages nest: time spent in an inner stage is not also
+counted in the outer one.
+
+NULL_METRICS has the same interface and records nothing; it is what
+Postgres.new_metrics() hands out while postgres.metrics.enabled is off, so
+disabled instrumentation costs a few no-op calls per batch.
+
+write_textfile() renders finished job metrics in the Prometheus text format
+for the node exporter's textfile collector.
+"""
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+STAGES = ("extract", "transform", "load", "commit")
+
+
+def peak_rss_bytes() -> int | None:
+    """High-water mark of this process's resident set size, None where the platform doesn't report it."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _Stage:
+    __slots__ = ("metrics", "name")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.metrics.start(self.name)
+
+    def __exit__(self, *exc):
+        self.metrics.stop()
+
+
+class StageMetrics:
+    enabled = True
+
+    def __init__(self):
+        self.millis = dict.fromkeys(STAGES, 0.0)
+        self.bytes_in = 0
+        self.batches = 0
+        self.inserted = 0
+        self.updated = 0
+        self.deleted = 0
+        self.elapsed_ms = 0.0
+        self.peak_rss = None
+        self._created = time.perf_counter()
+        # open stages: [name, started, seconds spent in nested stages]
+        self._open = []
+
+    # ---------- timing ----------
+
+    def start(self, name: str):
+        self._open.append([name, time.perf_counter(), 0.0])
+
+    def stop(self):
+        name, started, nested = self._open.pop()
+        elapsed = time.perf_counter() - started
+        self.millis[name] += (elapsed - nested) * 1000
+        if self._open:
+            self._open[-1][2] += elapsed
+
+    def stage(self, name: str) -> _Stage:
+        """Context manager timing its block as stage `name`."""
+        return _Stage(self, name)
+
+    def timed(self, iterable, name: str):
+        """Iterate iterable, timing each step of it (not the consumer's work in between) as stage `name`."""
+        it = iter(iterable)
+        while True:
+            self.start(name)
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                self.stop()
+            yield item
+
+    # ---------- counters ----------
+
+    def add_batch(self, nbytes: int):
+        self.batches += 1
+        self.bytes_in += nbytes
+
+    def add_rows(self, inserted: int = 0, updated: int = 0, deleted: int = 0):
+        self.inserted += inserted
+        self.updated += updated
+        self.deleted += deleted
+
+    def merge(self, other: "StageMetrics"):
+        """Add another (finished) load's stage times and counters to these."""
+        if not other.enabled:
+            return
+        for name, ms in other.millis.items():
+            self.millis[name] += ms
+        self.bytes_in += other.bytes_in
+        self.batches += other.batches
+        self.add_rows(other.inserted, other.updated, other.deleted)
+
+    def finish(self):
+        """Stop the clock: wall time since creation and the process's peak RSS so far."""
+        self.elapsed_ms = (time.perf_counter() - self._created) * 1000
+        self.peak_rss = peak_rss_bytes()
+        return self
+
+    @property
+    def rows_per_second(self) -> float | None:
+        if not self.elapsed_ms:
+            return None
+        return (self.inserted + self.updated + self.deleted) * 1000 / self.elapsed_ms
+
+    def log_values(self) -> tuple:
+        """Values of the metric columns of common."IngestionLog" (see ingestion_log.METRIC_COLUMNS)."""
+        return (
+            *(round(self.millis[s]) for s in STAGES),
+            self.bytes_in, self.batches, self.peak_rss
+        )
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self): pass
+    def __exit__(self, *exc): pass
+
+
+class NullMetrics(StageMetrics):
+    """StageMetrics that records nothing."""
+    enabled = False
+    _stage = _NullStage()
+
+    def start(self, name): pass
+    def stop(self): pass
+    def stage(self, name): return self._stage
+    def timed(self, iterable, name): return iterable
+    def add_batch(self, nbytes): pass
+    def add_rows(self, inserted=0, updated=0, deleted=0): pass
+    def merge(self, other): pass
+    def finish(self): return self
+
+    def log_values(self) -> tuple:
+        return (None,) * (len(STAGES) + 3)
+
+
+NULL_METRICS = NullMetrics()
+
+
+# ---------- Prometheus textfile ----------
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_label(v)}"' for k, v in labels.items()) + "}"
+
+
+def format_prometheus(jobs: list[dict], prefix: str = "dw_etl") -> str:
+    """
+    Text exposition of one run: jobs are dicts with schema, table, source, status
+    and metrics (a finished StageMetrics, or None for a job that never ran).
+    """
+    families = {
+        "stage_seconds": ("Time spent in each load stage.", []),
+        "rows": ("Rows written, by kind.", []),
+        "bytes_in": ("Bytes sent to PostgreSQL through COPY.", []),
+        "batches": ("COPY batches loaded.", []),
+        "rows_per_second": ("Rows written per second of job wall time.", []),
+        "job_duration_seconds": ("Wall time of the job.", []),
+        "job_success": ("1 if the job completed, 0 if it failed or was skipped.", []),
+    }
+
+    def sample(family, value, **labels):
+        if value is not None:
+            value = round(value, 6) if isinstance(value, float) else value
+            families[family][1].append(f"{prefix}_{family}{_labels(**labels)} {value}")
+
+    peak = None
+    for job in jobs:
+        base = dict(schema=job["schema"], table=job["table"], source=job["source"])
+        sample("job_success", 1 if job["status"] == "ok" else 0, **base)
+        m = job.get("metrics")
+        if m is None or not m.enabled:
+            continue
+        for stage in STAGES:
+            sample("stage_seconds", m.millis[stage] / 1000, **base, stage=stage)
+        for kind in ("inserted", "updated", "deleted"):
+            sample("rows", getattr(m, kind), **base, kind=kind)
+        sample("bytes_in", m.bytes_in, **base)
+        sample("batches", m.batches, **base)
+        sample("rows_per_second", m.rows_per_second, **base)
+        sample("job_duration_seconds", m.elapsed_ms / 1000, **base)
+        if m.peak_rss is not None:
+            peak = max(peak or 0, m.peak_rss)
+
+    lines = []
+    for family, (help_text, samples) in families.items():
+        if samples:
+            lines += [f"# HELP {prefix}_{family} {help_text}", f"# TYPE {prefix}_{family} gauge", *samples]
+    if peak is not None:
+        lines += [f"# HELP {prefix}_peak_rss_bytes Peak resident set size of the ETL process.",
+                  f"# TYPE {prefix}_peak_rss_bytes gauge", f"{prefix}_peak_rss_bytes {peak}"]
+    lines += [f"# HELP {prefix}_last_run_timestamp_seconds When the last ETL run finished.",
+              f"# TYPE {prefix}_last_run_timestamp_seconds gauge",
+              f"{prefix}_last_run_timestamp_seconds {time.time():.3f}"]
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: str, jobs: list[dict]):
+    """Write format_prometheus(jobs) to path atomically (the collector must never read a partial file)."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8", newline="\n") as f:
+        f.write(format_prometheus(jobs))
+    os.replace(tmp, path)
@@ -1,15 +1,57 @@
-import requests
 import pandas as pd
-import re
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+from utilities.http_transport import make_session
+from utilities.odata_filter import translate_query, translate_where
+from utilities.odata_metadata import DATETIME_TYPES, build_frame, load_metadata
+from utilities.odata_stream import ColumnBuffer, PageReader
 
 BASE_URL = ""
 
 class OData:
-    def __init__(self, url: str):
+    # how DATE/TIMESTAMP '...' literals in WHERE, and ISO strings compared with date/time
+    # properties of the entity set, are sent: None (quoted strings), "v4" (bare
+    # DateTimeOffset literals) or "v2" (datetime'...')
+    DATETIME_LITERALS = None
+
+    # pages are decoded with the EDM types from $metadata (cached here on disk, refreshed
+    # after METADATA_MAX_AGE seconds)
+    METADATA_CACHE_DIR = None
+    METADATA_MAX_AGE = 24 * 3600
+    # after a failed $metadata fetch, queries decode untyped for this many seconds before retrying
+    METADATA_RETRY_AFTER = 60
+
+    # response bodies are decoded as they arrive, this many bytes at a time
+    STREAM_CHUNK_SIZE = 64 * 1024
+
+    # transient failures (connection errors, 429, 5xx) are retried with jittered
+    # exponential backoff, honouring Retry-After; with HTTP_CACHE_DIR, unfiltered
+    # responses carrying an ETag/Last-Modified are kept there (up to HTTP_CACHE_MAX_BYTES)
+    # and revalidated (304 = replay)
+    RETRIES = 5
+    BACKOFF_FACTOR = 0.5
+    HTTP_CACHE_DIR = None
+    HTTP_CACHE_MAX_BYTES = 256 * 2**20
+
+    def __init__(self, url: str, max_connections: int = 10, typed: bool = True):
         if not url:
             raise ValueError("URL must be provided (pass one or subclass OData).")
         self.base_url = url.rstrip("/")
-        self.session = requests.Session()
+
+        # keep-alive pool large enough for parallel range extraction
+        self.session = make_session(
+            pool_size=max_connections,
+            retries=self.RETRIES,
+            backoff_factor=self.BACKOFF_FACTOR,
+            cache_dir=self.HTTP_CACHE_DIR,
+            cache_max_bytes=self.HTTP_CACHE_MAX_BYTES
+        )
+        self.max_connections = max_connections
+        self.typed = typed
+        self._metadata_retry_at = 0.0
 
     def close(self):
         self.session.close()
@@ -17,156 +59,175 @@ class OData:
     # ---------- internals ----------
 
     def _sql_where_to_odata(self, where_sql: str) -> str | None:
+        """Convert a SQL WHERE condition into an OData $filter (see utilities.odata_filter)."""
+        return translate_where(where_sql, self.DATETIME_LITERALS)
+
+    def _build_request(self, query: str):
         """
-        Convert a simple SQL WHERE into an OData $filter.
-        Supports:
-          - = != <> < <= > >=  →  eq ne lt le gt ge
-          - AND / OR
-          - IS NULL / IS NOT NULL
-          - IN (...) / NOT IN (...)
-          - LIKE '%x', 'x%', '%x%'  → endswith/startswith/contains
-          - Keeps numbers unquoted; quotes strings safely
+        Translate a simple SQL-like query into (entity_set, params, limit).
         """
-        s = where_sql.strip()
-        # remove trailing ORDER BY / LIMIT if present (handled elsewhere)
-        s = re.split(r"\bORDER\s+BY\b|\bLIMIT\b", s, flags=re.IGNORECASE)[0].strip()
-
-        def odata_lit(tok: str) -> str:
-            t = tok.strip()
-            # already quoted?
-            if re.fullmatch(r"'([^']|'')*'", t):
-                inner = t[1:-1].replace("'", "''")
-                return f"'{inner}'"
-            # number?
-            if re.fullmatch(r"\d+(?:\.\d+)?", t):
-                return t
-            # booleans / null
-            low = t.lower()
-            if low in ("null", "true", "false"):
-                return low
-            # fall back: treat as string
-            return "{}".format("'" + t.replace("'", "''") + "'")
-
-        # map basic operators and boolean connectors (longest first)
-        for pat, rep in [
-            (r"(?i)\bIS\s+NOT\s+NULL\b", " ne null"),
-            (r"(?i)\bIS\s+NULL\b",      " eq null"),
-            (r">=", " ge "),
-            (r"<=", " le "),
-            (r"<>", " ne "),
-            (r"!=", " ne "),
-            (r"=",  " eq "),
-            (r">",  " gt "),
-            (r"<",  " lt "),
-            (r"(?i)\bAND\b", " and "),
-            (r"(?i)\bOR\b",  " or "),
-        ]:
-            s = re.sub(pat, rep, s)
-
-        # IN / NOT IN
-        def repl_in(m):
-            col = m.group("col").strip()
-            is_not = bool(m.group("not"))
-            vals_raw = m.group("vals")
-            # split items respecting quotes
-            items = [x.strip() for x in re.findall(r"'(?:[^']|'')*'|[^,]+", vals_raw) if x.strip()]
-            lits = [odata_lit(x) for x in items]
-            if not lits:
-                return "(1 eq 1)" if is_not else "(1 eq 0)"
-            if is_not:
-                return "(" + " and ".join(f"{col} ne {v}" for v in lits) + ")"
-            return "(" + " or ".join(f"{col} eq {v}" for v in lits) + ")"
-
-        s = re.sub(
-            r"(?is)(?P<col>[A-Za-z_][A-Za-z0-9_\.]*)\s+(?P<not>NOT\s+)?IN\s*\(\s*(?P<vals>[^)]*)\s*\)",
-            repl_in,
-            s,
-        )
-
-        # LIKE
-        def like_cb(m):
-            col = m.group("col").strip()
-            lit = odata_lit(m.group("lit"))
-            inner = lit[1:-1]  # remove quotes
-            if inner.startswith("%") and inner.endswith("%"):
-                return f"contains({col}, {lit})"
-            if inner.endswith("%"):
-                return f"startswith({col}, '{inner[:-1]}')"
-            if inner.startswith("%"):
-                return f"endswith({col}, '{inner[1:]}')"
-            return f"{col} eq {lit}"
-
-        s = re.sub(
-            r"(?is)(?P<col>[A-Za-z_][A-Za-z0-9_\.]*)\s+LIKE\s+(?P<lit>'(?:[^']|'')*')",
-            like_cb,
-            s,
-        )
-
-        # unquote numeric literals for gt/ge/lt/le
-        s = re.sub(
-            r"(\b[A-Za-z_][A-Za-z0-9_\.]*\b)\s+(gt|ge|lt|le)\s+'(\d+(?:\.\d+)?)'",
-            lambda m: f"{m.group(1)} {m.group(2)} {m.group(3)}",
-            s,
-        )
-
-        s = re.sub(r"\s+", " ", s).strip()
-        return s or None
+        q = translate_query(query, self.DATETIME_LITERALS)
+        if self.DATETIME_LITERALS is not None:
+            # which strings are dates depends on the columns they are compared with
+            properties = self._metadata_properties(q.table) or {}
+            datetime_columns = frozenset(name for name, (edm_type, _) in properties.items() if edm_type in DATETIME_TYPES)
+            if datetime_columns:
+                q = translate_query(query, self.DATETIME_LITERALS, datetime_columns)
 
-    def _extract_select_from_where_order_limit(self, query: str):
+        # Build params dict without None values
+        params = {"$format": "json"}
+        if q.select:
+            params["$select"] = q.select
+        if q.filter:
+            params["$filter"] = q.filter
+        if q.orderby:
+            params["$orderby"] = q.orderby
+        if q.top is not None:
+            params["$top"] = q.top
+
+        return q.table, params, q.top
+
+    def _next_link(self, payload: dict, url: str) -> str | None:
+        # v4 JSON, v3 JSON light, v2 verbose JSON
+        link = payload.get("@odata.nextLink") or payload.get("odata.nextLink")
+        if not link and isinstance(payload.get("d"), dict):
+            link = payload["d"].get("__next")
+        if not link:
+            return None
+        # servers may answer with a link relative to the service root, e.g. "Customers?$skiptoken='ERNSH'"
+        return urljoin(self.base_url + "/", link)
+
+    def _entity_properties(self, entity: str | None) -> dict | None:
+        """{property: [EDM type, scale]} of an entity set, or None to fall back to untyped pages."""
+        return self._metadata_properties(entity) if self.typed else None
+
+    def _metadata_properties(self, entity: str | None) -> dict | None:
+        """{property: [EDM type, scale]} of an entity set from $metadata, None if unknown or unavailable."""
+        if not entity or time.monotonic() < self._metadata_retry_at:
+            return None
+        try:
+            entity_sets = load_metadata(self.session, self.base_url, self.METADATA_CACHE_DIR, self.METADATA_MAX_AGE)
+        except Exception as e:
+            # possibly transient: later queries try again once the backoff has passed
+            self._metadata_retry_at = time.monotonic() + self.METADATA_RETRY_AFTER
+            print(f"Warning: no usable $metadata at {self.base_url} ({e}); querying {entity} without its types, "
+                  f"retrying in {self.METADATA_RETRY_AFTER}s.")
+            return None
+        return entity_sets.get(entity)
+
+    @staticmethod
+    def _page_frame(properties: dict | None, page: ColumnBuffer) -> pd.DataFrame:
+        if properties is None:
+            return pd.DataFrame(page.columns)
+        return build_frame(page.columns, properties)
+
+    def _iter_pages(self, url: str, params: dict | None, limit: int | None = None, page_size: int | None = None,
+                    entity: str | None = None):
         """
-        Parse a lightweight SQL: SELECT ... FROM table [WHERE ...] [ORDER BY ...] [LIMIT n]
-        Returns (fields, table, where_clause, order_by, limit)
+        Yield one DataFrame per server page, following nextLink until exhausted or `limit` rows.
+        Each body is parsed as it streams in, record by record into per-column buffers;
+        pages of a known entity set are built with its $metadata types.
         """
-        m_fields = re.search(r"SELECT\s+(.*?)\s+FROM\b", query, re.IGNORECASE | re.DOTALL)
-        m_from   = re.search(r"\bFROM\s+([A-Za-z_][A-Za-z0-9_\.]*)", query, re.IGNORECASE)
-        if not (m_fields and m_from):
-            raise ValueError("Invalid query")
+        headers = {"Prefer": f"odata.maxpagesize={page_size}"} if page_size else None
+        fetched = 0
+        # once per query, so all its pages get the same dtypes
+        properties = self._entity_properties(entity)
+
+        while url:
+            page = ColumnBuffer()
+            with self.session.get(url, params=params, headers=headers, stream=True) as resp:
+                resp.raise_for_status()
+                reader = PageReader(resp.iter_content(self.STREAM_CHUNK_SIZE))
+                for record in reader:
+                    if limit is not None and fetched + len(page) >= limit:
+                        break
+                    page.append(record)
+                payload = reader.payload
+
+            if len(page):
+                yield self._page_frame(properties, page)
+            fetched += len(page)
+
+            if limit is not None and fetched >= limit:
+                return
+
+            # the nextLink already carries the full query plus $skiptoken
+            url = self._next_link(payload, url)
+            params = None
 
-        fields = m_fields.group(1).strip()
-        table  = m_from.group(1).split(".")[-1]
-
-        # WHERE (until ORDER BY or LIMIT or end)
-        m_where = re.search(r"\bWHERE\s+(.+?)(?=\bORDER\s+BY\b|\bLIMIT\b|$)", query, re.IGNORECASE | re.DOTALL)
-        where_clause = m_where.group(1).strip() if m_where else None
-
-        # ORDER BY
-        m_order = re.search(r"\bORDER\s+BY\s+(.+?)(?=\bLIMIT\b|$)", query, re.IGNORECASE | re.DOTALL)
-        order_by = m_order.group(1).strip() if m_order else None
+    # ---------- public ----------
 
-        # LIMIT
-        m_limit = re.search(r"\bLIMIT\s+(\d+)\b", query, re.IGNORECASE)
-        limit = int(m_limit.group(1)) if m_limit else None
+    def iter_query(self, query: str, page_size: int | None = None):
+        """
+        Stream a simple SQL-like query page by page, yielding one DataFrame per server page.
+        Follows @odata.nextLink ($skiptoken) server-driven paging; page_size asks the server
+        for a page size via `Prefer: odata.maxpagesize`.
+        """
+        table, params, limit = self._build_request(query)
+        yield from self._iter_pages(f"{self.base_url}/{table}", params, limit=limit, page_size=page_size, entity=table)
 
-        return fields, table, where_clause, order_by, limit
+    def count(self, query: str) -> int:
+        """Number of rows a query would return, via the entity set's /$count (honours WHERE and LIMIT)."""
+        table, params, limit = self._build_request(query)
+        count_params = {k: v for k, v in params.items() if k == "$filter"}
 
-    # ---------- public ----------
+        resp = self.session.get(f"{self.base_url}/{table}/$count", params=count_params)
+        resp.raise_for_status()
+        # strip a UTF-8 BOM some servers prepend to the plain-text count
+        n = int(resp.content.decode("utf-8-sig").strip())
+        return min(n, limit) if isinstance(limit, int) else n
+
+    def iter_query_parallel(
+        self,
+        query: str,
+        partitions: int = 4,
+        order_by: str | None = None,
+        max_workers: int | None = None
+    ):
+        """
+        Split a query into `partitions` $skip/$top ranges and fetch them concurrently.
+        Ranges need a stable order: the query's ORDER BY, or `order_by` (ideally the key).
+        Yields one DataFrame per range, always in range order, so the result is deterministic.
+        """
+        table, params, limit = self._build_request(query)
+        if order_by:
+            params["$orderby"] = order_by
+        if "$orderby" not in params:
+            raise ValueError("Parallel extraction needs a stable ORDER BY (pass order_by=<key column>).")
+
+        total = self.count(query)
+        if total == 0:
+            return
+        partitions = max(1, min(partitions, total))
+        size = math.ceil(total / partitions)
+        url = f"{self.base_url}/{table}"
+
+        def fetch(skip: int) -> pd.DataFrame:
+            top = min(size, total - skip)
+            pages = list(self._iter_pages(url, {**params, "$skip": skip, "$top": top}, limit=top, entity=table))
+            return pd.concat(pages, ignore_index=True) if pages else pd.DataFrame()
+
+        workers = min(max_workers or self.max_connections, partitions)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="odata-range") as pool:
+            # map() returns results in submission order regardless of completion order
+            yield from pool.map(fetch, range(0, total, size))
+
+    def query_parallel(self, query: str, partitions: int = 4, order_by: str | None = None,
+                       max_workers: int | None = None) -> pd.DataFrame:
+        """Concatenated result of iter_query_parallel."""
+        ranges = [df for df in self.iter_query_parallel(query, partitions, order_by, max_workers) if not df.empty]
+        if not ranges:
+            return pd.DataFrame()
+        return pd.concat(ranges, ignore_index=True)
 
     def query(self, query: str) -> pd.DataFrame:
         """
         Accept a simple SQL-like query, convert to OData params, call the API, and return a DataFrame.
         Supports WHERE with eq/ne/lt/le/gt/ge, AND/OR, IN/NOT IN, LIKE, IS [NOT] NULL.
         Also maps ORDER BY -> $orderby and LIMIT -> $top.
+        All server pages are fetched; use iter_query to process them as they arrive.
         """
-        fields, table, where_clause, order_by, limit = self._extract_select_from_where_order_limit(query)
-
-        # $select: omit if "*"
-        select_param = None if fields == "*" else fields
-
-        # $filter
-        filter_param = self._sql_where_to_odata(where_clause) if where_clause else None
-
-        # Build params dict without None values
-        params = {"$format": "json"}
-        if select_param:
-            params["$select"] = select_param
-        if filter_param:
-            params["$filter"] = filter_param
-        if order_by:
-            # pass through as-is; simple "col [ASC|DESC], col2 ..."
-            params["$orderby"] = order_by
-        if isinstance(limit, int):
-            params["$top"] = limit
-
-        resp = self.session.get(f"{self.base_url}/{table}", params=params)
-        resp.raise_for_status()
-        return pd.json_normalize(resp.json().get("value", []))
\ No newline at end of file
+        pages = list(self.iter_query(query))
+        if not pages:
+            return pd.DataFrame()
+        return pd.concat(pages, ignore_index=True)
\ No newline at end of file
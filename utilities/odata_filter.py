@@ -0,0 +1,483 @@
+"""
+Translate the lightweight SQL accepted by OData.query into OData query options.
+
+    SELECT a, b FROM Entity [WHERE ...] [ORDER BY a [ASC|DESC], ...] [LIMIT n]
+
+The text is tokenized in one pass, the WHERE clause is parsed into a small
+AST and $filter is emitted from it, so literals are never touched by operator
+rewriting. AND/OR chains are parsed iteratively: generated filters with
+thousands of terms (key batches, ranges) translate in linear time.
+Translations are cached by query text.
+
+WHERE supports = != <> < <= > >=, AND / OR / NOT, parentheses, IS [NOT] NULL,
+[NOT] IN (...), [NOT] LIKE with leading/trailing %, and [NOT] BETWEEN.
+
+With a datetime style, DATE '...' and TIMESTAMP '...' literals become OData
+datetime literals, and so do ISO date strings compared with one of the
+`datetime_columns` (the date/time properties from $metadata); any other
+quoted string stays a string, however date-like.
+"""
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+# leading whitespace is consumed with each token: one match per token
+_TOKEN_RE = re.compile(r"""\s*(?:
+    (?P<string>'(?:[^']|'')*')
+  | (?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<op>>=|<=|<>|!=|=|>|<)
+  | (?P<punct>[(),*])
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_\.]*)
+)""", re.VERBOSE)
+
+_ISO_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_ISO_DATETIME_RE = re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?P<tz>Z|[+-]\d{2}:?\d{2})?")
+_NUMERIC_RE = re.compile(r"-?\d+(?:\.\d+)?")
+
+_COMPARISONS = {"=": "eq", "!=": "ne", "<>": "ne", "<": "lt", "<=": "le", ">": "gt", ">=": "ge"}
+_KEYWORDS = {
+    "SELECT", "FROM", "WHERE", "ORDER", "BY", "LIMIT", "AND", "OR", "NOT",
+    "IN", "IS", "NULL", "LIKE", "BETWEEN", "TRUE", "FALSE", "ASC", "DESC",
+}
+
+# datetime literal styles: None keeps them as quoted strings
+DATETIME_STYLES = (None, "v4", "v2")
+
+
+class Token(NamedTuple):
+    kind: str     # string | number | op | punct | ident | keyword | end, or datetime (DATE/TIMESTAMP '...')
+    value: str
+
+
+class ODataQuery(NamedTuple):
+    table: str
+    select: str | None
+    filter: str | None
+    orderby: str | None
+    top: int | None
+
+
+def tokenize(text: str) -> list[Token]:
+    tokens = []
+    append = tokens.append
+    match = _TOKEN_RE.match
+    new = tuple.__new__  # skips NamedTuple.__new__ argument handling
+    pos, end = 0, len(text.rstrip())
+    while pos < end:
+        m = match(text, pos)
+        if m is None:
+            start = len(text) - len(text[pos:].lstrip())
+            raise ValueError(f"Unexpected character in query at {start}: {text[start:start + 20]!r}")
+        kind = m.lastgroup
+        value = m.group(kind)
+        if kind == "ident" and value.upper() in _KEYWORDS:
+            append(new(Token, ("keyword", value.upper())))
+        else:
+            append(new(Token, (kind, value)))
+        pos = m.end()
+    append(Token("end", ""))
+    return tokens
+
+
+# ---------- parser ----------
+# AST nodes are tuples:
+#   ("or", [nodes]) ("and", [nodes]) ("not", node)
+#   ("cmp", op, left, right)   operands are ("col", name) or ("lit", Token)
+#   a DATE/TIMESTAMP '...' literal is a Token("datetime", <the quoted string>)
+#   ("null", col, negated) ("in", col, [Token], negated)
+#   ("like", col, Token, negated) ("between", col, low, high, negated)
+
+class _Parser:
+    def __init__(self, tokens: list[Token]):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self) -> Token:
+        return self.tokens[self.pos]
+
+    def next(self) -> Token:
+        tok = self.tokens[self.pos]
+        self.pos += 1
+        return tok
+
+    def accept(self, kind: str, value: str | None = None) -> Token | None:
+        tok = self.tokens[self.pos]
+        if tok.kind == kind and (value is None or tok.value == value):
+            self.pos += 1
+            return tok
+        return None
+
+    def expect(self, kind: str, value: str | None = None) -> Token:
+        tok = self.accept(kind, value)
+        if tok is None:
+            got = self.peek()
+            raise ValueError(f"Expected {value or kind}, got {got.value or 'end of query'!r}")
+        return tok
+
+    def at_keyword(self, *values: str) -> bool:
+        tok = self.peek()
+        return tok.kind == "keyword" and tok.value in values
+
+    # SELECT ... FROM ... [WHERE ...] [ORDER BY ...] [LIMIT n]
+    def query(self):
+        self.expect("keyword", "SELECT")
+        fields = []
+        while True:
+            if self.accept("punct", "*"):
+                fields.append("*")
+            else:
+                fields.append(self.expect("ident").value)
+            if not self.accept("punct", ","):
+                break
+
+        self.expect("keyword", "FROM")
+        table = self.expect("ident").value.split(".")[-1]
+
+        where = None
+        if self.accept("keyword", "WHERE"):
+            where = self.expr()
+
+        order_by = []
+        if self.accept("keyword", "ORDER"):
+            self.expect("keyword", "BY")
+            while True:
+                col = self.expect("ident").value
+                direction = "asc"
+                if self.accept("keyword", "DESC"):
+                    direction = "desc"
+                else:
+                    self.accept("keyword", "ASC")
+                order_by.append((col, direction))
+                if not self.accept("punct", ","):
+                    break
+
+        limit = None
+        if self.accept("keyword", "LIMIT"):
+            limit = int(self.expect("number").value)
+
+        self.expect("end")
+        return fields, table, where, order_by, limit
+
+    def where_only(self):
+        node = self.expr()
+        # tolerate trailing ORDER BY / LIMIT; they're handled by the query translation
+        if not self.at_keyword("ORDER", "LIMIT"):
+            self.expect("end")
+        return node
+
+    def expr(self):
+        terms = [self.conjunction()]
+        while self.accept("keyword", "OR"):
+            terms.append(self.conjunction())
+        return terms[0] if len(terms) == 1 else ("or", terms)
+
+    def conjunction(self):
+        terms = [self.negation()]
+        while self.accept("keyword", "AND"):
+            terms.append(self.negation())
+        return terms[0] if len(terms) == 1 else ("and", terms)
+
+    def negation(self):
+        if self.accept("keyword", "NOT"):
+            return ("not", self.negation())
+        if self.accept("punct", "("):
+            node = self.expr()
+            self.expect("punct", ")")
+            return node
+        return self.predicate()
+
+    def typed_literal(self, tok: Token) -> Token | None:
+        """DATE '...' / TIMESTAMP '...' starting at tok (already consumed), as a datetime token."""
+        if tok.kind == "ident" and tok.value.upper() in ("DATE", "TIMESTAMP") and self.peek().kind == "string":
+            return Token("datetime", self.next().value)
+        return None
+
+    def operand(self):
+        tok = self.next()
+        typed = self.typed_literal(tok)
+        if typed is not None:
+            return ("lit", typed)
+        if tok.kind == "ident":
+            return ("col", tok.value)
+        if tok.kind in ("string", "number") or (tok.kind == "keyword" and tok.value in ("NULL", "TRUE", "FALSE")):
+            return ("lit", tok)
+        raise ValueError(f"Expected a column or literal, got {tok.value or 'end of query'!r}")
+
+    def literal(self) -> Token:
+        tok = self.next()
+        typed = self.typed_literal(tok)
+        if typed is not None:
+            return typed
+        if tok.kind in ("string", "number", "ident") or (tok.kind == "keyword" and tok.value in ("NULL", "TRUE", "FALSE")):
+            return tok
+        raise ValueError(f"Expected a literal, got {tok.value or 'end of query'!r}")
+
+    def predicate(self):
+        left = self.operand()
+
+        if self.accept("keyword", "IS"):
+            negated = bool(self.accept("keyword", "NOT"))
+            self.expect("keyword", "NULL")
+            return ("null", left, negated)
+
+        negated = bool(self.accept("keyword", "NOT"))
+        if self.accept("keyword", "IN"):
+            self.expect("punct", "(")
+            values = []
+            if not self.accept("punct", ")"):
+                while True:
+                    values.append(self.literal())
+                    if not self.accept("punct", ","):
+                        break
+                self.expect("punct", ")")
+            return ("in", left, values, negated)
+        if self.accept("keyword", "LIKE"):
+            return ("like", left, self.expect("string"), negated)
+        if self.accept("keyword", "BETWEEN"):
+            low = self.operand()
+            self.expect("keyword", "AND")
+            return ("between", left, low, self.operand(), negated)
+        if negated:
+            raise ValueError("NOT must be followed by IN, LIKE or BETWEEN here")
+
+        op = self.expect("op").value
+        return ("cmp", _COMPARISONS[op], left, self.operand())
+
+
+# ---------- emitter ----------
+
+def _string_value(tok: Token) -> str:
+    return tok.value[1:-1].replace("''", "'")
+
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _datetime_literal(value: str, style: str | None) -> str | None:
+    """OData datetime literal for an ISO date/timestamp string, or None if it isn't one."""
+    if style is None:
+        return None
+    if _ISO_DATE_RE.fullmatch(value):
+        value += "T00:00:00"
+    elif not _ISO_DATETIME_RE.fullmatch(value):
+        return None
+    value = value.replace(" ", "T")
+    if style == "v2":
+        return f"datetime'{value}'"
+    # v4 DateTimeOffset literals need an offset
+    if not _ISO_DATETIME_RE.fullmatch(value).group("tz"):
+        value += "Z"
+    return value
+
+
+class _Emitter:
+    def __init__(self, datetime_style: str | None, datetime_columns: frozenset[str] = frozenset()):
+        self.datetime_style = datetime_style
+        self.datetime_columns = datetime_columns
+
+    def literal(self, tok: Token, op: str | None = None, bare_is_string: bool = False, column: str | None = None) -> str:
+        if tok.kind == "number":
+            return tok.value
+        if tok.kind == "keyword":
+            return tok.value.lower()
+        if tok.kind == "ident":
+            # unquoted word inside IN (...): a string value
+            return _quote(tok.value) if bare_is_string else tok.value
+        value = _string_value(tok)
+        if tok.kind == "datetime":
+            if self.datetime_style is None:
+                return _quote(value)
+            dt = _datetime_literal(value, self.datetime_style)
+            if dt is None:
+                raise ValueError(f"Not an ISO date/timestamp: {tok.value}")
+            return dt
+        # quoted numbers compare numerically in range conditions
+        if op in ("gt", "ge", "lt", "le") and _NUMERIC_RE.fullmatch(value):
+            return value
+        dt = _datetime_literal(value, self.datetime_style) if column in self.datetime_columns else None
+        return dt if dt is not None else _quote(value)
+
+    def operand(self, node, op: str | None = None, column: str | None = None) -> str:
+        if node[0] == "col":
+            return node[1]
+        return self.literal(node[1], op, column=column)
+
+    @staticmethod
+    def _grouped(node) -> bool:
+        """Whether node is emitted as one parenthesized group or a single function call."""
+        kind = node[0]
+        if kind in ("or", "and", "in", "between"):
+            return True
+        if kind == "like":
+            value = _string_value(node[2])
+            return not node[3] and (value.startswith("%") or value.endswith("%"))
+        return False
+
+    def emit(self, node, parent: str | None = None) -> str:
+        kind = node[0]
+
+        if kind in ("or", "and"):
+            text = f" {kind} ".join(self.emit(child, kind) for child in node[1])
+            # keep explicit grouping for anything nested in another connective
+            return f"({text})" if parent in ("or", "and", "not") else text
+
+        if kind == "not":
+            text = self.emit(node[1], "not")
+            # not binds tighter than eq, ne, ...: only a group or a function call may follow it bare
+            return f"not {text}" if self._grouped(node[1]) else f"not ({text})"
+
+        if kind == "cmp":
+            _, op, left, right = node
+            column = left[1] if left[0] == "col" else right[1] if right[0] == "col" else None
+            return f"{self.operand(left, op, column)} {op} {self.operand(right, op, column)}"
+
+        if kind == "null":
+            _, col, negated = node
+            return f"{self.operand(col)} {'ne' if negated else 'eq'} null"
+
+        if kind == "in":
+            _, col, values, negated = node
+            col = self.operand(col)
+            if not values:
+                return "(1 eq 1)" if negated else "(1 eq 0)"
+            op, joiner = ("ne", " and ") if negated else ("eq", " or ")
+            return "(" + joiner.join(
+                f"{col} {op} {self.literal(v, op, bare_is_string=True, column=col)}" for v in values
+            ) + ")"
+
+        if kind == "like":
+            _, col, pattern, negated = node
+            col = self.operand(col)
+            value = _string_value(pattern)
+            if len(value) >= 2 and value.startswith("%") and value.endswith("%"):
+                text = f"contains({col}, {_quote(value[1:-1])})"
+            elif value.endswith("%"):
+                text = f"startswith({col}, {_quote(value[:-1])})"
+            elif value.startswith("%"):
+                text = f"endswith({col}, {_quote(value[1:])})"
+            else:
+                text = f"{col} {'ne' if negated else 'eq'} {_quote(value)}"
+                return text
+            return f"not {text}" if negated else text
+
+        if kind == "between":
+            _, col, low, high, negated = node
+            col = self.operand(col)
+            if negated:
+                return f"({col} lt {self.operand(low, 'lt', col)} or {col} gt {self.operand(high, 'gt', col)})"
+            return f"({col} ge {self.operand(low, 'ge', col)} and {col} le {self.operand(high, 'le', col)})"
+
+        raise ValueError(f"Unknown filter node {kind!r}")
+
+
+# ---------- public ----------
+
+@lru_cache(maxsize=1024)
+def translate_where(where_sql: str, datetime_style: str | None = None,
+                    datetime_columns: frozenset[str] = frozenset()) -> str | None:
+    """
+    SQL WHERE condition -> OData $filter (None for an empty condition).
+
+    >>> translate_where("NOT a = 1")
+    'not (a eq 1)'
+    >>> translate_where("NOT a IS NULL")
+    'not (a eq null)'
+    >>> translate_where("NOT (a = 1 OR b LIKE 'x%')")
+    "not (a eq 1 or startswith(b, 'x'))"
+    >>> translate_where("NOT name LIKE '%x%' AND NOT c NOT LIKE 'y%'")
+    "not contains(name, 'x') and not (not startswith(c, 'y'))"
+    >>> translate_where("Notes = '2020-01-01' AND OrderDate >= '2020-01-01'", "v4", frozenset({"OrderDate"}))
+    "Notes eq '2020-01-01' and OrderDate ge 2020-01-01T00:00:00Z"
+    >>> translate_where("ShippedDate < TIMESTAMP '2020-01-01 12:30'", "v2")
+    "ShippedDate lt datetime'2020-01-01T12:30'"
+    """
+    if datetime_style not in DATETIME_STYLES:
+        raise ValueError(f"datetime_style must be one of {DATETIME_STYLES}")
+    if not where_sql or not where_sql.strip():
+        return None
+    node = _Parser(tokenize(where_sql)).where_only()
+    return _Emitter(datetime_style, datetime_columns).emit(node)
+
+
+def _clause_starts(query: str) -> dict[str, int]:
+    """Offsets of the top-level WHERE, ORDER and LIMIT keywords of a query (not inside strings or parentheses)."""
+    starts = {}
+    depth, pos, end = 0, 0, len(query.rstrip())
+    while pos < end:
+        m = _TOKEN_RE.match(query, pos)
+        kind = m.lastgroup
+        value = m.group(kind)
+        if kind == "punct":
+            depth += (value == "(") - (value == ")")
+        elif kind == "ident" and depth == 0 and value.upper() in ("WHERE", "ORDER", "LIMIT"):
+            starts.setdefault(value.upper(), m.start(kind))
+        pos = m.end()
+    return starts
+
+
+def extend_query(query: str, where: str | None = None, order_by: list[str] | None = None) -> str:
+    """
+    query with the condition `where` ANDed into its WHERE clause and, with order_by,
+    ordered by those columns (ascending). LIMIT is kept; an ORDER BY already in query
+    must be the same one, otherwise ValueError.
+
+    >>> extend_query("SELECT * FROM Orders", "a > 1 OR b > 2", ["a", "b"])
+    'SELECT * FROM Orders WHERE a > 1 OR b > 2 ORDER BY a, b'
+    >>> extend_query("SELECT a FROM Orders WHERE c = 'x where' OR d = 1 LIMIT 10", "a > 1", ["a"])
+    "SELECT a FROM Orders WHERE (c = 'x where' OR d = 1) AND (a > 1) ORDER BY a LIMIT 10"
+    >>> extend_query("SELECT * FROM Orders ORDER BY a", "a > 1", ["a"])
+    'SELECT * FROM Orders WHERE a > 1 ORDER BY a'
+    >>> extend_query("SELECT * FROM Orders ORDER BY b", None, ["a"])
+    Traceback (most recent call last):
+    ...
+    ValueError: Query is ordered by b, but needs ORDER BY a: SELECT * FROM Orders ORDER BY b
+    """
+    # validates the whole query before it is cut up
+    _, _, _, own_order, _ = _Parser(tokenize(query)).query()
+    query = query.strip()
+    starts = _clause_starts(query)
+    cuts = sorted(starts.values()) + [len(query)]
+
+    def clause(keyword: str, skip: int) -> str | None:
+        if keyword not in starts:
+            return None
+        start = starts[keyword]
+        return query[start + skip:cuts[cuts.index(start) + 1]].strip()
+
+    head = query[:cuts[0]].strip()
+    own_where, own_order_text, limit = clause("WHERE", 5), clause("ORDER", 5), clause("LIMIT", 0)
+
+    conditions = [c for c in (own_where, where) if c]
+    if len(conditions) > 1:
+        conditions = [f"({c})" for c in conditions]
+    parts = [head]
+    if conditions:
+        parts.append("WHERE " + " AND ".join(conditions))
+
+    if order_by:
+        if own_order and own_order != [(c, "asc") for c in order_by]:
+            raise ValueError(f"Query is ordered by {own_order_text[2:].strip()}, but needs ORDER BY "
+                             f"{', '.join(order_by)}: {query}")
+        parts.append("ORDER BY " + ", ".join(order_by))
+    elif own_order_text:
+        parts.append("ORDER " + own_order_text)
+    if limit:
+        parts.append(limit)
+    return " ".join(parts)
+
+
+@lru_cache(maxsize=1024)
+def translate_query(query: str, datetime_style: str | None = None,
+                    datetime_columns: frozenset[str] = frozenset()) -> ODataQuery:
+    """SELECT ... FROM ... [WHERE] [ORDER BY] [LIMIT] -> entity set and OData query options."""
+    if datetime_style not in DATETIME_STYLES:
+        raise ValueError(f"datetime_style must be one of {DATETIME_STYLES}")
+    fields, table, where, order_by, limit = _Parser(tokenize(query)).query()
+    return ODataQuery(
+        table=table,
+        select=None if "*" in fields else ",".join(fields),
+        filter=_Emitter(datetime_style, datetime_columns).emit(where) if where is not None else None,
+        orderby=",".join(f"{c} desc" if d == "desc" else c for c, d in order_by) or None,
+        top=limit,
+    )
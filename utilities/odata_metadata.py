@@ -0,0 +1,180 @@
+"""
+EDM types from an OData service's $metadata, and typed page decoding.
+
+The $metadata document is fetched once per service, reduced to
+{entity set: {property: [EDM type, scale]}} and cached in memory and (with a
+cache directory) on disk. Pages are then built column by column straight into
+typed arrays: nullable integers, floats for decimals,
+datetime64 for dates and timestamps, bytes for Edm.Binary, so nothing reaches
+the loader as generic object columns.
+"""
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+import pandas as pd
+
+INT_TYPES = {
+    "Edm.Byte": "UInt8",
+    "Edm.SByte": "Int8",
+    "Edm.Int16": "Int16",
+    "Edm.Int32": "Int32",
+    "Edm.Int64": "Int64",
+}
+FLOAT_TYPES = {"Edm.Single": "float32", "Edm.Double": "float64"}
+DATETIME_TYPES = ("Edm.DateTimeOffset", "Edm.DateTime", "Edm.Date")
+
+# v2 verbose JSON dates: /Date(836438400000)/ or /Date(836438400000+0060)/
+_MS_DATE_RE = re.compile(r"/Date\((-?\d+)(?:[+-]\d+)?\)/")
+
+_memory: dict[str, dict] = {}
+_memory_lock = threading.Lock()
+
+
+def _local(tag: str) -> str:
+    """Tag name without its XML namespace (EDMX namespaces differ between OData versions)."""
+    return tag.rsplit("}", 1)[-1]
+
+
+def parse_metadata(xml: bytes | str) -> dict[str, dict[str, list]]:
+    """{entity set name: {property name: [EDM type, scale or None]}} from a $metadata document."""
+    root = ET.fromstring(xml)
+
+    entity_types = {}
+    for schema in root.iter():
+        if _local(schema.tag) != "Schema":
+            continue
+        namespace = schema.get("Namespace", "")
+        alias = schema.get("Alias")
+        for et in schema:
+            if _local(et.tag) != "EntityType":
+                continue
+            props = {}
+            for p in et:
+                if _local(p.tag) == "Property":
+                    scale = p.get("Scale")
+                    props[p.get("Name")] = [p.get("Type"), int(scale) if scale and scale.isdigit() else None]
+            entry = {"base": et.get("BaseType"), "props": props}
+            entity_types[f"{namespace}.{et.get('Name')}"] = entry
+            if alias:
+                entity_types[f"{alias}.{et.get('Name')}"] = entry
+
+    def properties(type_name: str) -> dict:
+        entry = entity_types.get(type_name)
+        if entry is None:
+            return {}
+        inherited = properties(entry["base"]) if entry["base"] else {}
+        return {**inherited, **entry["props"]}
+
+    return {
+        es.get("Name"): properties(es.get("EntityType"))
+        for es in root.iter()
+        if _local(es.tag) == "EntitySet"
+    }
+
+
+def load_metadata(session, base_url: str, cache_dir: str | None = None, max_age: float | None = None) -> dict:
+    """
+    Parsed $metadata for a service, fetched at most once per process (and, with
+    cache_dir, reused across runs until older than max_age seconds). A stale disk
+    copy is used when the service can't be reached.
+    """
+    with _memory_lock:
+        hit = _memory.get(base_url)
+    if hit is not None:
+        return hit
+
+    path = None
+    cached = None
+    if cache_dir:
+        path = os.path.join(cache_dir, hashlib.sha1(base_url.encode("utf-8")).hexdigest()[:16] + ".json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = None
+
+    fresh = cached is not None and (max_age is None or time.time() - cached["fetched"] < max_age)
+    if fresh:
+        entity_sets = cached["entity_sets"]
+    else:
+        try:
+            resp = session.get(f"{base_url}/$metadata")
+            resp.raise_for_status()
+            entity_sets = parse_metadata(resp.content)
+        except Exception:
+            if cached is None:
+                raise
+            print(f"Warning: could not refresh $metadata for {base_url}; using the cached copy.")
+            entity_sets = cached["entity_sets"]
+        else:
+            if path:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump({"url": base_url, "fetched": time.time(), "entity_sets": entity_sets}, f)
+                os.replace(tmp, path)
+
+    with _memory_lock:
+        _memory[base_url] = entity_sets
+    return entity_sets
+
+
+# ---------- typed columns ----------
+
+def _datetime_column(values: list, edm_type: str) -> pd.Series:
+    first = next((v for v in values if v is not None), None)
+    if isinstance(first, str) and first.startswith("/Date("):
+        ms = [int(m.group(1)) if (m := _MS_DATE_RE.fullmatch(v or "")) else None for v in values]
+        return pd.Series(pd.to_datetime(pd.array(ms, dtype="Int64"), unit="ms"))
+    if edm_type == "Edm.DateTimeOffset":
+        return pd.Series(pd.to_datetime(values, utc=True, format="ISO8601"))
+    return pd.Series(pd.to_datetime(values, format="ISO8601"))
+
+
+def _typed_column(values: list, edm_type: str | None) -> pd.Series:
+    if edm_type in INT_TYPES:
+        try:
+            return pd.Series(pd.array(values, dtype=INT_TYPES[edm_type]))
+        except (TypeError, ValueError):
+            # Int64 may arrive as strings (IEEE754Compatible)
+            return pd.to_numeric(pd.Series(values, dtype=object)).astype(INT_TYPES[edm_type])
+
+    if edm_type in FLOAT_TYPES:
+        return pd.to_numeric(pd.Series(values, dtype=object)).astype(FLOAT_TYPES[edm_type])
+
+    if edm_type == "Edm.Decimal":
+        return pd.to_numeric(pd.Series(values, dtype=object)).astype("float64")
+
+    if edm_type == "Edm.Boolean":
+        return pd.Series(pd.array(values, dtype="boolean"))
+
+    if edm_type in DATETIME_TYPES:
+        return _datetime_column(values, edm_type)
+
+    if edm_type == "Edm.Binary":
+        return pd.Series([base64.b64decode(v) if v is not None else None for v in values], dtype=object)
+
+    # strings, guids and anything we don't know: as delivered
+    return pd.Series(values)
+
+
+def build_frame(columns: dict[str, list], properties: dict[str, list]) -> pd.DataFrame:
+    """
+    Build a page of entity values ({property: [values]}, see odata_stream.ColumnBuffer)
+    into a DataFrame with one typed column per property.
+    """
+    out = {}
+    for name, values in columns.items():
+        edm_type, _ = properties.get(name, (None, None))
+        try:
+            out[name] = _typed_column(values, edm_type)
+        except (TypeError, ValueError):
+            # unexpected payload for the declared type: keep it as-is
+            out[name] = pd.Series(values)
+    return pd.DataFrame(out)
@@ -0,0 +1,253 @@
+"""
+Streaming decode of OData JSON responses.
+
+A response body is read chunk by chunk (resp.iter_content) and the records
+of its "value" array (v4 / JSON light) or "d"/"results" (v2 verbose) are
+decoded one at a time with json's C scanner, straight into per-column
+lists. Neither the raw body nor a list of record dicts is ever held in
+full; the other top-level members (nextLink, count, context) are kept in
+`payload` once the body has been read.
+"""
+import codecs
+import json
+import re
+from collections.abc import Iterable, Iterator
+from json.scanner import make_scanner
+
+RECORD_ARRAYS = ("value", "results")
+
+_WS = re.compile(r"[ \t\n\r]*")
+_decoder = json.JSONDecoder()
+# raw_decode's C scanner without the wrapper, for the per-record hot path
+_scan_once = make_scanner(_decoder)
+
+
+def is_annotation(key: str) -> bool:
+    """@odata.* / Property@odata.type instance annotations, v3 odata.* and v2 __metadata/__deferred."""
+    return "@" in key or key.startswith(("odata.", "__"))
+
+
+class PageReader:
+    """
+    Iterate the records of one OData JSON response body as it arrives.
+    After iteration, `payload` holds every other member of the body, shaped as
+    in the full document (e.g. {"@odata.nextLink": ...} or {"d": {"__next": ...}}).
+
+    Values, numbers and multi-byte characters may be split across chunks:
+
+    >>> def chunked(body, size):
+    ...     data = body.encode("utf-8-sig")
+    ...     return [data[i:i + size] for i in range(0, len(data), size)]
+    >>> body = '{"@odata.context": "x", "value": [{"ID": 12345, "Name": "Café"}, {"ID": 7}], "@odata.nextLink": "Orders?$skiptoken=7"}'
+    >>> all(list(PageReader(chunked(body, size))) == [{"ID": 12345, "Name": "Café"}, {"ID": 7}] for size in (1, 2, 3, 7, 4096))
+    True
+    >>> reader = PageReader(chunked(body, 5))
+    >>> len(list(reader)), reader.payload
+    (2, {'@odata.context': 'x', '@odata.nextLink': 'Orders?$skiptoken=7'})
+    >>> reader = PageReader(chunked('{"d": {"results": [{"ID": 1}], "__next": "u"}}', 2))
+    >>> list(reader), reader.payload
+    ([{'ID': 1}], {'d': {'__next': 'u'}})
+
+    The body must be exactly one JSON document:
+
+    >>> list(PageReader(chunked('{"value": [{"ID": 1}]} {}', 4)))
+    Traceback (most recent call last):
+    ...
+    ValueError: Malformed OData response: data after the end of the JSON document
+    >>> list(PageReader(chunked('{"value": [{"ID": 1}', 4)))
+    Traceback (most recent call last):
+    ...
+    ValueError: Malformed OData response: expected one of ',]', got 'end of body'
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self.payload: dict = {}
+        self._chunks = iter(chunks)
+        # OData JSON is UTF-8; some servers prepend a BOM
+        self._text = codecs.getincrementaldecoder("utf-8-sig")()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def __iter__(self) -> Iterator[dict]:
+        if self._expect("{[") == "[":
+            yield from self._items()
+        else:
+            yield from self._members(self.payload)
+        # read to the end of the body (lets the connection, and any cache, see it complete)
+        if self._peek():
+            raise ValueError("Malformed OData response: data after the end of the JSON document")
+
+    # ---------- buffer ----------
+
+    def _fill(self, grow: bool = False) -> bool:
+        """
+        Append more of the body to the unparsed text; False once it is exhausted.
+        grow=True reads until the pending text has doubled, so a value spanning
+        many chunks is re-scanned a logarithmic number of times, not once per chunk.
+        """
+        if self._eof:
+            return False
+        pending = self._buf[self._pos:]
+        need = 2 * len(pending) if grow else len(pending) + 1
+        parts = [pending]
+        size = len(pending)
+        for chunk in self._chunks:
+            text = self._text.decode(chunk)
+            parts.append(text)
+            size += len(text)
+            if size >= need:
+                break
+        else:
+            parts.append(self._text.decode(b"", final=True))
+            self._eof = True
+
+        self._buf = "".join(parts)
+        self._pos = 0
+        return len(self._buf) > len(pending)
+
+    def _peek(self) -> str:
+        """Next non-whitespace character, '' at the end of the body."""
+        pos = self._pos
+        if pos < len(self._buf) and self._buf[pos] not in " \t\n\r":
+            return self._buf[pos]
+        while True:
+            self._pos = _WS.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars: str) -> str:
+        c = self._peek()
+        if not c or c not in chars:
+            raise ValueError(f"Malformed OData response: expected one of {chars!r}, got {c or 'end of body'!r}")
+        self._pos += 1
+        return c
+
+    def _value(self):
+        """Decode the next complete JSON value."""
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill(grow=True):
+                    raise
+                continue
+            # a number at the very end of the buffer may continue in the next chunk
+            if end == len(self._buf) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    # ---------- structure ----------
+
+    def _items(self) -> Iterator:
+        """Elements of an array whose '[' has been consumed."""
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        scan = _scan_once
+        while True:
+            # fast path: the element starts right here and ends before the buffer does
+            buf, pos = self._buf, self._pos
+            try:
+                value, end = scan(buf, pos)
+            except (StopIteration, json.JSONDecodeError):
+                end = len(buf)
+            if end < len(buf):
+                self._pos = end
+            else:
+                value = self._value()
+            yield value
+            if self._expect(",]") == "]":
+                return
+
+    def _members(self, target: dict) -> Iterator[dict]:
+        """Members of an object whose '{' has been consumed: record arrays are streamed, the rest go to target."""
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self._value()
+            if not isinstance(key, str):
+                raise ValueError(f"Malformed OData response: object key {key!r} is not a string")
+            self._expect(":")
+
+            c = self._peek()
+            if key in RECORD_ARRAYS and c == "[":
+                self._pos += 1
+                yield from self._items()
+            elif key == "d" and c and c in "{[":
+                # v2 verbose JSON: {"d": {"results": [...], "__next": ...}}, v1: {"d": [...]}
+                self._pos += 1
+                if c == "[":
+                    yield from self._items()
+                else:
+                    target["d"] = {}
+                    yield from self._members(target["d"])
+            else:
+                target[key] = self._value()
+
+            if self._expect(",}") == "}":
+                return
+
+
+class ColumnBuffer:
+    """
+    Column-wise accumulation of records: one list per property, padded with None
+    where a record lacks it. Annotations are dropped and nested objects (e.g.
+    complex types) are flattened to "Parent.Child" names like json_normalize.
+    """
+
+    def __init__(self):
+        self.columns: dict[str, list] = {}
+        self.rows = 0
+        # key -> its column's list, or None for annotations
+        self._targets: dict[str, list | None] = {}
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def append(self, record: dict):
+        columns = self.columns
+        targets = self._targets
+        rows = self.rows
+        filled = 0
+        added = False
+        for key, value in record.items():
+            col = targets.get(key, False)
+            if col is None:
+                continue
+            if col is False or isinstance(value, dict):
+                # first sighting of this key, or a nested object
+                for name, v in self._flatten({key: value}, ""):
+                    col = columns.get(name)
+                    if col is None:
+                        col = columns[name] = [None] * rows
+                        added = True
+                    col.append(v)
+                    filled += 1
+                if key not in targets:
+                    # nested objects stay on this path (False); scalars go straight to their list
+                    targets[key] = None if is_annotation(key) else columns.get(key, False)
+                continue
+            col.append(value)
+            filled += 1
+        self.rows = rows + 1
+
+        # names are unique within a record, so only a short or reshaped record needs padding
+        if added or filled != len(columns):
+            for col in columns.values():
+                if len(col) == rows:
+                    col.append(None)
+
+    def _flatten(self, record: dict, prefix: str):
+        for key, value in record.items():
+            if is_annotation(key):
+                continue
+            if isinstance(value, dict):
+                yield from self._flatten(value, f"{prefix}{key}.")
+            else:
+                yield prefix + key, value
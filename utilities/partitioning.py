@@ -0,0 +1,168 @@
+"""
+Range partition layout of a table, for loads that write straight into its partitions.
+
+Tables declared PARTITION BY RANGE and registered with
+common.register_range_partitions (DDL/default/stored_procedures/common.partitioning.sql)
+have a row in common."PartitionSchemes" giving the partition column and step.
+RangePartitions holds their current partitions' bounds, so a loader can create
+the partitions a batch needs before staging it (missing()) and, when the whole
+batch falls into one partition - the usual incremental load - move it into that
+partition directly (target()), skipping per-row routing and the locking of the
+parent's other partitions. A batch spread over several partitions (a full
+reload) is moved through the parent in one statement, which is faster than
+one staged statement per partition.
+
+Routing is done for date, timestamp and integer partition keys. For other
+types (timestamptz bounds depend on the session time zone) every row goes
+through the parent table.
+
+A scheme's key_columns are the row key when it leaves out the partition column
+(Orders: OrderID, partitioned by OrderDate). The table's unique index then includes
+the partition column, so keyed loads move rows whose partition value changed
+(common.move_rekeyed_from_temp) before merging a batch; see moves_rekeyed().
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from utilities.pg_metadata import INTEGER_TYPES
+
+ROUTED_TYPES = INTEGER_TYPES | {"date", "timestamp without time zone"}
+
+SCHEME_EXISTS_SQL = """SELECT to_regclass('common."PartitionSchemes"') IS NOT NULL;"""
+
+LAYOUT_SQL = """
+    SELECT s."COLUMN_NAME", s."STEP", s."KEY_COLUMNS", p.partition_name, p.lower_bound, p.upper_bound
+    FROM common."PartitionSchemes" s
+    LEFT JOIN common.range_partitions(s."SCHEMA_NAME", s."TABLE_NAME") p
+      ON p.lower_bound NOT IN ('MINVALUE', 'MAXVALUE') AND p.upper_bound NOT IN ('MINVALUE', 'MAXVALUE')
+    WHERE s."SCHEMA_NAME" = %s AND s."TABLE_NAME" = %s
+"""
+
+
+@dataclass(frozen=True)
+class RangePartitions:
+    """
+    Bounds are inclusive below and exclusive above, as in FOR VALUES FROM ... TO ...:
+
+    >>> scheme = RangePartitions("sales", "Orders", "OrderDate", "1 month", "date", ("OrderID",))
+    >>> orders = RangePartitions(
+    ...     "sales", "Orders", "OrderDate", "1 month", "date", ("OrderID",),
+    ...     names=("Orders_p199701", "Orders_p199702"),
+    ...     lowers=scheme._key(["1997-01-01", "1997-02-01"]), uppers=scheme._key(["1997-02-01", "1997-03-01"]))
+    >>> orders.locate(["1996-12-31", "1997-01-01", "1997-01-31", "1997-02-01", "1997-02-28", "1997-03-01", None]).tolist()
+    [-1, 0, 0, 1, 1, -1, -1]
+
+    >>> batch = lambda *dates: pd.DataFrame({"OrderDate": list(dates)})
+    >>> orders.target(batch("1997-02-01", "1997-02-28"))
+    'Orders_p199702'
+    >>> orders.target(batch("1997-01-31", "1997-02-01")) is None  # spans two partitions
+    True
+    >>> orders.target(batch("1997-03-01")) is None  # no partition yet
+    True
+    >>> orders.missing(batch("1997-01-01", "1997-02-28", None)) is None  # NULLs are left to the server
+    True
+    >>> orders.missing(batch("1996-12-31", "1997-02-15", "1997-03-01"))
+    ('1996-12-31T00:00:00', '1997-03-01T00:00:00')
+
+    Integer keys, and a table without partitions yet:
+
+    >>> scheme = RangePartitions("s", "t", "id", "1000", "integer")
+    >>> ids = RangePartitions("s", "t", "id", "1000", "integer", names=("t_p0",), lowers=scheme._key([0]), uppers=scheme._key([1000]))
+    >>> ids.locate([-1, 0, 999, 1000]).tolist(), ids.missing(pd.DataFrame({"id": [5, 1000, 2500]}))
+    ([-1, 0, 0, -1], ('1000', '2500'))
+    >>> scheme.locate([1]).tolist(), scheme.missing(pd.DataFrame({"id": [3]})), scheme.target(pd.DataFrame({"id": [3]}))
+    ([-1], ('3', '3'), None)
+    """
+    schema: str
+    table: str
+    column: str
+    step: str
+    data_type: str
+    key_columns: tuple[str, ...] = ()
+    # partitions in bound order; lowers/uppers are comparable with _key() values
+    names: tuple[str, ...] = ()
+    lowers: np.ndarray = None
+    uppers: np.ndarray = None
+
+    @property
+    def routed(self) -> bool:
+        return self.data_type in ROUTED_TYPES
+
+    @property
+    def integer(self) -> bool:
+        return self.data_type in INTEGER_TYPES
+
+    def _key(self, values) -> np.ndarray:
+        """Partition key values as float64 (integer keys) or datetime64[ns], with NaN/NaT for NULL."""
+        if self.integer:
+            return pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        s = pd.to_datetime(pd.Series(values), errors="coerce")
+        if getattr(s.dt, "tz", None) is not None:
+            s = s.dt.tz_localize(None)
+        return s.dt.as_unit("ns").to_numpy()
+
+    def moves_rekeyed(self, keys: list[str], columns: list[str]) -> bool:
+        """True if a load keyed on keys (with these columns) must first move rows to their new partition."""
+        return bool(self.key_columns) and self.column in keys and set(self.key_columns) <= set(columns)
+
+    def locate(self, values) -> np.ndarray:
+        """Index into names of the partition holding each value, -1 where there is none."""
+        v = self._key(values)
+        if not self.names:
+            return np.full(len(v), -1)
+        pos = np.searchsorted(self.lowers, v, side="right") - 1
+        inside = (pos >= 0) & (v < self.uppers[pos.clip(0)])
+        return np.where(inside, pos, -1)
+
+    def missing(self, batch: pd.DataFrame) -> tuple[str, str] | None:
+        """(lowest, highest) key of the rows without a partition, as text for common.ensure_partitions; None if all fit."""
+        if not self.routed:
+            return None
+        keys = batch[self.column]
+        outside = keys[(self.locate(keys) < 0) & keys.notna().to_numpy()]
+        if outside.empty:
+            return None
+        low, high = outside.min(), outside.max()
+        if self.integer:
+            return str(int(low)), str(int(high))
+        return pd.Timestamp(low).isoformat(), pd.Timestamp(high).isoformat()
+
+    def target(self, batch: pd.DataFrame) -> str | None:
+        """The partition holding every row of batch, None if the rows span several (or any has none)."""
+        if not self.routed or batch.empty:
+            return None
+        pos = self.locate(batch[self.column])
+        if pos[0] >= 0 and (pos == pos[0]).all():
+            return self.names[pos[0]]
+        return None
+
+
+def load_range_partitions(conn, schema: str, table: str, data_type_of) -> RangePartitions | None:
+    """
+    Current layout of schema.table, or None when it has no partition scheme.
+    data_type_of(column) gives the Postgres data_type of the partition column.
+    """
+    with conn.cursor() as cur:
+        cur.execute(SCHEME_EXISTS_SQL)
+        if not cur.fetchone()[0]:
+            return None
+        cur.execute(LAYOUT_SQL, (schema, table))
+        rows = cur.fetchall()
+    if not rows:
+        return None
+
+    column, step, key_columns = rows[0][0], rows[0][1], tuple(rows[0][2] or ())
+    layout = RangePartitions(schema, table, column, step, data_type_of(column), key_columns)
+    bounds = [(name, lower, upper) for _, _, _, name, lower, upper in rows if name is not None and lower is not None]
+    if not bounds or not layout.routed:
+        return layout
+
+    names, lowers, uppers = zip(*bounds)
+    lowers, uppers = layout._key(list(lowers)), layout._key(list(uppers))
+    order = np.argsort(lowers, kind="stable")
+    return RangePartitions(
+        schema, table, column, step, layout.data_type, key_columns,
+        names=tuple(names[i] for i in order), lowers=lowers[order], uppers=uppers[order]
+    )
@@ -0,0 +1,200 @@
+"""
+Cached table metadata (columns, types, nullability, unique keys, partitioning) and load-time type coercion.
+
+A MetadataCache lives on each connection pool, keyed by (schema, table), so
+repeated loads skip the information_schema round trip. Entries expire after
+an optional TTL and are dropped explicitly whenever DDL runs.
+"""
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+INTEGER_TYPES = {"smallint", "integer", "bigint"}
+FLOAT_TYPES = {"numeric", "real", "double precision"}
+DATETIME_TYPES = {"date", "timestamp without time zone", "timestamp with time zone"}
+
+# optional bigint column holding row_hash() of a row's business columns
+ROW_HASH_COLUMN = "ROW_HASH"
+
+COLUMNS_SQL = """
+    SELECT column_name, data_type, udt_name, is_nullable = 'YES' AS is_nullable,
+           numeric_precision, numeric_scale, character_maximum_length
+    FROM information_schema.columns
+    WHERE table_schema = %s AND table_name = %s
+    ORDER BY ordinal_position
+"""
+
+# non-partial unique indexes on plain columns, i.e. keys usable by ON CONFLICT;
+# natural keys first, the primary key (the DW surrogate) last
+UNIQUE_KEYS_SQL = """
+    SELECT array_agg(a.attname::text ORDER BY k.ord)
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    CROSS JOIN LATERAL unnest(i.indkey::int2[]) WITH ORDINALITY AS k(attnum, ord)
+    JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum = k.attnum
+    WHERE n.nspname = %s AND c.relname = %s
+      AND i.indisunique AND i.indpred IS NULL AND i.indexprs IS NULL
+    GROUP BY i.indexrelid, i.indisprimary
+    ORDER BY i.indisprimary, i.indexrelid
+"""
+
+PARTITIONED_SQL = """
+    SELECT EXISTS (
+        SELECT 1
+        FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relname = %s
+    )
+"""
+
+
+@dataclass(frozen=True)
+class ColumnInfo:
+    column_name: str
+    data_type: str
+    udt_name: str
+    is_nullable: bool
+    numeric_precision: int | None = None
+    numeric_scale: int | None = None
+    character_maximum_length: int | None = None
+
+
+@dataclass(frozen=True)
+class TableMetadata:
+    schema: str
+    table: str
+    columns: tuple[ColumnInfo, ...]
+    unique_keys: tuple[tuple[str, ...], ...] = ()
+    # declared PARTITION BY (see utilities.partitioning)
+    partitioned: bool = False
+
+    @property
+    def column_names(self) -> list[str]:
+        return [c.column_name for c in self.columns]
+
+    def column(self, name: str) -> ColumnInfo:
+        for c in self.columns:
+            if c.column_name == name:
+                return c
+        raise KeyError(f"{self.schema}.{self.table} has no column {name!r}")
+
+    def natural_key(self, columns) -> tuple[str, ...] | None:
+        """The first unique key made up entirely of `columns`, or None."""
+        available = set(columns)
+        for key in self.unique_keys:
+            if set(key) <= available:
+                return key
+        return None
+
+
+def load_table_metadata(conn, schema: str, table: str) -> TableMetadata:
+    with conn.cursor() as cur:
+        cur.execute(COLUMNS_SQL, (schema, table))
+        columns = tuple(ColumnInfo(*row) for row in cur.fetchall())
+        cur.execute(UNIQUE_KEYS_SQL, (schema, table))
+        unique_keys = tuple(tuple(row[0]) for row in cur.fetchall())
+        cur.execute(PARTITIONED_SQL, (schema, table))
+        partitioned = cur.fetchone()[0]
+    return TableMetadata(schema, table, columns, unique_keys, partitioned)
+
+
+class MetadataCache:
+    def __init__(self, ttl: float | None = None):
+        self.ttl = ttl
+        self._entries: dict[tuple[str, str], tuple[float, TableMetadata]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, schema: str, table: str, loader) -> TableMetadata:
+        """Cached metadata for schema.table; `loader(schema, table)` is called on a miss or expiry."""
+        key = (schema, table)
+        with self._lock:
+            hit = self._entries.get(key)
+        if hit is not None and (self.ttl is None or time.monotonic() - hit[0] < self.ttl):
+            return hit[1]
+
+        meta = loader(schema, table)
+        # don't remember tables that don't exist (yet)
+        if meta.columns:
+            with self._lock:
+                self._entries[key] = (time.monotonic(), meta)
+        return meta
+
+    def invalidate(self, schema: str | None = None, table: str | None = None):
+        """Drop one table, one schema, or (no arguments) everything."""
+        with self._lock:
+            if schema is None and table is None:
+                self._entries.clear()
+                return
+            for key in list(self._entries):
+                if (schema is None or key[0] == schema) and (table is None or key[1] == table):
+                    del self._entries[key]
+
+
+# ---------- coercion ----------
+
+def _coerce_column(s: pd.Series, col: ColumnInfo) -> pd.Series:
+    name = col.data_type
+    if name in INTEGER_TYPES:
+        if pd.api.types.is_integer_dtype(s):
+            return s
+        s = pd.to_numeric(s)
+        notna = s.dropna()
+        # only turn floats into integers when that loses nothing
+        if (notna % 1 == 0).all():
+            return s.astype("Int64")
+        return s
+
+    if name in FLOAT_TYPES:
+        return s if pd.api.types.is_numeric_dtype(s) else pd.to_numeric(s)
+
+    if name == "boolean":
+        return s if pd.api.types.is_bool_dtype(s) else s.astype("boolean")
+
+    if name in DATETIME_TYPES:
+        if not pd.api.types.is_datetime64_any_dtype(s):
+            s = pd.to_datetime(s, utc=name == "timestamp with time zone", format="ISO8601")
+        if name == "date" and getattr(s.dt, "tz", None) is not None:
+            s = s.dt.tz_localize(None)
+        return s
+
+    return s
+
+
+def coerce_frame(data: pd.DataFrame, columns) -> pd.DataFrame:
+    """
+    Convert DataFrame columns to dtypes matching their target Postgres columns
+    (columns is a sequence of ColumnInfo in DataFrame column order). A column that
+    can't be converted is left as-is for the server to parse.
+    """
+    out = {}
+    for (name, s), col in zip(data.items(), columns):
+        try:
+            out[name] = _coerce_column(s, col)
+        except (ValueError, TypeError):
+            out[name] = s
+    return pd.DataFrame(out, index=data.index)
+
+
+def row_hash(data: pd.DataFrame) -> pd.Series:
+    """
+    64-bit hash of each row's values as a signed int64 (fits a bigint column).
+    Stable across runs and processes; datetime units and float widths are
+    normalized first so the same values always hash the same.
+    """
+    norm = {}
+    for name, s in data.items():
+        if pd.api.types.is_datetime64_any_dtype(s):
+            if getattr(s.dt, "tz", None) is not None:
+                s = s.dt.tz_convert("UTC")
+            s = s.dt.as_unit("us")
+        elif pd.api.types.is_float_dtype(s):
+            s = s.astype("float64")
+        norm[name] = s
+    hashed = pd.util.hash_pandas_object(pd.DataFrame(norm, index=data.index), index=False)
+    return pd.Series(hashed.to_numpy().view(np.int64), index=data.index)
+
@@ -0,0 +1,175 @@
+"""
+Process-wide PostgreSQL connection pools.
+
+config.yaml (or the file named by $DW_CONFIG) is parsed once and cached. One pool exists per distinct set of
+connection parameters; it is pre-warmed with postgres.pool.min_size
+connections, keeps up to postgres.pool.max_size open, and makes callers
+wait when all of them are in use - for at most postgres.pool.timeout
+seconds, then PoolTimeout is raised. Pools are thread-safe and are closed
+at interpreter exit.
+"""
+import atexit
+import os
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+import yaml
+from psycopg2 import extensions
+
+from utilities.pg_metadata import MetadataCache
+
+DEFAULT_MIN_SIZE = 1
+DEFAULT_MAX_SIZE = 10
+DEFAULT_TIMEOUT = 60.0
+
+_config = None
+_config_lock = threading.Lock()
+
+_pools: dict[tuple, "ConnectionPool"] = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(TimeoutError):
+    """No pooled connection became free in time (the pool is too small for the work, or a caller leaks)."""
+
+
+def load_config(path: str | None = None) -> dict:
+    """Return the `postgres` section of config.yaml (or $DW_CONFIG), reading the file only once per process."""
+    global _config
+    if _config is None:
+        with _config_lock:
+            if _config is None:
+                path = path or os.environ.get("DW_CONFIG") or "config.yaml"
+                with open(path, "r", encoding="utf-8") as f:
+                    _config = (yaml.safe_load(f) or {}).get("postgres", {}) or {}
+    return _config
+
+
+class ConnectionPool:
+    def __init__(self, min_size: int, max_size: int, metadata_ttl: float | None = None,
+                 timeout: float | None = DEFAULT_TIMEOUT, **conn_kwargs):
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        # table metadata is per database, so it is shared by everything using this pool
+        self.metadata = MetadataCache(ttl=metadata_ttl)
+        self._conn_kwargs = conn_kwargs
+        self._cond = threading.Condition()
+        self._open = 0
+        self._closed = False
+
+        # pre-warm; idle connections are reused LIFO so the warmest one goes out first
+        self._idle = [self._connect() for _ in range(min(min_size, self.max_size))]
+        self._open = len(self._idle)
+
+    def _connect(self):
+        conn = psycopg2.connect(**self._conn_kwargs)
+        conn.autocommit = True
+        return conn
+
+    def getconn(self):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._idle or self._open < self.max_size, timeout=self.timeout):
+                raise PoolTimeout(
+                    f"No connection free after {self.timeout}s ({self.max_size} in use); "
+                    f"raise postgres.pool.max_size or run fewer jobs at once"
+                )
+            if self._idle:
+                return self._idle.pop()
+            self._open += 1  # reserve the slot before connecting outside the lock
+
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn):
+        reusable = not conn.closed and not self._closed
+        if reusable:
+            try:
+                # hand the next caller a clean, autocommit connection
+                status = conn.info.transaction_status
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    reusable = False  # server connection lost
+                else:
+                    if status != extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                    conn.autocommit = True
+            except Exception:
+                reusable = False
+
+        if not reusable and not conn.closed:
+            conn.close()
+
+        with self._cond:
+            if reusable:
+                self._idle.append(conn)
+            else:
+                self._open -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, autocommit: bool = True):
+        """Borrow a connection for one operation."""
+        conn = self.getconn()
+        try:
+            conn.autocommit = autocommit
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn in idle:
+            conn.close()
+
+
+def get_pool(
+    host: str,
+    port: int,
+    database: str,
+    user: str,
+    password: str,
+    sslmode: str | None = None,
+    min_size: int | None = None,
+    max_size: int | None = None,
+    metadata_ttl: float | None = None,
+    timeout: float | None = None,
+) -> ConnectionPool:
+    """Return the shared pool for these connection parameters, creating it on first use."""
+    key = (host, int(port), database, user, password, sslmode)
+    pool = _pools.get(key)
+    if pool is not None:
+        return pool
+
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            conn_kwargs = dict(host=host, port=port, dbname=database, user=user, password=password)
+            if sslmode:
+                conn_kwargs["sslmode"] = sslmode
+            pool = ConnectionPool(
+                min_size if min_size is not None else DEFAULT_MIN_SIZE,
+                max_size or DEFAULT_MAX_SIZE,
+                metadata_ttl=metadata_ttl,
+                timeout=timeout or DEFAULT_TIMEOUT,
+                **conn_kwargs
+            )
+            _pools[key] = pool
+    return pool
+
+
+def close_all():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+atexit.register(close_all)
@@ -1,134 +1,675 @@
-import yaml
-import psycopg2
 from psycopg2 import sql
+import numpy as np
 import pandas as pd
-from typing import Any, List
+from typing import Iterable, List
 import io
+import itertools
+import threading
 import uuid
-from datetime import datetime, timezone
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+from psycopg2.extras import Json
+
+from utilities import pg_binary_copy
+from utilities.ingestion_log import get_log_buffer
+from utilities.metrics import NULL_METRICS, StageMetrics
+from utilities.partitioning import RangePartitions, load_range_partitions
+from utilities.pg_metadata import ROW_HASH_COLUMN, TableMetadata, coerce_frame, load_table_metadata, row_hash
+from utilities.pg_pool import get_pool, load_config
+
+def _freeze(obj):
+    """Hashable, order-preserving normalization of query_builder arguments."""
+    if isinstance(obj, dict):
+        return ("dict", tuple((k, _freeze(v)) for k, v in obj.items()))
+    if isinstance(obj, (list, tuple)):
+        return ("seq", tuple(_freeze(v) for v in obj))
+    if isinstance(obj, (set, frozenset)):
+        # equal sets may iterate in different orders
+        return ("set", tuple(sorted((_freeze(v) for v in obj), key=repr)))
+    # keep the type so e.g. limit=True and limit=1 don't collide
+    return (type(obj).__name__, obj)
+
+
+def _watermark_value(value, data_type: str | None = None):
+    """JSON-ready form of one watermark field (dates and timestamps as ISO strings, timestamps in UTC)."""
+    if isinstance(value, pd.Timestamp):
+        value = value.to_pydatetime()
+    if isinstance(value, datetime):
+        if data_type == "date":
+            return value.date().isoformat()
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+class _LRUCache:
+    """Small thread-safe LRU map."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
 
 class Postgres:
+    # rendered query_builder SQL, shared by all instances
+    _sql_cache = _LRUCache(maxsize=1024)
+
     def __init__(self, 
         host=None, 
         port=None, 
         database=None, 
         user=None, 
         password=None,
+        sslmode=None,
         database_builder=False
     ):    
         
-        # fill missing from config.yaml
-        if not all([host, port, database, user, password]):
-            with open("config.yaml", "r", encoding="utf-8") as f:
-                pg = (yaml.safe_load(f) or {}).get("postgres", {})
-            host     = host     or pg.get("host", "127.0.0.1")
-            port     = port     or pg.get("port", 5432)
-            user     = user     or pg.get("user", "postgres")
-            password = password or pg.get("password", "")
-            
-            if database_builder:
-                database = 'postgres'
-            else:
-                database = database or pg.get("database", "postgres")
-
-            self.conn = psycopg2.connect(
-                host=host, 
-                port=port, 
-                dbname=database, 
-                user=user, 
-                password=password
-            )
-            self.conn.autocommit = True  # convenient for simple reads/writes
+        # fill missing from config.yaml (parsed once per process)
+        pg = load_config() if not all([host, port, database, user, password]) else {}
+        host     = host     or pg.get("host") or "127.0.0.1"
+        port     = port     or pg.get("port") or 5432
+        user     = user     or pg.get("user") or "postgres"
+        password = password or pg.get("password") or ""
+        sslmode  = sslmode  or pg.get("sslmode")
+
+        if database_builder:
+            database = 'postgres'
+        else:
+            database = database or pg.get("database") or "postgres"
+
+        pool_cfg = pg.get("pool") or {}
+
+        # connections are borrowed per operation from a shared, pre-warmed pool
+        self.pool = get_pool(
+            host=host,
+            port=port,
+            database=database,
+            user=user,
+            password=password,
+            sslmode=sslmode,
+            min_size=pool_cfg.get("min_size"),
+            max_size=pool_cfg.get("max_size"),
+            timeout=pool_cfg.get("timeout"),
+            metadata_ttl=pg.get("metadata_ttl")
+        )
+
+        # stage timings per load, off unless configured (the IngestionLog columns must exist)
+        metrics_cfg = pg.get("metrics") or {}
+        self.metrics_enabled = bool(metrics_cfg.get("enabled"))
+        self.metrics_textfile = metrics_cfg.get("textfile")
+
+        # ingestion events are buffered per pool and written in batches
+        log_cfg = pg.get("logging") or {}
+        self.ingestion_log = get_log_buffer(
+            self.pool,
+            flush_every=log_cfg.get("flush_every"),
+            flush_interval=log_cfg.get("flush_interval"),
+            metrics=self.metrics_enabled,
+            max_pending=log_cfg.get("max_pending")
+        )
 
     def __enter__(self): return self
     def __exit__(self, *exc): self.close()
 
     def close(self):
-        if self.conn and not self.conn.closed:
-            self.conn.close()
+        # connections belong to the shared pool, which is closed at interpreter exit
+        pass
+
+    def new_metrics(self) -> StageMetrics:
+        """A fresh StageMetrics, or the no-op NULL_METRICS while metrics are disabled."""
+        return StageMetrics() if self.metrics_enabled else NULL_METRICS
+
+    def connection(self, autocommit: bool = True):
+        """Borrow a pooled connection: `with db.connection() as conn: ...`"""
+        return self.pool.connection(autocommit=autocommit)
 
     def query_df(self, sql_text: str, params=None) -> pd.DataFrame:
-        with self.conn.cursor() as cur:
+        with self.connection() as conn, conn.cursor() as cur:
             cur.execute(sql_text, params or ())
             rows = cur.fetchall()
             cols = [c.name for c in cur.description]
         return pd.DataFrame(rows, columns=cols)
 
+    def iter_query_df(self, sql_text: str, params=None, chunk_rows: int = 10_000):
+        """
+        Stream a query as DataFrames of at most chunk_rows rows using a named (server-side)
+        cursor, so client memory stays flat regardless of the result size.
+        """
+        # named cursors only live inside a transaction
+        with self.connection(autocommit=False) as conn:
+            yield from self._stream_cursor(conn, sql_text, params, chunk_rows)
+
+    @staticmethod
+    def _stream_cursor(conn, query, params, chunk_rows: int):
+        with conn.cursor(name=f"stream_{uuid.uuid4().hex[:12]}") as cur:
+            cur.itersize = chunk_rows
+            cur.execute(query, params or ())
+
+            first = True
+            while True:
+                rows = cur.fetchmany(chunk_rows)
+                # an empty result still yields one (empty) frame carrying the columns
+                if not rows and not first:
+                    break
+                first = False
+                yield pd.DataFrame(rows, columns=[c.name for c in cur.description])
+                if len(rows) < chunk_rows:
+                    break
+        conn.commit()
+
     def run_ddl(self, ddl_file: str):
         with open(ddl_file, "r", encoding="utf-8") as f:
             ddl_sql = f.read()
             
-        with self.conn.cursor() as cur:
+        with self.connection() as conn, conn.cursor() as cur:
             cur.execute(ddl_sql)
 
-    def _to_text(self, x: Any):
-        # Convert values to textual form; None stays None (becomes SQL NULL)
-        if pd.isna(x):
+        # DDL may have changed any table's shape
+        self.invalidate_metadata()
+
+    def table_metadata(self, schema: str, table: str) -> TableMetadata:
+        """Column names, types and nullability of schema.table, cached per pool."""
+        def load(schema, table):
+            with self.connection() as conn:
+                return load_table_metadata(conn, schema, table)
+
+        return self.pool.metadata.get(schema, table, load)
+
+    def invalidate_metadata(self, schema: str | None = None, table: str | None = None):
+        """Forget cached metadata for one table, one schema, or everything."""
+        self.pool.metadata.invalidate(schema, table)
+
+    # ---------- range partitions ----------
+
+    def range_partitions(self, schema: str, table: str) -> RangePartitions | None:
+        """Current partitions of a table registered with common.register_range_partitions, None for any other table."""
+        meta = self.table_metadata(schema, table)
+        if not meta.partitioned:
             return None
-        return str(x)
+        with self.connection() as conn:
+            return load_range_partitions(conn, schema, table, lambda c: meta.column(c).data_type)
+
+    def ensure_partitions(self, schema: str, table: str, low, high) -> int:
+        """
+        Create the missing partitions of schema.table from the one holding low to the one
+        holding high, plus its scheme's PREMAKE partitions after that (e.g. ahead of a load
+        or from a scheduled job). Returns the number created.
+        """
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute("CALL common.ensure_partitions(%s, %s, %s, %s, NULL);", (schema, table, str(low), str(high)))
+            return cur.fetchone()[0]
+
+    def detach_partitions(self, schema: str, table: str, before, archive_schema: str | None = None) -> int:
+        """
+        Detach the partitions of schema.table lying entirely before `before` (a date for
+        temporal keys, an id for integer keys). Their rows leave the table but are kept as
+        standalone tables, moved into archive_schema if given. Returns the number detached.
+        """
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "CALL common.detach_partitions(%s, %s, %s, %s, NULL);",
+                (schema, table, str(before), archive_schema)
+            )
+            return cur.fetchone()[0]
+
+    def _cover_partitions(self, conn, cur, partitions: RangePartitions, batch: pd.DataFrame) -> RangePartitions:
+        """Create the partitions batch needs but partitions lacks (committed on their own); returns the new layout."""
+        missing = partitions.missing(batch)
+        if missing is None:
+            return partitions
+        cur.execute(
+            "CALL common.ensure_partitions(%s, %s, %s, %s, NULL);",
+            (partitions.schema, partitions.table, *missing)
+        )
+        conn.commit()
+        return load_range_partitions(conn, partitions.schema, partitions.table, lambda c: partitions.data_type)
+
+    @staticmethod
+    def _to_copy_buffer(data: pd.DataFrame) -> io.StringIO:
+        """
+        Render a DataFrame as COPY ... (FORMAT csv) input in an in-memory buffer.
+        pandas' C csv writer formats whole blocks at a time, so no per-cell
+        Python conversion happens here; NULLs are written as \\N.
+        """
+        data = data.copy(deep=False)
+        for col in data.columns:
+            s = data[col]
+            # integer columns with NULLs arrive as float64 (1.0); keep them integral
+            if pd.api.types.is_float_dtype(s):
+                notna = s.dropna()
+                if not notna.empty and (notna % 1 == 0).all():
+                    data[col] = s.astype("Int64")
+            # raw bytes -> bytea hex input
+            elif s.dtype == object:
+                first = s.dropna().head(1)
+                if not first.empty and isinstance(first.iloc[0], (bytes, bytearray, memoryview)):
+                    data[col] = s.map(lambda b: "\\x" + bytes(b).hex(), na_action="ignore")
+
+        buf = io.StringIO()
+        data.to_csv(buf, index=False, header=False, na_rep="\\N")
+        buf.seek(0)
+        return buf
+
+    @staticmethod
+    def _buffer_size(buf) -> int:
+        """Size of a COPY input buffer (characters for text, bytes for binary)."""
+        size = buf.seek(0, io.SEEK_END)
+        buf.seek(0)
+        return size
+
+    @staticmethod
+    def _iter_batches(frames: Iterable[pd.DataFrame], col_types: list, batch_size: int, hash_column: str | None = None):
+        """
+        Slice a stream of DataFrames into batches of at most batch_size rows holding
+        the target columns, coerced to dtypes matching the table. With hash_column,
+        a row_hash of those columns is appended under that name.
+        """
+        columns = [c.column_name for c in col_types]
+        for frame in frames:
+            if frame is None or frame.empty:
+                continue
+            frame = coerce_frame(frame.reindex(columns=columns), col_types)
+            if hash_column:
+                frame[hash_column] = row_hash(frame)
+            for start in range(0, len(frame), batch_size):
+                yield frame.iloc[start:start + batch_size]
 
     def truncate_table(
         self,
         schema: str,
         table: str,
-        source: str = "unknown"
+        source: str = "unknown",
+        raise_errors: bool = False
     ):
+        """Empty schema.table and forget its watermarks. Errors are logged, and re-raised with raise_errors."""
         err_msg = ""
         success = True
+        error = None
         start_time = datetime.now(timezone.utc)
 
-        with self.conn.cursor() as cur:
-            try:
+        try:
+            # the table's watermarks go with its rows
+            with self.connection(autocommit=False) as conn, conn.cursor() as cur:
                 cur.execute(
-                    "TRUNCATE TABLE %s.%s;",
+                    sql.SQL("TRUNCATE TABLE {}.{};").format(sql.Identifier(schema), sql.Identifier(table))
+                )
+                cur.execute(
+                    'DELETE FROM common."Watermarks" WHERE "SCHEMA_NAME" = %s AND "TABLE_NAME" = %s;',
                     (schema, table)
                 )
+                conn.commit()
             
-            except Exception as e:
-                err_msg = e
-                success = False
-
-            finally:
-                self.log_ingestion(
-                    source=source,
-                    table=table,
-                    schema=schema,
-                    start_time=start_time,
-                    success=success,
-                    err_msg=err_msg,
-                    operation="Truncate"
-                )
-        
+        except Exception as e:
+            err_msg = str(e)
+            success = False
+            error = e
+
+        finally:
+            self.log_ingestion(
+                source=source,
+                table=table,
+                schema=schema,
+                start_time=start_time,
+                success=success,
+                err_msg=err_msg,
+                operation="Truncate"
+            )
+
+        if error is not None and raise_errors:
+            raise error
+
 
     def insert_data(
         self,
         schema: str,
         table: str,
-        data: pd.DataFrame,
+        data: pd.DataFrame | Iterable[pd.DataFrame],
         source: str = "unknown",
         batch_size: int = 10_000,
-        operation: str = "insert"
-    ):
+        operation: str = "insert",
+        copy_format: str = "text",
+        watermark_fields: list[str] | None = None,
+        metrics: StageMetrics | None = None,
+        raise_errors: bool = False
+    ) -> int:
         """
         Insert data from a DataFrame into the specified table in batches using COPY into a temp table
-        and then CALL common.insert_from_temp(...) to move data into the real table and log the import.
+        and then CALL common.insert_from_temp(...) to move data into the real table.
+        Each batch is committed on its own; the whole call is logged once.
+
+        data may also be an iterable of DataFrames (e.g. OData.iter_query pages); they are
+        consumed lazily, one staging table and one log entry cover the whole stream.
+
+        copy_format="binary" encodes batches with utilities.pg_binary_copy instead of CSV text;
+        it falls back to text when a target column type is not supported by the binary encoder.
+
+        watermark_fields: advance the common."Watermarks" entry for these columns to each batch's
+        highest (lexicographic) value, in the same transaction as the batch.
+
+        metrics: a StageMetrics (e.g. an ETL job's) to add this load's stage timings and counts to.
+
+        Load errors (including ones raised while iterating data) are logged; with
+        raise_errors they are re-raised afterwards, so callers can tell a failed load
+        from an empty one.
+
+        Returns the number of rows inserted.
         """
-        if data is None or data.empty:
-            return
+        def move(cur, temp_table, target, columns, keys):
+            cur.execute(
+                "CALL common.insert_from_temp(%s, %s, %s, %s, NULL);",
+                (temp_table, schema, target, columns)
+            )
+            return cur.fetchone()[0], 0
+
+        inserted, _, _ = self._staged_load(
+            schema, table, data, source, batch_size, operation, copy_format, move,
+            watermark_fields=watermark_fields, metrics=metrics, raise_errors=raise_errors
+        )
+        return inserted
+
+    def upsert_data(
+        self,
+        schema: str,
+        table: str,
+        data: pd.DataFrame | Iterable[pd.DataFrame],
+        source: str = "unknown",
+        batch_size: int = 10_000,
+        key_columns: list[str] | None = None,
+        operation: str = "upsert",
+        copy_format: str = "text",
+        metrics: StageMetrics | None = None,
+        raise_errors: bool = False
+    ) -> tuple[int, int]:
+        """
+        Insert new rows and update changed ones, matched on a natural key, using COPY into a
+        temp table and then CALL common.upsert_from_temp(...) (one INSERT ... ON CONFLICT per batch).
+        Rows whose values did not change are not rewritten.
+
+        key_columns defaults to the first unique index of the table whose columns are all present
+        in the data; the key must be backed by a unique index either way. If a key repeats within
+        a batch the last row wins.
+
+        Returns (inserted, updated).
+        """
+        inserted, updated, _ = self._staged_load(
+            schema, table, data, source, batch_size, operation, copy_format, self._upsert_batch(schema),
+            keyed=True, key_columns=key_columns, metrics=metrics, raise_errors=raise_errors
+        )
+        return inserted, updated
+
+    @staticmethod
+    def _upsert_batch(schema: str):
+        """_staged_load step merging a staged batch with common.upsert_from_temp."""
+        def move(cur, temp_table, target, columns, keys):
+            cur.execute(
+                "CALL common.upsert_from_temp(%s, %s, %s, %s, %s, NULL, NULL);",
+                (temp_table, schema, target, columns, keys)
+            )
+            return cur.fetchone()
+        return move
+
+    def update_data(
+        self,
+        schema: str,
+        table: str,
+        data: pd.DataFrame | Iterable[pd.DataFrame],
+        source: str = "unknown",
+        batch_size: int = 10_000,
+        key_columns: list[str] | None = None,
+        operation: str = "update",
+        copy_format: str = "text",
+        metrics: StageMetrics | None = None,
+        raise_errors: bool = False
+    ) -> int:
+        """
+        Update existing rows from a DataFrame, matched on a natural key, using COPY into a temp
+        table and then CALL common.update_from_temp(...) (one UPDATE ... FROM per batch).
+        Rows that are not in the table are ignored and unchanged rows are not rewritten.
+
+        key_columns defaults to the first unique index of the table whose columns are all present
+        in the data. If a key repeats within a batch the last row wins.
+
+        Returns the number of rows updated (also logged as UpdateCount).
+        """
+        def move(cur, temp_table, target, columns, keys):
+            cur.execute(
+                "CALL common.update_from_temp(%s, %s, %s, %s, %s, NULL);",
+                (temp_table, schema, target, columns, keys)
+            )
+            return 0, cur.fetchone()[0]
+
+        _, updated, _ = self._staged_load(
+            schema, table, data, source, batch_size, operation, copy_format, move,
+            keyed=True, key_columns=key_columns, metrics=metrics, raise_errors=raise_errors
+        )
+        return updated
+
+    def sync_data(
+        self,
+        schema: str,
+        table: str,
+        data: pd.DataFrame | Iterable[pd.DataFrame],
+        source: str = "unknown",
+        batch_size: int = 10_000,
+        key_columns: list[str] | None = None,
+        delete_missing: bool = True,
+        operation: str = "sync",
+        copy_format: str = "text",
+        metrics: StageMetrics | None = None,
+        raise_errors: bool = False
+    ) -> tuple[int, int, int]:
+        """
+        Make a table with a ROW_HASH column match data while writing only what changed.
+        The table's (key, ROW_HASH) pairs are read once; incoming rows whose hash is unchanged
+        are dropped before staging and the rest are upserted. With delete_missing, rows whose
+        key did not appear in data are deleted afterwards (not when the load failed or data
+        was empty).
+
+        Returns (inserted, updated, deleted).
+        """
+        meta = self.table_metadata(schema, table)
+        if ROW_HASH_COLUMN not in meta.column_names:
+            raise ValueError(f"{schema}.{table} has no {ROW_HASH_COLUMN} column to compare against")
+
+        current = {}
+
+        def skip_unchanged(cur, batch, keys):
+            if not current:
+                # first batch: the key is known now, fetch what the table holds
+                # (on the load's own connection; borrowing a second one can exhaust the pool)
+                cur.execute(
+                    sql.SQL("SELECT {}, {} FROM {}.{}").format(
+                        sql.SQL(", ").join(sql.Identifier(k) for k in keys),
+                        sql.Identifier(ROW_HASH_COLUMN), sql.Identifier(schema), sql.Identifier(table)
+                    )
+                )
+                dw = pd.DataFrame(cur.fetchall(), columns=[c.name for c in cur.description])
+                hashes = pd.to_numeric(dw.pop(ROW_HASH_COLUMN)).astype("Int64")
+                current.update(
+                    keys=dw,
+                    index=pd.MultiIndex.from_frame(dw),
+                    hashes=hashes.to_numpy(dtype=np.int64, na_value=0),
+                    hashed=hashes.notna().to_numpy(),
+                    seen=np.zeros(len(dw), dtype=bool)
+                )
+
+            pos = current["index"].get_indexer(pd.MultiIndex.from_frame(batch[keys]))
+            known = pos >= 0
+            at = pos[known]
+            current["seen"][at] = True
 
-        # query table columns to validate against DataFrame
-        table_cols = self.query_builder(
-            schema="information_schema",
-            table="columns",
-            columns=["column_name"],
-            where="table_schema = %s AND table_name = %s",
-            params=(schema, table)
+            unchanged = np.zeros(len(batch), dtype=bool)
+            unchanged[known] = current["hashed"][at] & (
+                current["hashes"][at] == batch[ROW_HASH_COLUMN].to_numpy(dtype=np.int64)[known]
+            )
+            return batch[~unchanged]
+
+        inserted, updated, success = self._staged_load(
+            schema, table, data, source, batch_size, operation, copy_format, self._upsert_batch(schema),
+            keyed=True, key_columns=key_columns, prepare=skip_unchanged, metrics=metrics,
+            raise_errors=raise_errors
         )
+
+        deleted = 0
+        if delete_missing and success and current:
+            gone = current["keys"][~current["seen"]]
+            if not gone.empty:
+                deleted = self._delete_keys(schema, table, gone, source, metrics=metrics, raise_errors=raise_errors)
+        return inserted, updated, deleted
+
+    def _delete_keys(self, schema: str, table: str, keys: pd.DataFrame, source: str = "unknown",
+                     metrics: StageMetrics | None = None, raise_errors: bool = False) -> int:
+        """Delete the rows of schema.table whose key values (the columns of `keys`) are listed in `keys`."""
+        key_names = [str(c) for c in keys.columns]
+        temp_table = f"tmp_{table.lower()}_{uuid.uuid4().hex[:12]}"
+        key_sql = sql.SQL(", ").join(sql.Identifier(k) for k in key_names)
+
+        start_time = datetime.now(timezone.utc)
+        success = True
+        err_msg = ""
+        deleted = 0
+        error = None
+        stats = self.new_metrics()
+
+        try:
+            with self.connection(autocommit=False) as conn, conn.cursor() as cur:
+                try:
+                    cur.execute(
+                        sql.SQL("CREATE TEMP TABLE {} ON COMMIT DROP AS SELECT {} FROM {}.{} WITH NO DATA;").format(
+                            sql.Identifier(temp_table), key_sql, sql.Identifier(schema), sql.Identifier(table)
+                        )
+                    )
+                    with stats.stage("transform"):
+                        buf = self._to_copy_buffer(keys)
+                    with stats.stage("load"):
+                        cur.copy_expert(
+                            sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '\\N')").format(
+                                sql.Identifier(temp_table), key_sql
+                            ),
+                            buf
+                        )
+                        cur.execute(
+                            "CALL common.delete_from_temp(%s, %s, %s, %s, NULL);",
+                            (temp_table, schema, table, key_names)
+                        )
+                        deleted = cur.fetchone()[0]
+                    with stats.stage("commit"):
+                        conn.commit()
+                    if stats.enabled:
+                        stats.add_batch(self._buffer_size(buf))
+                        stats.add_rows(deleted=deleted)
+                except Exception as e:
+                    conn.rollback()
+                    raise e
+
+        except Exception as ex:
+            success = False
+            err_msg = str(ex)
+            error = ex
+
+        finally:
+            self.log_ingestion(
+                source=source,
+                schema=schema,
+                table=table,
+                start_time=start_time,
+                update_count=deleted,
+                success=success,
+                err_msg=err_msg,
+                operation="Delete",
+                metrics=stats.finish()
+            )
+            if metrics is not None:
+                metrics.merge(stats)
+
+        if error is not None and raise_errors:
+            raise error
+        return deleted
+
+    def _staged_load(
+        self,
+        schema: str,
+        table: str,
+        data: pd.DataFrame | Iterable[pd.DataFrame],
+        source: str,
+        batch_size: int,
+        operation: str,
+        copy_format: str,
+        move,
+        keyed: bool = False,
+        key_columns: list[str] | None = None,
+        prepare=None,
+        watermark_fields: list[str] | None = None,
+        metrics: StageMetrics | None = None,
+        raise_errors: bool = False
+    ) -> tuple[int, int, bool]:
+        """
+        Shared COPY-to-staging loop of insert_data, upsert_data and update_data.
+
+        Batches are COPY'd into a session temp table and applied to schema.table by
+        move(cur, temp_table, target, columns, keys) -> (inserted, updated), one transaction per batch.
+        For a registered range-partitioned table (see utilities.partitioning) the partitions
+        a batch needs are created first, and a batch lying in one partition is moved into
+        that partition (target); otherwise target is schema.table itself. Keyed loads of a
+        table whose scheme has key_columns first move rows whose partition value changed
+        (counted as updated), so that target's upsert finds them in place.
+        With keyed=True the natural key (key_columns, or one found in the table's unique
+        indexes) is resolved first and passed as keys; duplicate keys within a batch keep
+        the last row. prepare(cur, batch, keys) -> batch, if given, may filter each batch before
+        it is staged. Tables with a ROW_HASH column get it filled from the loaded columns.
+        With watermark_fields, common."Watermarks" is advanced inside each batch's transaction.
+        Load errors are logged rather than raised, unless raise_errors is set, in which
+        case they are re-raised once the failed load has been logged.
+
+        With metrics enabled, time spent waiting on `data` counts as extract, batching,
+        coercion, hashing, prepare and encoding as transform, COPY + move as load, and
+        the commits as commit; they are logged with the load and added to `metrics`.
+
+        Returns (inserted, updated, success).
+        """
+        if data is None:
+            return 0, 0, True
+        stats = self.new_metrics()
+        frames = iter(stats.timed([data] if isinstance(data, pd.DataFrame) else data, "extract"))
+
+        # the first non-empty frame decides the column set for the whole stream
+        data = next((f for f in frames if f is not None and not f.empty), None)
+        if data is None:
+            if metrics is not None:
+                metrics.merge(stats)
+            return 0, 0, True
+
+        # table columns (cached) to validate against DataFrame
+        meta = self.table_metadata(schema, table)
         
         dw_id_name = f"DW_{table.upper()}_ID"
 
-        table_col_set = set(table_cols["column_name"].tolist())
-        table_col_set -= {dw_id_name, "DATE_MODIFIED", "DATE_IN"}  # exclude DW surrogate key if present
+        table_col_set = set(meta.column_names)
+        table_col_set -= {dw_id_name, "DATE_MODIFIED", "DATE_IN", ROW_HASH_COLUMN}  # exclude DW-maintained columns if present
 
         df_col_set = set(map(str, data.columns))
 
@@ -143,43 +684,141 @@ class Postgres:
 
         columns: List[str] = [str(c) for c in data.columns]
 
-        # Save current autocommit state
-        old_autocommit = self.conn.autocommit
-        self.conn.autocommit = False  # We need transaction control
-        
+        keys = None
+        if keyed:
+            keys = list(key_columns or meta.natural_key(columns) or [])
+            if not keys or not set(keys) <= set(columns):
+                raise ValueError(
+                    f"No natural key for {schema}.{table}: pass key_columns present in the data, "
+                    f"backed by a unique index (found {list(meta.unique_keys)})"
+                )
+
+        if watermark_fields and not set(watermark_fields) <= set(columns):
+            raise ValueError(f"Watermark fields {watermark_fields} are not all loaded into {schema}.{table}")
+
+        col_types = [meta.column(c) for c in columns]
+
+        # the row hash is computed here, never taken from the source
+        hash_column = ROW_HASH_COLUMN if ROW_HASH_COLUMN in meta.column_names else None
+        business_types = col_types
+        if hash_column:
+            columns = columns + [hash_column]
+            col_types = col_types + [meta.column(hash_column)]
+
+        if copy_format == "binary" and not pg_binary_copy.supports(col_types):
+            print(f"Warning: {schema}.{table} has column types the binary encoder cannot handle; using text COPY.")
+            copy_format = "text"
+
+        # session-local staging table; rows vanish at each commit, the table at disconnect
+        temp_table = f"tmp_{table.lower()}_{uuid.uuid4().hex[:12]}"
+        col_sql = sql.SQL(", ").join(sql.Identifier(c) for c in columns)
+        if copy_format == "binary":
+            copy_sql = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT binary)").format(
+                sql.Identifier(temp_table), col_sql
+            )
+            encode = lambda batch: pg_binary_copy.encode_frame(batch, col_types)
+        else:
+            copy_sql = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '\\N')").format(
+                sql.Identifier(temp_table), col_sql
+            )
+            encode = self._to_copy_buffer
+
         start_time = datetime.now(timezone.utc)
         success = True
         err_msg = ""
-        n = len(data)
+        error = None
+        inserted = 0
+        updated = 0
+        frames = itertools.chain([data], frames)
 
         try:
-            with self.conn.cursor() as cur:
-                for start in range(0, n, batch_size):
-                    end = min(start + batch_size, n)
-                    batch = data.iloc[start:end]
-
-                    # Start a fresh transaction for each batch
-                    self.conn.rollback()  # Clean slate
-                
-                    try:
-                        
-                        
-                        # If we got here, commit the transaction
-                        self.conn.commit()
-                        
-                    except Exception as e:
-                        self.conn.rollback()
-                        raise e
+            # one pooled connection for the whole load (the temp table is session-local),
+            # with autocommit off because we need transaction control
+            with self.connection(autocommit=False) as conn, conn.cursor() as cur:
+                cur.execute(
+                    sql.SQL(
+                        "CREATE TEMP TABLE {} ON COMMIT DELETE ROWS AS SELECT {} FROM {}.{} WITH NO DATA;"
+                    ).format(sql.Identifier(temp_table), col_sql, sql.Identifier(schema), sql.Identifier(table))
+                )
+                partitions = None
+                if meta.partitioned:
+                    partitions = load_range_partitions(conn, schema, table, lambda c: meta.column(c).data_type)
+                rekeyed = bool(keys) and partitions is not None and partitions.moves_rekeyed(keys, columns)
+                conn.commit()
+
+                try:
+                    batches = stats.timed(
+                        self._iter_batches(frames, business_types, batch_size, hash_column), "transform"
+                    )
+                    for batch in batches:
+                        # Start a fresh transaction for each batch
+                        conn.rollback()  # Clean slate
+
+                        with stats.stage("transform"):
+                            if keys:
+                                # one row per key, or ON CONFLICT would hit the same row twice
+                                batch = batch.drop_duplicates(subset=keys, keep="last")
+                                if rekeyed:
+                                    batch = batch.drop_duplicates(subset=list(partitions.key_columns), keep="last")
+                            if prepare is not None:
+                                batch = prepare(cur, batch, keys)
+                        if batch.empty:
+                            continue
+
+                        try:
+                            if partitions is not None:
+                                with stats.stage("load"):
+                                    partitions = self._cover_partitions(conn, cur, partitions, batch)
+                            with stats.stage("transform"):
+                                target = (partitions.target(batch) if partitions is not None else None) or table
+                                buf = encode(batch)
+
+                            with stats.stage("load"):
+                                cur.copy_expert(copy_sql, buf)
+                                moved = 0
+                                if rekeyed:
+                                    # through the parent: the rows' old partitions may be any
+                                    cur.execute(
+                                        "CALL common.move_rekeyed_from_temp(%s, %s, %s, %s, NULL);",
+                                        (temp_table, schema, table, columns)
+                                    )
+                                    moved = cur.fetchone()[0]
+                                batch_inserted, batch_updated = move(cur, temp_table, target, columns, keys)
+                                batch_updated += moved
+
+                                if watermark_fields:
+                                    mark = self._batch_watermark(batch, watermark_fields, meta)
+                                    if mark is not None:
+                                        cur.execute(
+                                            "CALL common.advance_watermark(%s, %s, %s, %s);",
+                                            (schema, table, list(watermark_fields), Json(mark))
+                                        )
+
+                            # If we got here, commit the transaction
+                            with stats.stage("commit"):
+                                conn.commit()
+                            inserted += batch_inserted
+                            updated += batch_updated
+                            if stats.enabled:
+                                stats.add_batch(self._buffer_size(buf))
+                                stats.add_rows(batch_inserted, batch_updated)
+
+                        except Exception as e:
+                            conn.rollback()
+                            raise e
+
+                finally:
+                    # the connection goes back to the pool, so don't leave the temp table behind
+                    conn.rollback()
+                    cur.execute(sql.SQL("DROP TABLE IF EXISTS {};").format(sql.Identifier(temp_table)))
+                    conn.commit()
         
         except Exception as ex:
-            n = 0
             success = False
-            err_msg = ex    
+            err_msg = str(ex)
+            error = ex
 
         finally:
-            # Restore original autocommit state
-            self.conn.autocommit = old_autocommit
-
             self.log_ingestion(
                 source=source,
                 schema=schema,
@@ -187,82 +826,97 @@ class Postgres:
                 success=success,
                 err_msg=err_msg,
                 operation=operation,
-                insert_count=n,
-                start_time=start_time
+                insert_count=inserted,
+                update_count=updated,
+                start_time=start_time,
+                metrics=stats.finish()
             )
+            if metrics is not None:
+                metrics.merge(stats)
 
-        # Commit (if not autocommit)
-        self.conn.commit()
-
-    def update_data(
-        self,
-        schema: str,
-        table: str,
-        data: pd.DataFrame,
-        source: str = "unknown",
-        batch_size: int = 10000,
-        operation: int = "update"
-    ):
-        """Update data in the specified table from a DataFrame in batches using update_data stored procedure."""
-        if data.empty:
-            return
-
-        with self.conn.cursor() as cur:
-            for start in range(0, len(data), batch_size):
-                end = start + batch_size
-                batch = data.iloc[start:end]
-                records = batch.to_dict(orient="records")
-                cur.execute(
-                    sql.SQL("CALL common.update_data(%s, %s, %s, %s);"),
-                    (schema, table, source, records)
-                )
-
-    def upsert_data(
-        self,
-        schema: str,
-        table: str,
-        data: pd.DataFrame,
-        source: str = "unknown",
-        batch_size: int = 10000
-    ):
-        """Upsert data in the specified table from a DataFrame in batches using upsert_data stored procedure."""
-        if data.empty:
-            return
-
-        with self.conn.cursor() as cur:
-            for start in range(0, len(data), batch_size):
-                end = start + batch_size
-                batch = data.iloc[start:end]
-                
-                anyarray_records = self.anyarray_from_df(batch, schema, table)
-
-                cur.execute(
-                    sql.SQL("CALL common.upsert_data(%s, %s, %s, %s);"),
-                    (schema, table, source, anyarray_records)
-                )
+        if error is not None and raise_errors:
+            raise error
+        return inserted, updated, success
 
     def log_ingestion(
         self,
         source: str = "unknown",
         schema: str = "unknown",
         table: str = "unknown",
-        start_time: datetime = datetime.now(timezone.utc),
-        end_time: datetime = datetime.now(timezone.utc),
+        start_time: datetime | None = None,
+        end_time: datetime | None = None,
         insert_count: int = 0,
         update_count: int = 0,
         success: bool = True,
         err_msg: str = "",
-        operation: str = 0
+        operation: str = "UNKNOWN",
+        metrics: StageMetrics = NULL_METRICS
         ):
-        
-        with self.conn.cursor() as cur:
-            cur.execute("CALL common.log_ingestion(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s);",
-                (
-                    source, schema, table,
-                    start_time, end_time,
-                    insert_count, update_count, success, err_msg, operation
+        """
+        Queue one common."IngestionLog" row; missing start/end times are taken now.
+        Rows are written in batches (see flush_ingestion_log). metrics (a finished
+        StageMetrics) fills the stage columns when metrics are enabled.
+        """
+        self.ingestion_log.add(
+            source, schema, table,
+            start_time or datetime.now(timezone.utc),
+            end_time or datetime.now(timezone.utc),
+            insert_count, update_count, success, err_msg, operation, metrics
+        )
+
+    def flush_ingestion_log(self):
+        """Write any buffered ingestion log rows now."""
+        self.ingestion_log.flush()
+
+    @staticmethod
+    def _batch_watermark(batch: pd.DataFrame, fields: list[str], meta: TableMetadata) -> list | None:
+        """Lexicographically highest non-NULL value of fields in batch, as a JSON-ready list."""
+        top = batch[list(fields)].dropna()
+        for f in fields:
+            if top.empty:
+                return None
+            top = top[top[f] == top[f].max()]
+        row = top.iloc[0]
+        return [_watermark_value(row[f], meta.column(f).data_type) for f in fields]
+
+    def get_watermark(self, schema: str, table: str, fields: list[str]) -> list | None:
+        """Last loaded value of fields for schema.table from common."Watermarks" (one indexed lookup)."""
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                'SELECT "VALUE" FROM common."Watermarks" '
+                'WHERE "SCHEMA_NAME" = %s AND "TABLE_NAME" = %s AND "FIELDS" = %s;',
+                (schema, table, list(fields))
+            )
+            row = cur.fetchone()
+        return row[0] if row else None
+
+    def rebuild_watermark(self, schema: str, table: str, fields: list[str]) -> list | None:
+        """
+        Recompute the watermark for fields from the table's own rows (its top row ordered by
+        fields) and store it. Used when no watermark has been recorded yet.
+        """
+        meta = self.table_metadata(schema, table)
+        idents = [sql.Identifier(f) for f in fields]
+
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("SELECT {} FROM {}.{} WHERE {} ORDER BY {} LIMIT 1;").format(
+                    sql.SQL(", ").join(idents),
+                    sql.Identifier(schema), sql.Identifier(table),
+                    sql.SQL(" AND ").join(sql.SQL("{} IS NOT NULL").format(i) for i in idents),
+                    sql.SQL(", ").join(sql.SQL("{} DESC").format(i) for i in idents)
                 )
             )
+            row = cur.fetchone()
+            if row is None:
+                return None
+
+            mark = [_watermark_value(v, meta.column(f).data_type) for f, v in zip(fields, row)]
+            cur.execute(
+                "CALL common.advance_watermark(%s, %s, %s, %s, TRUE);",
+                (schema, table, list(fields), Json(mark))
+            )
+        return mark
 
     def get_max_value(self, schema: str, table: str, field: str):
         df = self.query_builder(
@@ -307,6 +961,71 @@ class Postgres:
         """
         if sql_text:
             return self.query_df(sql_text, params=params)
+
+        # one pooled connection for rendering and running the query
+        with self.connection() as conn:
+            query = self._render_select(
+                conn,
+                schema=schema, table=table, alias=alias, columns=columns, distinct=distinct,
+                joins=joins, where=where, group_by=group_by, having=having, aggregates=aggregates,
+                order_by=order_by, limit=limit, offset=offset, ctes=ctes
+            )
+            with conn.cursor() as cur:
+                cur.execute(query, params or ())
+                rows = cur.fetchall()
+                cols = [c.name for c in cur.description]
+        return pd.DataFrame(rows, columns=cols)
+
+    def iter_query_builder(self, sql_text: str | None = None, *, chunk_rows: int = 10_000, params=None, **builder_args):
+        """
+        Streaming counterpart of query_builder (same builder keywords): yields DataFrames of
+        at most chunk_rows rows read through a server-side cursor.
+        """
+        if sql_text:
+            yield from self.iter_query_df(sql_text, params=params, chunk_rows=chunk_rows)
+            return
+
+        # named cursors only live inside a transaction
+        with self.connection(autocommit=False) as conn:
+            query = self._render_select(conn, **builder_args)
+            yield from self._stream_cursor(conn, query, params, chunk_rows)
+
+    def _render_select(self, conn, **builder_args) -> str:
+        """
+        SQL text for a query_builder shape. Rendered strings are memoized on a hashable
+        normalization of the builder arguments (params stay out of the key), so repeated
+        shapes skip composing and quoting entirely. Arguments that can't be hashed
+        (unusual container types) are rendered without the cache.
+        """
+        key = _freeze(builder_args)
+        try:
+            hash(key)
+        except TypeError:
+            return self._build_select(**builder_args).as_string(conn)
+        query = self._sql_cache.get(key)
+        if query is None:
+            query = self._build_select(**builder_args).as_string(conn)
+            self._sql_cache.put(key, query)
+        return query
+
+    def _build_select(
+        self, *,
+        schema: str | None = None,
+        table: str | None = None,
+        alias: str | None = None,
+        columns="*",
+        distinct: bool = False,
+        joins: list[dict] | None = None,
+        where: str | None = None,
+        group_by: list[str] | None = None,
+        having: str | None = None,
+        aggregates=None,
+        order_by: list[str] | None = None,
+        limit: int | None = None,
+        offset: int | None = None,
+        ctes: dict[str, str] | None = None
+    ) -> sql.Composed:
+        """Compose the SELECT used by query_builder / iter_query_builder."""
         if not table:
             raise ValueError("table is required when using builder mode")
 
@@ -410,17 +1129,13 @@ class Postgres:
         select_cols = _column_list(columns)
         agg_cols = _aggregate_list(aggregates)
 
-        if agg_cols.as_string(self.conn) if hasattr(agg_cols, "as_string") else str(agg_cols):
-            select_list = (
-                select_cols if (columns not in (None, "*")) else sql.SQL("")
-            )
+        # decide emptiness from the inputs rather than by rendering the pieces
+        has_cols = columns not in (None, "*") and len(columns) > 0
+        if aggregates:
             # add comma if both present
-            if select_list.as_string(self.conn) if hasattr(select_list, "as_string") else str(select_list):
-                select_list = select_list + sql.SQL(", ") + agg_cols
-            else:
-                select_list = agg_cols
+            select_list = select_cols + sql.SQL(", ") + agg_cols if has_cols else agg_cols
         else:
-            select_list = select_cols
+            select_list = select_cols if (has_cols or columns == "*") else sql.SQL("*")
 
         # ---------- FROM / JOIN ----------
         from_core = _ident(schema, table)
@@ -474,14 +1189,8 @@ class Postgres:
         # ---------- final query ----------
         query = (
             with_sql +
-            select_head + (select_list if (select_list.as_string(self.conn) if hasattr(select_list, "as_string") else str(select_list)) else sql.SQL("*")) +
+            select_head + select_list +
             from_sql + join_sql + where_sql + group_sql + having_sql + order_sql + limit_sql + offset_sql
         )
 
-        with self.conn.cursor() as cur:
-            cur.execute(query, params or ())
-            rows = cur.fetchall()
-            cols = [c.name for c in cur.description]
-        return pd.DataFrame(rows, columns=cols)
-        
-
+        return query
@@ -0,0 +1,201 @@
+"""
+Opt-in per-job profiling for ETLRunner.
+
+Profiling is configured, in order of precedence, by the ETLRunner `profile`
+argument, $DW_PROFILE, or postgres.profiling.mode in config.yaml. The value
+is "cpu" (cProfile), "memory" (tracemalloc) or "cpu,memory". The run
+directory is $DW_PROFILE_DIR / postgres.profiling.dir (default "profiles"),
+with one run_<timestamp> folder per run_jobs holding, per job:
+
+    <schema>.<table>.pstats        cProfile data (python -m pstats, snakeviz, ...)
+    <schema>.<table>.txt           its top functions by cumulative time
+    <schema>.<table>.alloc.txt     top allocation sites of the job (tracemalloc)
+
+and hot_functions.txt for the whole run: the top functions by own time, plus
+the WATCHED functions (query translation, page decoding, loading).
+
+CPU profiling runs the jobs one at a time (Python 3.12+ allows a single active
+cProfile per process), and cProfile only sees the thread it is enabled on:
+pipelined extraction (prefetch threads) shows up as time waiting on the queue.
+tracemalloc is process-wide, so with max_workers > 1 a memory-only run's
+allocation reports include the neighbouring jobs'.
+"""
+import cProfile
+import io
+import linecache
+import os
+import pstats
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+from utilities.pg_pool import load_config
+
+MODES = ("cpu", "memory")
+DEFAULT_DIR = "profiles"
+DEFAULT_TOP = 30
+TRACEMALLOC_FRAMES = 10
+
+_PROFILER_FILES = {
+    os.path.abspath(__file__), cProfile.__file__, pstats.__file__, tracemalloc.__file__, linecache.__file__
+}
+
+# (file name, function name) of the hot paths called out in hot_functions.txt
+WATCHED = (
+    ("odata_filter.py", "translate_query"),
+    ("odata_stream.py", "__iter__"),
+    ("odata_stream.py", "append"),
+    ("odata_metadata.py", "build_frame"),
+    ("postgres_wrapper.py", "insert_data"),
+    ("postgres_wrapper.py", "_staged_load"),
+    ("postgres_wrapper.py", "_to_copy_buffer"),
+)
+
+
+def parse_modes(value) -> set[str]:
+    """Modes from 'cpu', 'memory', 'cpu,memory', 'all' or a list of those; empty or 'off' disables."""
+    if not value:
+        return set()
+    parts = value if isinstance(value, (list, tuple, set)) else str(value).replace("+", ",").split(",")
+    modes = set()
+    for part in (str(p).strip().lower() for p in parts):
+        if part in ("", "off", "none", "false", "0"):
+            continue
+        if part in ("all", "both", "true", "1"):
+            modes.update(MODES)
+        elif part in MODES:
+            modes.add(part)
+        else:
+            raise ValueError(f"Unknown profiling mode {part!r} (expected one of {MODES} or 'all')")
+    return modes
+
+
+def profiler_from_settings(profile=None, profile_dir: str | None = None) -> "JobProfiler | None":
+    """A JobProfiler for one run as configured (argument, environment, config.yaml), or None when off."""
+    try:
+        cfg = load_config().get("profiling") or {}
+    except OSError:
+        cfg = {}
+    modes = parse_modes(profile if profile is not None else os.environ.get("DW_PROFILE", cfg.get("mode")))
+    if not modes:
+        return None
+    root = profile_dir or os.environ.get("DW_PROFILE_DIR") or cfg.get("dir") or DEFAULT_DIR
+    return JobProfiler(root, cpu="cpu" in modes, memory="memory" in modes, top=cfg.get("top") or DEFAULT_TOP)
+
+
+class JobProfiler:
+    """Profiles the jobs of one ETL run into a fresh run_<timestamp> directory under root."""
+
+    def __init__(self, root: str, cpu: bool = True, memory: bool = False, top: int = DEFAULT_TOP):
+        self.cpu = cpu
+        self.memory = memory
+        self.top = top
+        self.run_dir = os.path.join(root, datetime.now().strftime("run_%Y%m%d_%H%M%S_%f"))
+        os.makedirs(self.run_dir, exist_ok=True)
+        self._stats_files: list[str] = []
+        self._lock = threading.Lock()
+
+        self._started_tracing = False
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._started_tracing = True
+
+    @contextmanager
+    def job(self, schema: str, table: str):
+        """Profile the block (one job, on the calling thread) as schema.table."""
+        name = f"{schema}.{table}"
+        # snapshot first, so the cpu profile doesn't include taking it
+        before = None
+        if self.memory:
+            tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+
+        prof = None
+        if self.cpu:
+            prof = cProfile.Profile()
+            try:
+                prof.enable()
+            except ValueError:
+                # Python 3.12+ allows one active profiler per process
+                print(f"Warning: {name} was not CPU-profiled, another profiler is active.")
+                prof = None
+
+        try:
+            yield
+        finally:
+            if prof is not None:
+                prof.disable()
+                self._write_cpu(name, prof)
+            if before is not None:
+                self._write_memory(name, before)
+
+    # ---------- per job ----------
+
+    def _path(self, name: str, suffix: str) -> str:
+        return os.path.join(self.run_dir, name + suffix)
+
+    def _write_cpu(self, name: str, prof: cProfile.Profile):
+        path = self._path(name, ".pstats")
+        prof.dump_stats(path)
+        with self._lock:
+            self._stats_files.append(path)
+
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+        with open(self._path(name, ".txt"), "w", encoding="utf-8") as f:
+            f.write(out.getvalue())
+
+    @staticmethod
+    def _own_allocation(stat) -> bool:
+        """Allocations of the profilers (this job's or a concurrent one's) and the import machinery."""
+        filename = stat.traceback[0].filename
+        return filename in _PROFILER_FILES or filename.startswith("<frozen importlib")
+
+    def _top(self, stats: list, n: int) -> list:
+        # filtered after grouping: filter_traces() walks every trace in Python
+        return [s for s in stats if not self._own_allocation(s)][:n]
+
+    def _write_memory(self, name: str, before: tracemalloc.Snapshot):
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+
+        lines = [f"{name}: traced peak {peak / 2**20:.1f} MiB", "",
+                 f"Top {self.top} allocation sites by growth over the job:"]
+        lines += [f"  {stat}" for stat in self._top(after.compare_to(before, "lineno"), self.top)]
+        n = min(self.top, 10)
+        lines += ["", f"Top {n} call paths by growth over the job:"]
+        for stat in self._top(after.compare_to(before, "traceback"), n):
+            lines.append(f"  {stat.size_diff / 1024:+.1f} KiB, {stat.count_diff:+d} blocks")
+            lines += [f"    {line}" for line in stat.traceback.format()]
+        with open(self._path(name, ".alloc.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    # ---------- per run ----------
+
+    def report(self) -> str | None:
+        """Write hot_functions.txt for the run and stop tracing if we started it; returns its path."""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        if not self._stats_files:
+            return None
+
+        out = io.StringIO()
+        stats = pstats.Stats(*self._stats_files, stream=out)
+        # the per-job files are listed above their own reports
+        stats.files = []
+        out.write(f"Hot functions over {len(self._stats_files)} job(s) by own time:\n")
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(self.top)
+
+        out.write("\nWatched functions (calls, own s, cumulative s):\n")
+        for (filename, _, funcname), (_, calls, tottime, cumtime, _) in sorted(
+            stats.stats.items(), key=lambda item: -item[1][3]
+        ):
+            if any(filename.endswith(f) and funcname == fn for f, fn in WATCHED):
+                out.write(f"  {os.path.basename(filename)}:{funcname:<24} {calls:>9} {tottime:>10.3f} {cumtime:>10.3f}\n")
+
+        path = os.path.join(self.run_dir, "hot_functions.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(out.getvalue())
+        return path